@@ -0,0 +1,224 @@
+"""
+Per-device streaming anomaly scores, next to the forest's label.
+
+The forest only sees a 3-sample rolling window, so it has no idea what
+is normal for one particular room or patient. AnomalyDetector keeps,
+for every device and for temp / hum / gas / heartrate:
+
+  ewma      exponentially weighted mean + variance (alpha), z-score of
+            each new reading against them
+  cusum     two-sided CUSUM on the standardised gas and heart-rate
+            residuals, for slow drifts a single z-score never catches
+  season    a second EWMA mean + variance per hour of day (season_alpha),
+            so "gas 600 at 19:00 while cooking" is compared with earlier
+            evenings, not with the night
+
+Each part is scaled so that 1.0 is its alarm level (z_alert standard
+deviations, cusum_h) and update() returns the largest one: the anomaly
+score of that reading. A score >= threshold raises the label to at least
+ALERT (raise_label). Readings more than z_alert standard deviations out
+are clipped to that distance before they update a baseline, so a spike
+is reported without dragging the baseline along. A part only scores once it has `warmup` readings
+(season: `season_warmup` in that hour); a missing heart rate (0) and
+non-finite values are skipped.
+
+State is two preallocated arrays, one row per device slot: float64
+(mean, var, count per metric + CUSUM sums, 16 values) and float32
+(mean, var, count per metric per hour, 24 x 12 values), about 1.3 KB per
+device. An update reads and writes one row of each, so time and memory
+per reading are constant. Slots come from device_state.SlotAllocator,
+as for DeviceStateStore (doubling growth, LRU at max_devices, idle ttl).
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from device_state import SlotAllocator
+
+METRICS = ("temp", "hum", "gas", "heartrate")
+CUSUM_METRICS = ("gas", "heartrate")
+# std floor per metric: a perfectly steady sensor would otherwise turn one
+# resolution step into a huge z-score
+MIN_STD = (0.3, 2.0, 15.0, 4.0)
+LEVELS = {"GOOD": 0, "ALERT": 1, "DANGER": 2}
+# score from which a reading is raised to ALERT; runners, ingest_daemon,
+# app.py and feature_backfill all default to it
+DEFAULT_THRESHOLD = 1.0
+
+M = len(METRICS)
+# float64 row layout
+MEAN, VAR, CNT = 0, M, 2 * M
+CPOS = 3 * M
+CNEG = CPOS + len(CUSUM_METRICS)
+WIDTH = CNEG + len(CUSUM_METRICS)
+_CUSUM_INDEX = {METRICS.index(name): i for i, name in enumerate(CUSUM_METRICS)}
+
+
+def raise_label(label, score, threshold=DEFAULT_THRESHOLD, level="ALERT"):
+    """label, or `level` if the score crosses threshold and label is lower (UNKNOWN counts as lowest)."""
+    if score is None or score < threshold:
+        return label
+    return level if LEVELS.get(label, -1) < LEVELS[level] else label
+
+
+def hour_of(ts):
+    """Hour of a "YYYY-MM-DD HH:MM:SS" timestamp (or datetime); local hour now if unparsable."""
+    if isinstance(ts, datetime):
+        return ts.hour
+    try:
+        return int(ts[11:13]) % 24
+    except (TypeError, ValueError):
+        return datetime.now().hour
+
+
+class AnomalyDetector:
+    def __init__(self, alpha=0.05, season_alpha=0.1, z_alert=4.0, cusum_k=0.5, cusum_h=8.0,
+                 warmup=20, season_warmup=5, threshold=DEFAULT_THRESHOLD, min_std=MIN_STD,
+                 capacity=64, max_devices=None, ttl=None, sweep_every=1024):
+        self.alpha = float(alpha)
+        self.season_alpha = float(season_alpha)
+        self.z_alert = float(z_alert)
+        self.cusum_k = float(cusum_k)
+        self.cusum_h = float(cusum_h)
+        self.warmup = int(warmup)
+        self.season_warmup = int(season_warmup)
+        self.threshold = float(threshold)
+        self.min_std = tuple(float(s) for s in min_std)
+        self.max_devices = max_devices
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.anomalies = 0
+        self.by_source = {}   # "ewma:gas" / "cusum:heartrate" / "season:temp" -> anomalies
+        self.table = np.zeros((0, WIDTH), dtype=np.float64)
+        self.season = np.zeros((0, 24, 3 * M), dtype=np.float32)
+        self._slots = SlotAllocator(self._grow, self._clear, capacity, max_devices, ttl, sweep_every)
+
+    def _grow(self, old, n):
+        table = np.zeros((n, WIDTH), dtype=np.float64)
+        season = np.zeros((n, 24, 3 * M), dtype=np.float32)
+        table[:old] = self.table
+        season[:old] = self.season
+        self.table, self.season = table, season
+
+    def _clear(self, slot):
+        self.table[slot] = 0.0
+        self.season[slot] = 0.0
+
+    @property
+    def capacity(self):
+        return self._slots.capacity
+
+    @property
+    def evicted(self):
+        return self._slots.evicted
+
+    # ---------------- UPDATE ----------------
+    def update(self, device, ts, temp, hum, gas, heartrate=None):
+        """Fold one reading into the device's baselines; returns its anomaly score (0.0 while warming up)."""
+        values = (temp, hum, gas, heartrate if heartrate else None)
+        hour = hour_of(ts)
+        alpha, s_alpha, z_alert = self.alpha, self.season_alpha, self.z_alert
+        score, source, metric = 0.0, None, None
+        with self._lock:
+            slot = self._slots.slot(device, time.monotonic())
+            row = self.table[slot].tolist()
+            srow = self.season[slot, hour].tolist()
+            for i, x in enumerate(values):
+                if x is None:
+                    continue
+                x = float(x)
+                if not math.isfinite(x):
+                    continue
+                floor = self.min_std[i]
+
+                # ---- EWMA + CUSUM against the device's running baseline ----
+                n, mean, var = row[CNT + i], row[MEAN + i], row[VAR + i]
+                diff = x - mean
+                if n >= self.warmup:
+                    sd = max(math.sqrt(var), floor)
+                    z = diff / sd
+                    # winsorised update: one spike must not inflate the
+                    # variance so much that the rest of the burst passes
+                    diff = max(-z_alert * sd, min(z_alert * sd, diff))
+                    s = abs(z) / z_alert
+                    if s > score:
+                        score, source, metric = s, "ewma", i
+                    c = _CUSUM_INDEX.get(i)
+                    if c is not None:
+                        pos = max(0.0, row[CPOS + c] + z - self.cusum_k)
+                        neg = max(0.0, row[CNEG + c] - z - self.cusum_k)
+                        s = max(pos, neg) / self.cusum_h
+                        if s >= 1.0:
+                            pos = neg = 0.0   # alarm raised, start the next run from zero
+                        row[CPOS + c], row[CNEG + c] = pos, neg
+                        if s > score:
+                            score, source, metric = s, "cusum", i
+                # 1/n while warming up: the first readings give a plain average
+                a = max(alpha, 1.0 / (n + 1))
+                mean += a * diff
+                var = (1.0 - a) * (var + a * diff * diff)
+                row[MEAN + i], row[VAR + i], row[CNT + i] = mean, var, n + 1
+
+                # ---- seasonal baseline for this hour of day ----
+                n, mean, var = srow[CNT + i], srow[MEAN + i], srow[VAR + i]
+                diff = x - mean
+                if n >= self.season_warmup:
+                    sd = max(math.sqrt(var), floor)
+                    s = abs(diff) / sd / z_alert
+                    if s > score:
+                        score, source, metric = s, "season", i
+                    diff = max(-z_alert * sd, min(z_alert * sd, diff))
+                a = max(s_alpha, 1.0 / (n + 1))
+                srow[MEAN + i] = mean + a * diff
+                srow[VAR + i] = (1.0 - a) * (var + a * diff * diff)
+                srow[CNT + i] = min(n + 1, 65535.0)
+
+            self.table[slot] = row
+            self.season[slot, hour] = srow
+            self.samples += 1
+            if score >= self.threshold:
+                self.anomalies += 1
+                key = f"{source}:{METRICS[metric]}"
+                self.by_source[key] = self.by_source.get(key, 0) + 1
+        return score
+
+    def score_label(self, device, ts, temp, hum, gas, heartrate, label):
+        """update() + raise_label(): returns (label, score)."""
+        score = self.update(device, ts, temp, hum, gas, heartrate)
+        return raise_label(label, score, self.threshold), score
+
+    # ---------------- INTROSPECTION ----------------
+    def forget(self, device):
+        with self._lock:
+            self._slots.release(device)
+
+    def baseline(self, device):
+        """Current EWMA mean / std per metric of a device (None if unknown)."""
+        with self._lock:
+            slot = self._slots.get(device)
+            if slot is None:
+                return None
+            row = self.table[slot]
+            return {name: {"mean": float(row[MEAN + i]), "std": math.sqrt(row[VAR + i]), "n": int(row[CNT + i])}
+                    for i, name in enumerate(METRICS)}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+    def memory_bytes(self):
+        return sum(a.nbytes for a in (self.table, self.season, self._slots.seen))
+
+    def stats(self):
+        with self._lock:
+            n = len(self._slots)
+            mem = self.memory_bytes()
+            return {"devices": n, "capacity": self.capacity, "evicted": self.evicted,
+                    "samples": self.samples, "anomalies": self.anomalies,
+                    "anomaly_ratio": self.anomalies / self.samples if self.samples else 0.0,
+                    "by_source": dict(self.by_source), "memory_bytes": mem,
+                    "bytes_per_device": mem / n if n else 0.0}
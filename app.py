@@ -1,11 +1,10 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import time
 import os
-from assistant import GeminiHealthChatbot
+import uuid
+# plotly dan assistant (Gemini SDK) di-import saat pertama dipakai
 
 # ============= PAGE CONFIG =============
 st.set_page_config(
@@ -26,23 +25,66 @@ BROKER = st.secrets.get("MQTT_BROKER", "broker.emqx.io")
 PORT = int(st.secrets.get("MQTT_PORT", 1883))
 MODEL_PATH = "models/smarthealth_retrained.pkl"
 CSV_PATH = "data.csv"
+# "csv" (data.csv) atau "parquet" (partisi per device/hari, butuh pyarrow)
+STORE_BACKEND = st.secrets.get("STORE_BACKEND", "csv")
+STORE_PATH = st.secrets.get("STORE_PATH", CSV_PATH if STORE_BACKEND == "csv" else "data_store")
+# 0 = seluruh riwayat
+HISTORY_HOURS = float(st.secrets.get("HISTORY_HOURS", 0))
+# indeks waktu di samping data.csv (csv_index.py), hanya untuk backend csv
+CSV_INDEX = STORE_BACKEND == "csv" and bool(st.secrets.get("CSV_INDEX", False))
 
 from mqtt_client import MQTTRunner
-if "mqtt_runner" not in st.session_state:
+from storage import open_store
+from dashboard_data import TailCache, aggregates_from_frame
+from downsample import downsample_frame
+from medicine_schedule import ScheduleStore
+from anomaly import DEFAULT_THRESHOLD
+
+# satu store per proses, dipakai bersama oleh pembaca dashboard dan runner
+# lokal: dengan CSV_INDEX pembaca memakai indeks yang diisi writer sendiri
+# (satu CsvIndex, tidak dibangun ulang tiap rerun)
+@st.cache_resource
+def get_store(backend, path, csv_index):
+    return open_store(backend, path, **({"index": True} if csv_index else {}))
+
+store = get_store(STORE_BACKEND, STORE_PATH, CSV_INDEX)
+
+# Satu sumber ingest per proses, bukan per sesi browser. Kalau
+# INGEST_SOCKET diisi, dashboard hanya membaca dari ingest_daemon.py
+# (koneksi broker, model dan penulisan data ada di sana, sekali saja).
+INGEST_SOCKET = st.secrets.get("INGEST_SOCKET", "")
+# nama shared memory dari ingest_daemon.py --shm-name (opsional)
+INGEST_SHM = st.secrets.get("INGEST_SHM", "")
+# port endpoint Prometheus /metrics untuk runner lokal (kosong = mati)
+METRICS_PORT = st.secrets.get("METRICS_PORT", "")
+# cache hasil forest untuk pembacaan sensor yang berulang (jumlah entri, 0 = mati)
+PREDICTION_CACHE = int(st.secrets.get("PREDICTION_CACHE", 0))
+# tabel aturan keselamatan (JSON, lihat rules.py); kosong = aturan bawaan
+RULES_PATH = st.secrets.get("RULES_PATH", "")
+# skor anomali per perangkat (anomaly.py); 0 = mati
+ANOMALY_THRESHOLD = float(st.secrets.get("ANOMALY_THRESHOLD", DEFAULT_THRESHOLD))
+
+@st.cache_resource
+def get_ingest(socket_path, shm_name):
+    if socket_path:
+        from ipc import IngestClient
+        return IngestClient(socket_path, shm_name=shm_name or None)
     runner = MQTTRunner(
         broker=BROKER,
         port=PORT,
         model_path=MODEL_PATH,
-        csv_path=CSV_PATH
+        csv_path=CSV_PATH,
+        store=get_store(STORE_BACKEND, STORE_PATH, CSV_INDEX),
+        metrics_port=int(METRICS_PORT) if METRICS_PORT else None,
+        prediction_cache={"capacity": PREDICTION_CACHE} if PREDICTION_CACHE > 0 else None,
+        rules_path=RULES_PATH or None,
+        anomaly={"threshold": ANOMALY_THRESHOLD} if ANOMALY_THRESHOLD > 0 else False
     )
     runner.start()
-    st.session_state.mqtt_runner = runner
-
+    return runner
 
 if "mqtt_runner" not in st.session_state:
-    from mqtt_client import MQTTRunner
-    st.session_state.mqtt_runner = MQTTRunner()
-    st.session_state.mqtt_runner.start()
+    st.session_state.mqtt_runner = get_ingest(INGEST_SOCKET, INGEST_SHM)
 
 if not os.path.exists(MODEL_PATH):
     st.warning(f"Model tidak ditemukan di {MODEL_PATH}. Menjalankan mode terbatas (prediksi AI dinonaktifkan).")
@@ -50,81 +92,142 @@ if not os.path.exists(MODEL_PATH):
 else:
     MODEL_AVAILABLE = True
 
-df = pd.read_csv("data.csv")
+# jadwal obat disimpan sebagai aturan (mulai, selesai, jam) di file JSON,
+# satu untuk semua sesi; dosis dihitung dari aturan saat dibutuhkan
+MEDICINE_STORE = st.secrets.get("MEDICINE_STORE", "medicine_schedules.json")
 
-if not os.path.exists(CSV_PATH):
-    pd.DataFrame(columns=["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]).to_csv(CSV_PATH, index=False)
+@st.cache_resource
+def get_schedule_store(path):
+    return ScheduleStore(path)
 
-if "medicine_schedules" not in st.session_state:
-    st.session_state.medicine_schedules = []
+schedule_store = get_schedule_store(MEDICINE_STORE)
 
 # ============= LOAD DATA =============
-expected_cols = ["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]
-
-def _safe_read_csv(path):
-    try:
-        df = pd.read_csv(path)
-        if not set(expected_cols).issubset(df.columns):
-            df2 = pd.read_csv(path, header=None)
-            if df2.shape[1] >= len(expected_cols):
-                df2 = df2.iloc[:, :len(expected_cols)]
-                df2.columns = expected_cols
-                return df2
-            return pd.DataFrame(columns=expected_cols)
-        return df
-    except Exception as e:
-        print("Warning reading CSV:", e)
-        return pd.DataFrame(columns=expected_cols)
-
-df = _safe_read_csv(CSV_PATH)
-for col in ("temp", "hum", "gas", "heartrate"):
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+# Untuk data.csv: TailCache (satu per proses) hanya mem-parse byte baru
+# sejak refresh terakhir, menyimpan TAIL_ROWS baris terakhir + agregat
+# berjalan. Backend lain: store.read() dengan filter waktu.
+TAIL_ROWS = int(st.secrets.get("TAIL_ROWS", 2000))
+# jumlah titik maksimum per grafik tren (hasil downsampling)
+CHART_POINTS = int(st.secrets.get("CHART_POINTS", 1000))
+# interval minimum antar redraw panel live (detik) saat AUTO REFRESH aktif
+LIVE_REDRAW_S = float(st.secrets.get("LIVE_REDRAW_S", 1.0))
+STORE_POLL_S = float(st.secrets.get("STORE_POLL_S", 10.0))
+CHART_RANGES = {"live": None, "1h": 1, "6h": 6, "1d": 24, "7d": 24 * 7, "all": 0}
+
+@st.cache_resource
+def get_tail_cache(path, capacity):
+    return TailCache(path, capacity=capacity)
+
+if STORE_BACKEND == "csv" and HISTORY_HOURS <= 0:
+    tail_cache = get_tail_cache(STORE_PATH, TAIL_ROWS)
+else:
+    tail_cache = None
+
+def live_data_key():
+    """Berubah hanya kalau runner memproses pesan baru atau data.csv bertambah."""
+    runner = st.session_state.mqtt_runner
+    if tail_cache is not None:
+        tail_cache.refresh()
+        return (runner.get_version(), tail_cache.offset)
+    # backend lain tidak punya offset murah: baca ulang paling cepat tiap STORE_POLL_S
+    return (runner.get_version(), int(time.time() // STORE_POLL_S))
+
+def load_live_data():
+    """
+    (df, gauge_stats, last_record). Hanya dihitung ulang kalau runner
+    memproses pesan baru atau data.csv bertambah; selain itu diambil dari
+    session_state, jadi rerun tanpa data baru hampir gratis.
+    """
+    runner = st.session_state.mqtt_runner
+    key = live_data_key()
+    cached = st.session_state.get("live_data")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    if tail_cache is not None:
+        df = tail_cache.frame()
+        gauge_stats = tail_cache.aggregates()
     else:
-        df[col] = 0
-
-if "ts" in df.columns:
-    try:
-        df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
-    except:
-        df["ts"] = df["ts"].astype(str)
-
-last_record = st.session_state.mqtt_runner.get_latest_record() if "mqtt_runner" in st.session_state else {}
-
-if not last_record and not df.empty:
-    last_row = df.iloc[-1].to_dict()
-    last_record = {
-        "ts": last_row.get("ts", ""),
-        "device": last_row.get("device", ""),
-        "temp": float(last_row.get("temp") or 0),
-        "hum": float(last_row.get("hum") or 0),
-        "gas": float(last_row.get("gas") or 0),
-        "heartrate": float(last_row.get("heartrate") or 0) if last_row.get("heartrate") else 0,
-        "ai": last_row.get("ai", "N/A")
-    }
-
-temp = float(last_record.get("temp", 0) or 0)
-hum = float(last_record.get("hum", 0) or 0)
-gas = float(last_record.get("gas", 0) or 0)
-hr_raw = last_record.get("heartrate")
-# hanya pakai heartrate jika >1, selain itu set 0
-heartrate = float(hr_raw) if hr_raw and float(hr_raw) > 1 else 0
-ai_status = last_record.get("ai", "N/A")
-
-# ============= HEADER =============
-st.markdown("<h1 class='dashboard-title'>🌡️ Smart Health Ecosystem</h1>", unsafe_allow_html=True)
-st.markdown("<p class='dashboard-subtitle'>Real-time Health Monitoring dengan AI & IoT</p>", unsafe_allow_html=True)
-
-# ============= TABS =============
-tab_monitoring, tab_medicine = st.tabs(["Monitoring", "Medicine Scheduler"])
+        # store.read() sudah mengembalikan kolom bertipe (ts datetime, sensor float32)
+        since = datetime.utcnow() - timedelta(hours=HISTORY_HOURS) if HISTORY_HOURS > 0 else None
+        df = store.read(since=since)
+        gauge_stats = aggregates_from_frame(df)
+
+    last_record = runner.get_latest_record() or {}
+
+    if not last_record and not df.empty:
+        last_row = df.iloc[-1].to_dict()
+        last_record = {
+            "ts": last_row.get("ts", ""),
+            "device": last_row.get("device", ""),
+            "temp": float(last_row.get("temp") or 0),
+            "hum": float(last_row.get("hum") or 0),
+            "gas": float(last_row.get("gas") or 0),
+            "heartrate": float(last_row.get("heartrate") or 0) if last_row.get("heartrate") else 0,
+            "ai": last_row.get("ai", "N/A")
+        }
+
+    data = (df, gauge_stats, last_record)
+    st.session_state.live_data = (key, data)
+    return data
+
+def build_trend_figure(recent):
+    import plotly.graph_objects as go
+    fig_trend = go.Figure()
+    fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['temp'], name='Temperature', line=dict(color='#ff6b6b', width=3), mode='lines', fill='tonexty', fillcolor='rgba(255, 107, 107, 0.1)', yaxis='y1'))
+    fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['hum'], name='Humidity', line=dict(color='#1db8a0', width=3), mode='lines', fill='tonexty', fillcolor='rgba(29, 184, 160, 0.1)', yaxis='y2'))
+    fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['gas']/10, name='Gas (÷10)', line=dict(color='#2dd9ce', width=3), mode='lines', fill='tonexty', fillcolor='rgba(45, 217, 206, 0.1)', yaxis='y3'))
+    if 'heartrate' in recent.columns:
+        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['heartrate'], name='Heart Rate', line=dict(color='#f44336', width=3), mode='lines+markers', yaxis='y4'))
+    fig_trend.update_layout(
+        hovermode='x unified', 
+        plot_bgcolor='rgba(15, 31, 30, 0.5)', 
+        paper_bgcolor='rgba(0,0,0,0)', 
+        xaxis=dict(
+            showgrid=True, 
+            gridcolor='rgba(29, 184, 160, 0.15)', 
+            color='#2dd9ce',
+            tickformat='%Y-%m-%d %H:%M:%S'
+        ), 
+        height=320, 
+        margin=dict(l=60, r=30, t=30, b=60),
+        font={'family': 'Poppins', 'color': '#2dd9ce', 'size': 11},
+        legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1, bgcolor='rgba(25, 35, 33, 0.9)', bordercolor='rgba(29, 184, 160, 0.25)', borderwidth=2),
+        yaxis=dict(showgrid=True, gridcolor='rgba(29, 184, 160, 0.15)', color='#2dd9ce', title='Temp/Humidity/Gas'),
+        yaxis2=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
+        yaxis3=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
+        yaxis4=dict(showgrid=False, color='#f44336', overlaying='y', side='right')
+    )
+    return fig_trend
+
+# ============= LIVE PANEL =============
+# Metrik, gauge dan grafik digambar pada run biasa. Dengan AUTO REFRESH aktif
+# fragment live_ticker (tanpa elemen) memeriksa tiap LIVE_REDRAW_S detik
+# apakah ada data baru; tick tanpa data baru langsung selesai, jadi gauge dan
+# grafik plotly tidak digambar ulang. Panel tidak bisa ikut jadi fragment:
+# Streamlit menghapus elemen fragment yang tidak dikirim ulang pada run itu.
+if "auto_refresh" not in st.session_state:
+    st.session_state.auto_refresh = False
+
+@st.fragment(run_every=LIVE_REDRAW_S if st.session_state.auto_refresh else None)
+def live_ticker():
+    if live_data_key() == st.session_state.get("live_drawn"):
+        return
+    st.rerun()
 
-# ========== TAB 1: MONITORING (FULL WIDTH) =========
-with tab_monitoring:
+def live_panel():
     st.markdown("<div class='section-header'>Live Sensor Metrics</div>", unsafe_allow_html=True)
     
-    if "auto_refresh" not in st.session_state:
-        st.session_state.auto_refresh = False
-    
+    df, gauge_stats, last_record = load_live_data()
+    st.session_state.live_drawn = st.session_state.live_data[0]
+    temp = float(last_record.get("temp", 0) or 0)
+    hum = float(last_record.get("hum", 0) or 0)
+    gas = float(last_record.get("gas", 0) or 0)
+    hr_raw = last_record.get("heartrate")
+    # hanya pakai heartrate jika >1, selain itu set 0
+    heartrate = float(hr_raw) if hr_raw and float(hr_raw) > 1 else 0
+    ai_status = last_record.get("ai", "N/A")
+
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     with col1:
         st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Temperature</div><div class='metric-value-modern'>{temp:.1f}°C</div></div>", unsafe_allow_html=True)
@@ -140,11 +243,21 @@ with tab_monitoring:
     with col6:
         if st.button("AUTO REFRESH", use_container_width=True, key="toggle_auto_refresh"):
             st.session_state.auto_refresh = not st.session_state.auto_refresh
+            # run_every live_ticker ditentukan saat full run
+            st.rerun()
     
     # ============= SENSOR VISUALIZATION =============
     st.markdown("<div class='section-header'>Visualisasi Data Sensor</div>", unsafe_allow_html=True)
     st.markdown("<div class='gauge-viz-container'>", unsafe_allow_html=True)
     
+    if tail_cache is not None:
+        # snapshot dari agregat berjalan, tanpa scan ulang riwayat
+        stats_window = st.radio(
+            "Rentang statistik", ["all", "1h", "1d"], horizontal=True, key="stats_window",
+            format_func={"all": "Semua", "1h": "1 jam terakhir", "1d": "24 jam terakhir"}.get
+        )
+        gauge_stats = tail_cache.aggregates(window=stats_window)
+
     col_gauge1, col_gauge2, col_gauge3, col_gauge4 = st.columns(4)
     with col_gauge1:
         temp_percent = min(100, max(0, (temp / 50) * 100))
@@ -160,9 +273,9 @@ with tab_monitoring:
                 </div>
             </div>
             <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['temp'].min() if not df.empty else 0:.1f}°C</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['temp'].max() if not df.empty else 0:.1f}°C</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['temp'].mean() if not df.empty else 0:.1f}°C</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['temp']['min']:.1f}°C</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['temp']['max']:.1f}°C</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['temp']['mean']:.1f}°C</div></div>
                 <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Optimal</div></div>
             </div>
         </div>
@@ -182,9 +295,9 @@ with tab_monitoring:
                 </div>
             </div>
             <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['hum'].min() if not df.empty else 0:.1f}%</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['hum'].max() if not df.empty else 0:.1f}%</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['hum'].mean() if not df.empty else 0:.1f}%</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['hum']['min']:.1f}%</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['hum']['max']:.1f}%</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['hum']['mean']:.1f}%</div></div>
                 <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Good</div></div>
             </div>
         </div>
@@ -204,9 +317,9 @@ with tab_monitoring:
                 </div>
             </div>
             <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['gas'].min() if not df.empty else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['gas'].max() if not df.empty else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['gas'].mean() if not df.empty else 0:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['gas']['min']:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['gas']['max']:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['gas']['mean']:.0f}</div></div>
                 <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Safe</div></div>
             </div>
         </div>
@@ -231,9 +344,9 @@ with tab_monitoring:
                 </div>
             </div>
             <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['heartrate'].min() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['heartrate'].max() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['heartrate'].mean() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate']['min']:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate']['max']:.0f}</div></div>
+                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate']['mean']:.0f}</div></div>
                 <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>{hr_display_status}</div></div>
             </div>
         </div>
@@ -244,77 +357,129 @@ with tab_monitoring:
     # ============= TREND CHART =============
     st.markdown("<div class='section-header'>Tren Grafik Data Lingkungan</div>", unsafe_allow_html=True)
     st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
-    if not df.empty:
-        recent = df.tail(200).copy()
-        fig_trend = go.Figure()
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['temp'], name='Temperature', line=dict(color='#ff6b6b', width=3), mode='lines', fill='tonexty', fillcolor='rgba(255, 107, 107, 0.1)', yaxis='y1'))
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['hum'], name='Humidity', line=dict(color='#1db8a0', width=3), mode='lines', fill='tonexty', fillcolor='rgba(29, 184, 160, 0.1)', yaxis='y2'))
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['gas']/10, name='Gas (÷10)', line=dict(color='#2dd9ce', width=3), mode='lines', fill='tonexty', fillcolor='rgba(45, 217, 206, 0.1)', yaxis='y3'))
-        if 'heartrate' in recent.columns:
-            fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['heartrate'], name='Heart Rate', line=dict(color='#f44336', width=3), mode='lines+markers', yaxis='y4'))
-        fig_trend.update_layout(
-            hovermode='x unified', 
-            plot_bgcolor='rgba(15, 31, 30, 0.5)', 
-            paper_bgcolor='rgba(0,0,0,0)', 
-            xaxis=dict(
-                showgrid=True, 
-                gridcolor='rgba(29, 184, 160, 0.15)', 
-                color='#2dd9ce',
-                tickformat='%Y-%m-%d %H:%M:%S'
-            ), 
-            height=320, 
-            margin=dict(l=60, r=30, t=30, b=60),
-            font={'family': 'Poppins', 'color': '#2dd9ce', 'size': 11},
-            legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1, bgcolor='rgba(25, 35, 33, 0.9)', bordercolor='rgba(29, 184, 160, 0.25)', borderwidth=2),
-            yaxis=dict(showgrid=True, gridcolor='rgba(29, 184, 160, 0.15)', color='#2dd9ce', title='Temp/Humidity/Gas'),
-            yaxis2=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
-            yaxis3=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
-            yaxis4=dict(showgrid=False, color='#f44336', overlaying='y', side='right')
-        )
-        st.plotly_chart(fig_trend, use_container_width=True, config={'displayModeBar': True})
+    chart_range = st.radio(
+        "Rentang grafik", list(CHART_RANGES), horizontal=True, key="chart_range",
+        format_func={"live": "Terbaru", "1h": "1 jam", "6h": "6 jam", "1d": "1 hari", "7d": "7 hari", "all": "Semua"}.get
+    )
+    # figure hanya dibangun ulang jika data atau rentang berubah
+    fig_key = (st.session_state.live_data[0], chart_range)
+    cached_fig = st.session_state.get("trend_fig")
+    if cached_fig is None or cached_fig[0] != fig_key:
+        hours = CHART_RANGES[chart_range]
+        if hours is None:
+            recent = downsample_frame(df, CHART_POINTS)
+        elif tail_cache is not None:
+            # level min/max yang sudah dihitung di TailCache, tanpa scan baris mentah
+            span = tail_cache.span()
+            since = span[1] - hours * 3600 if span and hours else None
+            recent = tail_cache.series(since=since, points=CHART_POINTS)
+        else:
+            recent = df if not hours or df.empty else df[df['ts'] >= df['ts'].max() - timedelta(hours=hours)]
+            recent = downsample_frame(recent, CHART_POINTS)
+        cached_fig = (fig_key, build_trend_figure(recent) if not recent.empty else None)
+        st.session_state.trend_fig = cached_fig
+    if cached_fig[1] is not None:
+        st.plotly_chart(cached_fig[1], use_container_width=True, config={'displayModeBar': True})
     else:
         st.info("Menunggu data sensor...")
     st.markdown("</div>", unsafe_allow_html=True)
-    
+
+# ============= HEALTH ASSISTANT =============
+# Pertanyaan dikirim ke thread latar (assistant_client.py), jadi halaman dan
+# AUTO REFRESH tidak ikut menunggu jawaban LLM. Jawaban tampil bertahap dari
+# fragment yang dijalankan ulang tiap ASSISTANT_POLL_S selama ada permintaan.
+# ASSISTANT_BACKEND = "fake" menjawab lokal tanpa API key (untuk uji coba).
+ASSISTANT_BACKEND = st.secrets.get("ASSISTANT_BACKEND", "gemini")
+ASSISTANT_TIMEOUT_S = float(st.secrets.get("ASSISTANT_TIMEOUT_S", 60))
+ASSISTANT_CACHE = int(st.secrets.get("ASSISTANT_CACHE", 128))
+ASSISTANT_POLL_S = 0.5
+
+@st.cache_resource
+def get_assistant(backend, timeout, cache_size):
+    from assistant_client import AssistantClient, ChatbotBackend, FakeBackend
+    if backend == "fake":
+        return AssistantClient(FakeBackend(), timeout=timeout, cache_size=cache_size)
+    with st.spinner("Menghubungkan ke Asisten Kesehatan Gemini"):
+        from assistant import GeminiHealthChatbot
+        chatbot = GeminiHealthChatbot(model_name="gemini-2.5-flash")
+    return AssistantClient(ChatbotBackend(chatbot), timeout=timeout, cache_size=cache_size)
+
+if "assistant_session" not in st.session_state:
+    st.session_state.assistant_session = uuid.uuid4().hex
+
+def assistant_pending():
+    req = st.session_state.get("assistant_request")
+    return req is not None and not req.done
+
+@st.fragment(run_every=ASSISTANT_POLL_S if assistant_pending() else None)
+def assistant_panel(assistant):
+    from assistant_client import AssistantBusy, DONE, TIMEOUT
+
+    st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
+
+    user_input = st.text_area(
+        "Tanyakan apa saja: gejala kesehatan, interpretasi sensor, saran harian, dll",
+        height=150,
+        key="health_chat_input_full",
+        placeholder="Contoh: Saya merasa pusing, suhu ruangan 32°C, kelembapan tinggi, dan ada bau aneh. Apa yang harus saya lakukan?"
+    )
+
+    if st.button("Kirim ke Asisten Kesehatan", type="primary", use_container_width=True, disabled=assistant_pending()):
+        if user_input.strip():
+            try:
+                st.session_state.assistant_request = assistant.submit(
+                    st.session_state.assistant_session, user_input, sensor_context=load_live_data()[2])
+            except AssistantBusy:
+                st.warning("Pertanyaan sebelumnya masih diproses.")
+            else:
+                # full rerun supaya fragment ini mulai polling (run_every)
+                st.rerun()
+
+    req = st.session_state.get("assistant_request")
+    if req is not None:
+        if not req.done:
+            st.caption("Asisten sedang menganalisis data sensor dan pertanyaan Anda...")
+        elif req.status == TIMEOUT:
+            st.error("Asisten tidak menjawab tepat waktu, silakan coba lagi.")
+        elif req.status != DONE:
+            st.error(f"Asisten gagal menjawab: {req.error}")
+        text = req.text
+        if text:
+            cursor = "" if req.done else " ▌"
+            st.markdown(f"""
+            <div class='info-card-modern'>
+                <strong>Jawaban dari Asisten Kesehatan:</strong><br><br>
+                {text}{cursor}
+            </div>
+            """, unsafe_allow_html=True)
+        if req.done and st.session_state.get("assistant_polling"):
+            # jawaban selesai: full rerun sekali untuk menghentikan polling
+            st.session_state.assistant_polling = False
+            st.rerun()
+        st.session_state.assistant_polling = not req.done
+
+# ============= HEADER =============
+st.markdown("<h1 class='dashboard-title'>🌡️ Smart Health Ecosystem</h1>", unsafe_allow_html=True)
+st.markdown("<p class='dashboard-subtitle'>Real-time Health Monitoring dengan AI & IoT</p>", unsafe_allow_html=True)
+
+# ============= TABS =============
+tab_monitoring, tab_medicine = st.tabs(["Monitoring", "Medicine Scheduler"])
+
+# ========== TAB 1: MONITORING (FULL WIDTH) =========
+with tab_monitoring:
+    live_panel()
+    live_ticker()
+
     # ============= HEALTH ASSISTANT =============
     st.markdown("<div class='section-header'>Asisten Kesehatan</div>", unsafe_allow_html=True)
 
-    if "health_chatbot" not in st.session_state:
-        with st.spinner("Menghubungkan ke Asisten Kesehatan Gemini"):
-            st.session_state.health_chatbot = GeminiHealthChatbot(model_name="gemini-2.5-flash")
-
-    chatbot = st.session_state.health_chatbot
+    assistant = get_assistant(ASSISTANT_BACKEND, ASSISTANT_TIMEOUT_S, ASSISTANT_CACHE)
 
-    if not getattr(chatbot, "ready", False):
+    if not assistant.ready:
         st.warning("Asisten belum siap. Pastikan GOOGLE_API_KEY ada di .streamlit/secrets.toml")
     else:
-        st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
+        assistant_panel(assistant)
 
-        user_input = st.text_area(
-            "Tanyakan apa saja: gejala kesehatan, interpretasi sensor, saran harian, dll",
-            height=150,
-            key="health_chat_input_full",
-            placeholder="Contoh: Saya merasa pusing, suhu ruangan 32°C, kelembapan tinggi, dan ada bau aneh. Apa yang harus saya lakukan?"
-        )
-
-        if st.button("Kirim ke Asisten Kesehatan", type="primary", use_container_width=True):
-            if user_input.strip():
-                with st.spinner("Asisten sedang menganalisis data sensor dan pertanyaan Anda..."):
-                    reply = chatbot.ask(user_input, sensor_context=last_record)
-                    st.markdown(f"""
-                    <div class='info-card-modern'>
-                        <strong>Jawaban dari Asisten Kesehatan:</strong><br><br>
-                        {reply}
-                    </div>
-                    """, unsafe_allow_html=True)
-
-        
-    
-    # ============= AUTO REFRESH LOGIC =============
-    if st.session_state.auto_refresh:
-        time.sleep(1)
-        st.rerun()
-    
     # ============= FOOTER =============
     st.markdown("<div class='footer-card'><p style='color: #2dd9ce; font-size: 0.85rem; margin: 0; font-weight: 700;'> Smart Health Ecosystem © 2025 | Real-time Monitoring System </p></div>", unsafe_allow_html=True)
 
@@ -323,172 +488,62 @@ with tab_medicine:
     # ============= JADWAL MINUM OBAT (3 FORMS) =============
     st.markdown("<h2 style='color: #2dd9ce; font-family: Space Grotesk; font-weight: 700; margin: 2rem 0 1.5rem 0;'>Jadwal Minum Obat</h2>", unsafe_allow_html=True)
     
-    # Buat 3 kolom untuk 3 form jadwal
-    col_form1, col_form2, col_form3 = st.columns(3)
-    
-    # FORM 1
-    with col_form1:
-        st.markdown("<h3 style='color: #26d0ce; font-size: 1rem; margin-bottom: 1rem;'>Jadwal 1</h3>", unsafe_allow_html=True)
-        
-        medicine_name_1 = st.text_input("Nama Obat", "", key="med_name_1", placeholder="Paracetamol")
-        
-        col_dates_1 = st.columns(2)
-        with col_dates_1[0]:
-            start_date_1 = st.date_input("Tgl Mulai", datetime.now(), key="start_date_1")
-        with col_dates_1[1]:
-            end_date_1 = st.date_input("Tgl Selesai", datetime.now() + timedelta(days=7), key="end_date_1")
-        
-        frequency_1 = st.number_input("Frekuensi", min_value=1, max_value=6, value=2, key="freq_1")
-        
-        st.markdown("<p style='color: #26d0ce; font-size: 0.8rem; font-weight: 700; margin: 0.8rem 0 0.5rem 0;'>Waktu:</p>", unsafe_allow_html=True)
-        times_1 = []
-        cols_times_1 = st.columns(min(frequency_1, 3))
-        for i in range(frequency_1):
-            with cols_times_1[i % 3]:
-                time_input = st.time_input(f"Jam {i+1}", datetime.strptime(f"{8 + i*4}:00", "%H:%M").time(), key=f"time_1_{i}")
-                times_1.append(time_input)
-        
-        if st.button("TAMBAH", key="add_schedule_1", use_container_width=True):
-            if medicine_name_1.strip() and start_date_1 and end_date_1 and times_1:
-                if start_date_1 <= end_date_1:
-                    schedules = []
-                    current_date = start_date_1
-                    while current_date <= end_date_1:
-                        for t in times_1:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_1} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 1 ditambahkan: {len(new_schedules)} jadwal baru!")
-                    else:
-                        st.warning("Semua jadwal sudah ada dalam daftar.")
-                else:
-                    st.error("Tanggal mulai harus <= tanggal selesai!")
-            else:
-                st.error("Isi semua field!")
-        
-    # FORM 2
-    with col_form2:
-        st.markdown("<h3 style='color: #26d0ce; font-size: 1rem; margin-bottom: 1rem;'>Jadwal 2</h3>", unsafe_allow_html=True)
-        
-        medicine_name_2 = st.text_input("Nama Obat", "", key="med_name_2", placeholder="Amoxicillin")
-        
-        col_dates_2 = st.columns(2)
-        with col_dates_2[0]:
-            start_date_2 = st.date_input("Tgl Mulai", datetime.now(), key="start_date_2")
-        with col_dates_2[1]:
-            end_date_2 = st.date_input("Tgl Selesai", datetime.now() + timedelta(days=7), key="end_date_2")
-        
-        frequency_2 = st.number_input("Frekuensi", min_value=1, max_value=6, value=3, key="freq_2")
-        
-        st.markdown("<p style='color: #26d0ce; font-size: 0.8rem; font-weight: 700; margin: 0.8rem 0 0.5rem 0;'>Waktu:</p>", unsafe_allow_html=True)
-        times_2 = []
-        cols_times_2 = st.columns(min(frequency_2, 3))
-        for i in range(frequency_2):
-            with cols_times_2[i % 3]:
-                time_input = st.time_input(f"Jam {i+1}", datetime.strptime(f"{8 + i*4}:00", "%H:%M").time(), key=f"time_2_{i}")
-                times_2.append(time_input)
-        
-        if st.button("TAMBAH", key="add_schedule_2", use_container_width=True):
-            if medicine_name_2.strip() and start_date_2 and end_date_2 and times_2:
-                if start_date_2 <= end_date_2:
-                    schedules = []
-                    current_date = start_date_2
-                    while current_date <= end_date_2:
-                        for t in times_2:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_2} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 2 ditambahkan: {len(new_schedules)} jadwal baru!")
-                    else:
-                        st.warning("Semua jadwal sudah ada dalam daftar.")
-                else:
-                    st.error("Tanggal mulai harus <= tanggal selesai!")
-            else:
-                st.error("Isi semua field!")
-        
-    # FORM 3
-    with col_form3:
-        st.markdown("<h3 style='color: #26d0ce; font-size: 1rem; margin-bottom: 1rem;'>Jadwal 3</h3>", unsafe_allow_html=True)
-        
-        medicine_name_3 = st.text_input("Nama Obat", "", key="med_name_3", placeholder="Vitamin C")
-        
-        col_dates_3 = st.columns(2)
-        with col_dates_3[0]:
-            start_date_3 = st.date_input("Tgl Mulai", datetime.now(), key="start_date_3")
-        with col_dates_3[1]:
-            end_date_3 = st.date_input("Tgl Selesai", datetime.now() + timedelta(days=7), key="end_date_3")
-        
-        frequency_3 = st.number_input("Frekuensi", min_value=1, max_value=6, value=1, key="freq_3")
-        
+    def publish_schedule(payload):
+        if payload and "mqtt_runner" in st.session_state:
+            st.session_state.mqtt_runner.publish_schedule(payload)
+
+    def schedule_form(n, placeholder, default_freq):
+        """Satu form jadwal (dipakai untuk ketiga kolom)."""
+        st.markdown(f"<h3 style='color: #26d0ce; font-size: 1rem; margin-bottom: 1rem;'>Jadwal {n}</h3>", unsafe_allow_html=True)
+
+        medicine_name = st.text_input("Nama Obat", "", key=f"med_name_{n}", placeholder=placeholder)
+
+        col_dates = st.columns(2)
+        with col_dates[0]:
+            start_date = st.date_input("Tgl Mulai", datetime.now(), key=f"start_date_{n}")
+        with col_dates[1]:
+            end_date = st.date_input("Tgl Selesai", datetime.now() + timedelta(days=7), key=f"end_date_{n}")
+
+        frequency = st.number_input("Frekuensi", min_value=1, max_value=6, value=default_freq, key=f"freq_{n}")
+
         st.markdown("<p style='color: #26d0ce; font-size: 0.8rem; font-weight: 700; margin: 0.8rem 0 0.5rem 0;'>Waktu:</p>", unsafe_allow_html=True)
-        times_3 = []
-        cols_times_3 = st.columns(min(frequency_3, 3))
-        for i in range(frequency_3):
-            with cols_times_3[i % 3]:
-                time_input = st.time_input(f"Jam {i+1}", datetime.strptime(f"{8 + i*4}:00", "%H:%M").time(), key=f"time_3_{i}")
-                times_3.append(time_input)
-        
-        if st.button("TAMBAH", key="add_schedule_3", use_container_width=True):
-            if medicine_name_3.strip() and start_date_3 and end_date_3 and times_3:
-                if start_date_3 <= end_date_3:
-                    schedules = []
-                    current_date = start_date_3
-                    while current_date <= end_date_3:
-                        for t in times_3:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_3} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 3 ditambahkan: {len(new_schedules)} jadwal baru!")
+        times = []
+        cols_times = st.columns(min(frequency, 3))
+        for i in range(frequency):
+            with cols_times[i % 3]:
+                time_input = st.time_input(f"Jam {i+1}", datetime.strptime(f"{8 + i*4}:00", "%H:%M").time(), key=f"time_{n}_{i}")
+                times.append(time_input)
+
+        if st.button("TAMBAH", key=f"add_schedule_{n}", use_container_width=True):
+            if medicine_name.strip() and start_date and end_date and times:
+                if start_date <= end_date:
+                    # satu aturan, bukan daftar semua tanggal x jam
+                    payload, added = schedule_store.add(medicine_name, start_date, end_date, times)
+                    if payload:
+                        publish_schedule(payload)
+                        st.success(f"Jadwal {n} ditambahkan: {added} jadwal baru!")
                     else:
                         st.warning("Semua jadwal sudah ada dalam daftar.")
                 else:
                     st.error("Tanggal mulai harus <= tanggal selesai!")
             else:
                 st.error("Isi semua field!")
-        
-    
+
+    # Buat 3 kolom untuk 3 form jadwal
+    for col_form, (n, placeholder, default_freq) in zip(st.columns(3), [(1, "Paracetamol", 2), (2, "Amoxicillin", 3), (3, "Vitamin C", 1)]):
+        with col_form:
+            schedule_form(n, placeholder, default_freq)
+
     # ============= STATISTIK JADWAL =============
     st.markdown("<div class='section-header'>Statistik Jadwal</div>", unsafe_allow_html=True)
     st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
-    
-    total_schedules = len(st.session_state.medicine_schedules)
-    unique_medicines = len(set([s["medicine"] for s in st.session_state.medicine_schedules])) if st.session_state.medicine_schedules else 0
-    
+
+    schedule_stats = schedule_store.stats()
+    total_schedules = schedule_stats["doses"]
+    unique_medicines = schedule_stats["medicines"]
+
     col_stat_1, col_stat_2, col_stat_3 = st.columns(3)
-    
+
     with col_stat_1:
         st.markdown(f"""
         <div class='metric-card-modern'>
@@ -496,7 +551,7 @@ with tab_medicine:
             <div class='metric-value-modern'>{total_schedules}</div>
         </div>
         """, unsafe_allow_html=True)
-    
+
     with col_stat_2:
         st.markdown(f"""
         <div class='metric-card-modern'>
@@ -504,39 +559,46 @@ with tab_medicine:
             <div class='metric-value-modern'>{unique_medicines}</div>
         </div>
         """, unsafe_allow_html=True)
-    
+
     with col_stat_3:
         if st.button("Hapus Semua Jadwal", key="clear_schedules", use_container_width=True):
-            st.session_state.medicine_schedules = []
+            publish_schedule(schedule_store.clear())
             st.rerun()
-    
+        # kirim ulang semua aturan, mis. setelah perangkat restart
+        if st.button("Sinkronkan Perangkat", key="sync_schedules", use_container_width=True):
+            publish_schedule(schedule_store.sync_payload())
+            st.success("Semua jadwal dikirim ulang ke perangkat.")
+
     st.markdown("</div>", unsafe_allow_html=True)
-    
+
     # ============= SCHEDULE LIST =============
-    if st.session_state.medicine_schedules:
+    rules = schedule_store.list()
+    if rules:
         st.markdown("<div class='section-header'>Daftar Jadwal Obat</div>", unsafe_allow_html=True)
         st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
-        
-        schedule_df = pd.DataFrame(st.session_state.medicine_schedules)
-        schedule_df = schedule_df.sort_values('datetime')
-        
-        for medicine in schedule_df['medicine'].unique():
-            med_schedules = schedule_df[schedule_df['medicine'] == medicine]
-            with st.expander(f"Obat: {medicine} ({len(med_schedules)} jadwal)", expanded=False):
-                st.dataframe(med_schedules[['datetime', 'medicine']], use_container_width=True, hide_index=True, key=f"df_{medicine}")
-        
+
+        upcoming = schedule_store.upcoming(n=20)
+        if upcoming:
+            st.markdown("<p style='color: #26d0ce; font-size: 0.9rem; font-weight: 700;'>Dosis Berikutnya:</p>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame([{"datetime": dt.strftime("%Y-%m-%d %H:%M"), "medicine": r["medicine"]} for dt, r in upcoming]),
+                         use_container_width=True, hide_index=True)
+
+        rules_df = pd.DataFrame([{"id": r["id"], "medicine": r["medicine"], "start": r["start"], "end": r["end"],
+                                  "times": ", ".join(r["times"]), "doses": r["doses"]} for r in rules])
+        for medicine in rules_df['medicine'].unique():
+            med_rules = rules_df[rules_df['medicine'] == medicine]
+            with st.expander(f"Obat: {medicine} ({int(med_rules['doses'].sum())} jadwal)", expanded=False):
+                st.dataframe(med_rules[['start', 'end', 'times', 'doses']], use_container_width=True, hide_index=True, key=f"df_{medicine}")
+                for rule_id in med_rules['id']:
+                    if st.button(f"Hapus aturan {rule_id}", key=f"del_{rule_id}"):
+                        publish_schedule(schedule_store.remove(rule_id))
+                        st.rerun()
+
         st.markdown("<p style='color: #26d0ce; font-size: 0.9rem; font-weight: 700; margin-top: 1.5rem;'>Ringkasan Semua Jadwal:</p>", unsafe_allow_html=True)
-        st.dataframe(schedule_df, use_container_width=True, hide_index=True)
-        
+        st.dataframe(rules_df, use_container_width=True, hide_index=True)
+
         st.markdown("</div>", unsafe_allow_html=True)
     else:
         st.info("Belum ada jadwal obat. Silakan tambahkan jadwal baru di atas.")
-    
-    st.markdown("<div class='footer-card'><p style='color: #2dd9ce; font-size: 0.85rem; margin: 0; font-weight: 700;'> Smart Health Ecosystem © 2025 | Medicine Scheduler </p></div>", unsafe_allow_html=True)
 
-# ============= AUTO REFRESH LOGIC (GLOBAL) =============
-if st.session_state.auto_refresh:
-    time.sleep(1)
-    st.rerun()
-
-time.sleep(0.1)
+    st.markdown("<div class='footer-card'><p style='color: #2dd9ce; font-size: 0.85rem; margin: 0; font-weight: 700;'> Smart Health Ecosystem © 2025 | Medicine Scheduler </p></div>", unsafe_allow_html=True)
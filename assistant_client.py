@@ -0,0 +1,259 @@
+"""
+Background health-assistant requests for the dashboard.
+
+app.py used to call GeminiHealthChatbot.ask() inside the Streamlit
+script, so the page (and the live panel's auto refresh) froze for the
+whole LLM round trip. AssistantClient runs requests on a small thread
+pool instead and hands back an AssistantRequest whose text grows as the
+backend streams; the UI polls it from a fragment.
+
+    client = AssistantClient(ChatbotBackend(GeminiHealthChatbot(...)))
+    req = client.submit(session_id, question, sensor_context=last_record)
+    req.text, req.status, req.wait(timeout)
+
+  - answers are cached (LRU) on the normalised question plus the sensor
+    context rounded to CONTEXT_BUCKETS, so asking again about the same
+    room does not call the model again; failures are not cached
+  - at most `per_session` requests in flight per browser session
+    (AssistantBusy otherwise)
+  - `timeout` seconds per request, queueing included; a streaming
+    backend is cut off between chunks, a blocking one is abandoned
+  - FakeBackend answers locally (word by word, with a delay) for tests
+    and for running the dashboard without an API key
+"""
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# sensor field -> bucket width used in the cache key
+CONTEXT_BUCKETS = {"temp": 1.0, "hum": 5.0, "gas": 50.0, "heartrate": 5.0}
+
+QUEUED, RUNNING, DONE, ERROR, TIMEOUT = "queued", "running", "done", "error", "timeout"
+
+
+class AssistantBusy(RuntimeError):
+    pass
+
+
+def normalize_question(q):
+    q = re.sub(r"\s+", " ", (q or "").strip().lower())
+    return q.rstrip(" ?!.")
+
+
+def bucket_context(context, buckets=CONTEXT_BUCKETS):
+    """Hashable, rounded view of the sensor record (None if there is none)."""
+    if not context:
+        return None
+    out = []
+    for field, width in sorted(buckets.items()):
+        try:
+            v = float(context.get(field))
+        except (TypeError, ValueError):
+            out.append((field, None))
+            continue
+        out.append((field, int(v // width)))
+    out.append(("ai", context.get("ai")))
+    return tuple(out)
+
+
+# ---------------- BACKENDS ----------------
+class ChatbotBackend:
+    """
+    Wraps an assistant object with ask(question, sensor_context=...) (the
+    Gemini chatbot). If it also has ask_stream(...) yielding text chunks,
+    that is used; otherwise the whole reply comes as one chunk.
+    """
+
+    def __init__(self, chatbot):
+        self.chatbot = chatbot
+
+    @property
+    def ready(self):
+        return bool(getattr(self.chatbot, "ready", False))
+
+    def stream(self, question, sensor_context=None):
+        ask_stream = getattr(self.chatbot, "ask_stream", None)
+        if ask_stream is not None:
+            yield from ask_stream(question, sensor_context=sensor_context)
+        else:
+            yield self.chatbot.ask(question, sensor_context=sensor_context)
+
+
+class FakeBackend:
+    """Local stand-in: echoes the question and context, one word every `delay` seconds."""
+
+    ready = True
+
+    def __init__(self, delay=0.02, reply=None, fail=None):
+        self.delay = delay
+        self.reply = reply
+        self.fail = fail
+        self.calls = 0
+
+    def stream(self, question, sensor_context=None):
+        self.calls += 1
+        if self.fail is not None:
+            raise self.fail
+        if self.reply is not None:
+            text = self.reply(question, sensor_context) if callable(self.reply) else self.reply
+        else:
+            ctx = sensor_context or {}
+            text = (f"(fake) Pertanyaan: {question.strip()} | suhu {ctx.get('temp', '-')}°C, "
+                    f"kelembapan {ctx.get('hum', '-')}%, gas {ctx.get('gas', '-')}, "
+                    f"detak jantung {ctx.get('heartrate', '-')} BPM, status {ctx.get('ai', '-')}.")
+        for i, word in enumerate(text.split(" ")):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+
+# ---------------- REQUESTS ----------------
+class AssistantRequest:
+    def __init__(self, session, question, sensor_context, timeout):
+        self.id = uuid.uuid4().hex[:12]
+        self.session = session
+        self.question = question
+        self.sensor_context = sensor_context
+        self.created = time.monotonic()
+        self.deadline = self.created + timeout if timeout else None
+        self._status = QUEUED
+        self.cached = False
+        self.error = None
+        self.finished = None
+        self._chunks = []
+        self._done = threading.Event()
+
+    @property
+    def status(self):
+        return TIMEOUT if self.expired() else self._status
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    @property
+    def done(self):
+        return self._done.is_set() or self.expired()
+
+    def expired(self):
+        return self.deadline is not None and not self._done.is_set() and time.monotonic() > self.deadline
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done
+
+    def _finish(self, status, error=None):
+        if not self._done.is_set():
+            self._status = status
+            self.error = error
+            self.finished = time.monotonic()
+            self._done.set()
+
+
+class AssistantClient:
+    def __init__(self, backend, workers=2, cache_size=128, timeout=60.0, per_session=1,
+                 buckets=CONTEXT_BUCKETS):
+        self.backend = backend
+        self.timeout = timeout
+        self.per_session = max(1, int(per_session))
+        self.buckets = buckets
+        self.cache_size = max(0, int(cache_size))
+        self._cache = OrderedDict()   # (question, context buckets) -> reply
+        self._lock = threading.Lock()
+        self._active = {}             # session -> set of in-flight requests
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="assistant")
+        self.submitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def ready(self):
+        return bool(getattr(self.backend, "ready", True))
+
+    def cache_key(self, question, sensor_context):
+        return normalize_question(question), bucket_context(sensor_context, self.buckets)
+
+    def submit(self, session, question, sensor_context=None):
+        req = AssistantRequest(session, question, sensor_context, self.timeout)
+        key = self.cache_key(question, sensor_context)
+        with self._lock:
+            self.submitted += 1
+            reply = self._cache.get(key)
+            if reply is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                req.cached = True
+                req._chunks.append(reply)
+                req._finish(DONE)
+                return req
+            active = self._active.setdefault(session, set())
+            active.difference_update([r for r in active if r.done])
+            if len(active) >= self.per_session:
+                self.rejected += 1
+                raise AssistantBusy(f"session already has {len(active)} request(s) running")
+            self.misses += 1
+            active.add(req)
+        self._pool.submit(self._run, req, key)
+        return req
+
+    def _run(self, req, key):
+        if req.expired():
+            self._end(req, TIMEOUT, "timed out in queue")
+            return
+        req._status = RUNNING
+        try:
+            for chunk in self.backend.stream(req.question, sensor_context=req.sensor_context):
+                if req.expired():
+                    self._end(req, TIMEOUT, f"no complete answer after {self.timeout:g}s")
+                    return
+                if chunk:
+                    req._chunks.append(chunk)
+        except Exception as e:
+            print("[ASSISTANT] request failed:", e)
+            self._end(req, ERROR, str(e))
+            return
+        with self._lock:
+            # kept even if the caller gave up waiting: asking again is then instant
+            if self.cache_size:
+                self._cache[key] = req.text
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if req.expired():
+            self._end(req, TIMEOUT, f"no complete answer after {self.timeout:g}s")
+            return
+        self._end(req, DONE)
+
+    def _end(self, req, status, error=None):
+        req._finish(status, error)
+        with self._lock:
+            if status == DONE:
+                self.completed += 1
+            elif status == TIMEOUT:
+                self.timeouts += 1
+            else:
+                self.errors += 1
+            self._active.get(req.session, set()).discard(req)
+
+    def in_flight(self, session=None):
+        with self._lock:
+            sessions = [session] if session is not None else list(self._active)
+            return sum(1 for s in sessions for r in self._active.get(s, ()) if not r.done)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"submitted": self.submitted, "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0, "completed": self.completed,
+                    "errors": self.errors, "timeouts": self.timeouts, "rejected": self.rejected,
+                    "cached": len(self._cache)}
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,558 @@
+"""
+Asyncio variant of mqtt_client.MQTTRunner.
+
+Same public API (start, stop, get_latest_record, get_last_status,
+publish_obat, publish_schedule, subscribe, get_version, get_stats, ...)
+so app.py and ipc.IngestServer can use either. paho is driven from an event loop
+(socket readiness callbacks instead of loop_forever), and the work runs
+as cooperating tasks joined by bounded asyncio queues:
+
+  receive   paho on_message -> inbox (overload policy as pipeline.py)
+  infer     decode, dedup, features, one predict_batch per drained batch
+            (the forest runs on a helper thread so the loop stays free)
+  store     storage appends on an I/O thread, stats, live updates
+  publish   SHHE/status and SHHE/obat, waiting for the socket to drain
+
+Backpressure is explicit: a full store/publish queue stalls infer, a
+full inbox applies the overload policy, and with BLOCK the connection
+stops reading its socket until infer catches up (TCP pushes back to the
+broker).
+
+Subscriptions can be split into topic shards (SHHE/data/0..N-1 next to
+SHHE/data) spread over several broker connections.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from anomaly import AnomalyDetector
+from broadcast import Broadcaster
+from metrics import Metrics, MetricsServer
+from model import ModelService
+from mqtt_client import TOPIC_DATA, TOPIC_OBAT, TOPIC_STATUS, validate_payload
+from pipeline import DROP_NEWEST, DROP_OLDEST, OVERLOAD_POLICIES
+from stats import StreamingStats, WINDOW_ALL
+from status_publisher import StatusPublisher
+from storage import CsvStore
+from telemetry_writer import FSYNC_INTERVAL
+
+_STOP = object()
+
+
+def shard_topics(base=TOPIC_DATA, shards=0):
+    """base plus base/0 .. base/N-1 (devices may publish to either)."""
+    return [base] + [f"{base}/{i}" for i in range(shards)]
+
+
+class _Connection:
+    """One paho client whose socket is watched by the event loop."""
+
+    def __init__(self, runner, index, topics):
+        self.runner = runner
+        self.index = index
+        self.topics = topics
+        self.loop = runner._loop
+        self.sock = None
+        self.paused = False
+        self.connected = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writable.set()
+        c = self.client = mqtt.Client()
+        c.on_connect = self._on_connect
+        c.on_disconnect = self._on_disconnect
+        c.on_message = self._on_message
+        c.on_socket_open = self._on_socket_open
+        c.on_socket_close = self._on_socket_close
+        c.on_socket_register_write = self._on_register_write
+        c.on_socket_unregister_write = self._on_unregister_write
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.sock = sock
+        self.paused = False
+        self.loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self.sock = None
+        self.writable.set()
+
+    def _on_register_write(self, client, userdata, sock):
+        self.writable.clear()
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+        self.writable.set()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        print(f"[AMQTT] Connection {self.index} up, subscribing {self.topics}")
+        for topic in self.topics:
+            client.subscribe(topic)
+        self.connected.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+
+    def _on_message(self, client, userdata, msg):
+        self.runner._offer(self, msg.payload)
+
+    def pause(self):
+        if not self.paused and self.sock is not None:
+            self.loop.remove_reader(self.sock)
+            self.paused = True
+
+    def resume(self):
+        if self.paused and self.sock is not None:
+            self.loop.add_reader(self.sock, self.client.loop_read)
+        self.paused = False
+
+    async def run(self, stop, host, port, keepalive):
+        backoff = 1.0
+        while not stop.is_set():
+            try:
+                self.client.connect(host, port, keepalive)
+                backoff = 1.0
+            except Exception as e:
+                print(f"[AMQTT] Connect failed ({self.index}):", e)
+                try:
+                    await asyncio.wait_for(stop.wait(), backoff)
+                except asyncio.TimeoutError:
+                    pass
+                backoff = min(backoff * 2, 30.0)
+                continue
+            # keepalive pings / timeouts (paho's loop_misc), once a second
+            while not stop.is_set():
+                if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                    print(f"[AMQTT] Connection {self.index} lost, reconnecting")
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+        self.resume()
+        self.client.disconnect()
+        for _ in range(10):   # let the DISCONNECT packet go out
+            if self.sock is None or self.writable.is_set():
+                break
+            await asyncio.sleep(0.01)
+
+
+class AsyncMQTTRunner:
+    def __init__(self, broker, port, model_path="models/smarthealth.retrained.pkl", csv_path="data.csv",
+                 write_batch_size=256, write_flush_interval=1.0, fsync=FSYNC_INTERVAL, store=None,
+                 topics=None, topic_shards=0, connections=1, batch_max_rows=256,
+                 queue_size=10000, overload=DROP_OLDEST, model_engine="sklearn",
+                 shared_state=None, max_devices=None, device_ttl=None, keepalive=60, status_options=None,
+                 metrics_port=None, prediction_cache=None, rules_path=None,
+                 anomaly=True):
+        if overload not in OVERLOAD_POLICIES:
+            raise ValueError(f"overload must be one of {OVERLOAD_POLICIES}, got {overload!r}")
+        self.broker = broker
+        self.port = port
+        self.keepalive = keepalive
+        self.topics = list(topics) if topics else shard_topics(TOPIC_DATA, topic_shards)
+        self.n_connections = max(1, min(int(connections), len(self.topics)))
+        self.batch_max_rows = max(1, int(batch_max_rows))
+        self.queue_size = max(1, int(queue_size))
+        self.overload = overload
+        self.lock = threading.Lock()
+        self.last_status = "N/A"
+        self.latest_record = None
+        self.stats = StreamingStats(max_devices=max_devices, device_ttl=device_ttl)
+        self.updates = Broadcaster()
+        self.shared_state = shared_state
+        self.metrics = Metrics()
+        self.status = StatusPublisher(self._publish_threadsafe, topic=TOPIC_STATUS,
+                                      **(status_options or {})).start()
+
+        # scored on the store task, in arrival order (see MQTTRunner)
+        self.anomaly = None
+        if anomaly:
+            options = anomaly if isinstance(anomaly, dict) else {}
+            self.anomaly = AnomalyDetector(**dict({"max_devices": max_devices, "ttl": device_ttl}, **options))
+
+        self.model = None
+        if model_path:
+            try:
+                self.model = ModelService(model_source=model_path, engine=model_engine,
+                                          max_devices=max_devices, device_ttl=device_ttl,
+                                          cache_options=prediction_cache, rules=rules_path)
+            except Exception as e:
+                print("[AMQTT] Warning: Failed to load model:", e)
+
+        self.csv_path = csv_path
+        if store is None:
+            store = CsvStore(csv_path, batch_size=write_batch_size,
+                             flush_interval=write_flush_interval, fsync=fsync)
+        self.store = store
+        self.store.open_writer()
+
+        # forest calls and storage appends block; each gets one thread so
+        # their order is the order the tasks hand work over
+        self._cpu = ThreadPoolExecutor(1, thread_name_prefix="amqtt-infer")
+        self._io = ThreadPoolExecutor(1, thread_name_prefix="amqtt-store")
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._stop_event = None
+        # set once stop() was called: new messages are refused while the
+        # stages drain, the connections close after that
+        self._draining = False
+        self._conns = []
+        self._overflow = deque()
+
+        self._register_gauges()
+        self.metrics_server = None
+        if metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port=metrics_port).start()
+            except OSError as e:
+                print("[AMQTT] Warning: metrics endpoint not started:", e)
+
+        self.received = 0
+        self.dropped = 0
+        self.refused = 0
+        self.decode_errors = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.batches = 0
+        self.published = 0
+        self.inbox_high_water = 0
+
+    def _register_gauges(self):
+        m = self.metrics
+        writer = getattr(self.store, "writer", None)
+        if writer is not None:
+            m.gauge("writer_queue_depth", writer.queue_depth, help="Rows waiting for the storage writer.")
+            m.gauge("writer_dropped", lambda: writer.dropped, kind="counter")
+        m.gauge("ingress_queue_depth", lambda: self._inbox.qsize() if self._loop else 0,
+                help="Raw messages waiting for decode.")
+        m.gauge("ingress_queue_high_water", lambda: self.inbox_high_water)
+        m.gauge("ingress_dropped", lambda: self.dropped, kind="counter",
+                help="Messages dropped by the overload policy.")
+        m.gauge("ingress_refused", lambda: self.refused, kind="counter",
+                help="Messages that arrived after stop().")
+        m.gauge("decode_errors", lambda: self.decode_errors, kind="counter")
+        m.gauge("paused_connections", lambda: sum(c.paused for c in self._conns))
+        if self.model is not None:
+            m.gauge("devices", lambda: len(self.model.state))
+            cache = self.model.cache
+            if cache is not None:
+                m.gauge("prediction_cache_hits", lambda: cache.hits, kind="counter")
+                m.gauge("prediction_cache_misses", lambda: cache.misses, kind="counter")
+                m.gauge("prediction_cache_size", lambda: len(cache))
+            rules = self.model.rules
+            m.gauge("rule_hits", lambda: {k: c["hits"] for k, c in rules.stats()["counts"].items()},
+                    kind="counter", label="rule", help="Rows matched per safety rule.")
+            m.gauge("rule_changed", lambda: {k: c["changed"] for k, c in rules.stats()["counts"].items()},
+                    kind="counter", label="rule", help="Labels changed per safety rule.")
+        if self.anomaly is not None:
+            det = self.anomaly
+            m.gauge("anomalies", lambda: det.anomalies, kind="counter",
+                    help="Readings whose anomaly score crossed the threshold.")
+            m.gauge("anomaly_devices", lambda: len(det))
+        m.gauge("status_pending", lambda: self.status.stats()["pending"])
+        m.gauge("status_publishes", lambda: self.status.publishes, kind="counter")
+        m.gauge("live_version", lambda: self.updates.version, help="Records published to live viewers.")
+
+    # ---------------- RECEIVE ----------------
+    def _offer(self, conn, payload):
+        """Called by paho (on the loop) for every message."""
+        self.received += 1
+        self.metrics.inc("messages_received")
+        if self._draining:
+            # would land behind _STOP and never be processed
+            self.refused += 1
+            return
+        inbox = self._inbox
+        if self._overflow or inbox.full():
+            if self.overload == DROP_NEWEST:
+                self.dropped += 1
+                return
+            if self.overload == DROP_OLDEST:
+                inbox.get_nowait()
+                self.dropped += 1
+            else:
+                # BLOCK: park what paho already read and stop reading the socket
+                self._overflow.append(payload)
+                conn.pause()
+                return
+        inbox.put_nowait(payload)
+        if inbox.qsize() > self.inbox_high_water:
+            self.inbox_high_water = inbox.qsize()
+
+    def _refill(self):
+        while self._overflow and not self._inbox.full():
+            self._inbox.put_nowait(self._overflow.popleft())
+        if not self._overflow:
+            for conn in self._conns:
+                conn.resume()
+
+    # ---------------- INFER ----------------
+    async def _infer(self):
+        loop = asyncio.get_running_loop()
+        m = self.metrics
+        while True:
+            batch = [await self._inbox.get()]
+            while len(batch) < self.batch_max_rows and not self._inbox.empty():
+                batch.append(self._inbox.get_nowait())
+            self._refill()
+
+            stop = False
+            records, feats = [], []
+            for raw in batch:
+                if raw is _STOP:
+                    stop = True
+                    continue
+                try:
+                    t0 = time.perf_counter()
+                    payload = json.loads(raw.decode())
+                    t1 = time.perf_counter()
+                    rec = validate_payload(payload)
+                    m.observe("decode", t1 - t0)
+                    m.observe("validate", time.perf_counter() - t1)
+                except Exception as e:
+                    self.decode_errors += 1
+                    print("[AMQTT] decode error:", e)
+                    continue
+                if self.model is not None:
+                    if not self.model.state.accept_ts(rec["device"], rec["ts"]):
+                        self.duplicates += 1
+                        m.inc("duplicates")
+                        continue   # drop packet lama / duplicate
+                    t0 = time.perf_counter()
+                    feats.append(self.model.compute_features(rec["device"], rec["temp"], rec["hum"], rec["gas"],
+                                                             rec["ts"], rec["heartrate"])[0])
+                    m.observe("compute_features", time.perf_counter() - t0)
+                records.append(rec)
+
+            labels = ["GOOD"] * len(records)
+            if feats:
+                try:
+                    t0 = time.perf_counter()
+                    labels = await loop.run_in_executor(self._cpu, self.model.predict_batch, np.vstack(feats))
+                    m.observe("predict_batch", time.perf_counter() - t0)
+                except Exception as e:
+                    print("[AMQTT] AI prediction error:", e)
+            if records:
+                self.batches += 1
+                await self._store_q.put(list(zip(records, labels)))
+            if stop:
+                await self._store_q.put(_STOP)
+                return
+
+    # ---------------- STORE ----------------
+    def _write_rows(self, rows):
+        for row in rows:
+            self.store.append(row)
+
+    async def _store(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._store_q.get()
+            if items is _STOP:
+                await loop.run_in_executor(self._io, self.store.flush)
+                # its last flush is queued (call_soon_threadsafe) before this await returns
+                await loop.run_in_executor(self._io, self.status.close)
+                await self._publish_q.put(_STOP)
+                return
+            rows = [{"ts": rec["ts"], "device": rec["device"], "temp": rec["temp"], "hum": rec["hum"],
+                     "gas": rec["gas"], "ai": label, "heartrate": rec["heartrate"], "anomaly": None}
+                    for rec, label in items]
+            if self.anomaly is not None:
+                t0 = time.perf_counter()
+                score_label = self.anomaly.score_label
+                for row in rows:
+                    row["ai"], score = score_label(row["device"], row["ts"], row["temp"], row["hum"], row["gas"],
+                                                   row["heartrate"], row["ai"])
+                    row["anomaly"] = round(score, 3)
+                self.metrics.observe("anomaly", time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            await loop.run_in_executor(self._io, self._write_rows, rows)
+            t1 = time.perf_counter()
+            self.stats.add_many([r["device"] for r in rows], rows)
+            t2 = time.perf_counter()
+            m = self.metrics
+            m.observe("storage_append", t1 - t0)
+            m.observe("aggregate", t2 - t1)
+
+            for row in rows:
+                label = row["ai"]
+                self.status.observe(row["device"], label)
+                with self.lock:
+                    self.last_status = label
+                    self.latest_record = row
+                self.updates.publish(row)
+                if self.shared_state is not None:
+                    self.shared_state.update(row["device"], row["ts"], row["temp"], row["hum"], row["gas"],
+                                             row["heartrate"], label)
+                m.inc("labels", label=label)
+            m.observe("publish", time.perf_counter() - t2)
+            m.inc("messages_processed", len(rows))
+            self.processed += len(rows)
+
+    # ---------------- PUBLISH ----------------
+    async def _publish(self):
+        conn = self._conns[0]
+        while True:
+            item = await self._publish_q.get()
+            if item is _STOP:
+                return
+            topic, payload = item
+            if not conn.connected.is_set():
+                if self._draining:
+                    # shutting down with the broker away: do not hold up the drain
+                    print(f"[AMQTT] not connected, dropped publish to {topic}")
+                    continue
+                try:
+                    await asyncio.wait_for(conn.connected.wait(), 5.0)
+                except asyncio.TimeoutError:
+                    print(f"[AMQTT] not connected, dropped publish to {topic}")
+                    continue
+            # one publish in flight on the socket at a time
+            await conn.writable.wait()
+            conn.client.publish(topic, payload)
+            self.published += 1
+
+    def publish_obat(self, schedules):
+        if schedules and self._loop is not None:
+            payload = json.dumps({"schedules": schedules})
+            self._loop.call_soon_threadsafe(self._queue_publish, TOPIC_OBAT, payload)
+            print("[AMQTT] Published schedules:", schedules)
+
+    def publish_schedule(self, payload):
+        if payload and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._queue_publish, TOPIC_OBAT,
+                                            json.dumps(payload, separators=(",", ":")))
+            print(f"[AMQTT] Published schedule {payload.get('op')} v{payload.get('v')}")
+
+    def _publish_threadsafe(self, topic, payload):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._queue_publish, topic, payload)
+
+    def _queue_publish(self, topic, payload):
+        try:
+            self._publish_q.put_nowait((topic, payload))
+        except asyncio.QueueFull:
+            print(f"[AMQTT] publish queue full, dropped publish to {topic}")
+
+    # ---------------- LIFECYCLE ----------------
+    async def run(self):
+        """Run until stop(); usable directly from an existing event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        conn_stop = asyncio.Event()
+        self._inbox = asyncio.Queue(self.queue_size)
+        self._store_q = asyncio.Queue(max(1, self.queue_size // self.batch_max_rows))
+        self._publish_q = asyncio.Queue(self.queue_size)
+        self._conns = [_Connection(self, i, self.topics[i::self.n_connections])
+                       for i in range(self.n_connections)]
+        conn_tasks = [asyncio.create_task(c.run(conn_stop, self.broker, self.port, self.keepalive))
+                      for c in self._conns]
+        tasks = [asyncio.create_task(self._infer()), asyncio.create_task(self._store()),
+                 asyncio.create_task(self._publish())]
+        self._started.set()
+
+        await self._stop_event.wait()
+        # drain: everything received before stop is processed, stored and
+        # its status published while the connections are still up
+        self._draining = True
+        if self._overflow:
+            self._overflow.append(_STOP)
+        else:
+            await self._inbox.put(_STOP)
+        await asyncio.gather(*tasks)
+        conn_stop.set()
+        await asyncio.gather(*conn_tasks)
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="async-mqtt", daemon=True)
+        self._thread.start()
+        self._started.wait(10)
+
+    def stop(self, timeout=10.0):
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # the loop still owns the store and the status publisher
+                print(f"[AMQTT] Warning: still draining after {timeout}s, store left open")
+                return
+        if self._loop is None:
+            self.status.close()   # never ran; otherwise _store closed it
+        self._cpu.shutdown(wait=False)
+        self._io.shutdown(wait=True)
+        self.store.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+    def wait_connected(self, timeout=5.0):
+        """True once every connection has its CONNACK (tests / benchmarks)."""
+        if self._loop is None:
+            return False
+
+        async def _all():
+            await asyncio.gather(*(c.connected.wait() for c in self._conns))
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(_all(), timeout), self._loop).result(timeout + 1)
+            return True
+        except Exception:
+            return False
+
+    # ---------------- GETTERS (same as MQTTRunner) ----------------
+    def get_last_status(self):
+        with self.lock:
+            return self.last_status
+
+    def get_latest_record(self):
+        with self.lock:
+            return self.latest_record
+
+    def subscribe(self, maxsize=1000):
+        return self.updates.subscribe(maxsize)
+
+    def get_version(self):
+        return self.updates.version
+
+    def get_csv_path(self):
+        return self.csv_path
+
+    def get_store(self):
+        return self.store
+
+    def get_stats(self, device=None, window=WINDOW_ALL):
+        return self.stats.snapshot(device=device, window=window)
+
+    def get_device_state_stats(self):
+        if self.model is None:
+            return {}
+        return self.model.state.stats()
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+    def get_pipeline_stats(self):
+        inbox = self._inbox.qsize() if self._loop is not None else 0
+        out = {"received": self.received, "processed": self.processed, "dropped": self.dropped,
+               "refused": self.refused,
+               "decode_errors": self.decode_errors, "duplicates": self.duplicates,
+               "batches": self.batches, "avg_batch": self.processed / self.batches if self.batches else 0.0,
+               "published": self.published, "queue_depth": inbox, "queue_high_water": self.inbox_high_water,
+               "overflow": len(self._overflow), "paused_connections": sum(c.paused for c in self._conns),
+               "overload": self.overload, "topics": self.topics, "connections": self.n_connections,
+               "status": self.status.stats()}
+        if self.model is not None and self.model.cache is not None:
+            out["prediction_cache"] = self.model.cache.stats()
+        if self.model is not None:
+            out["rules"] = self.model.rules.stats()
+        if self.anomaly is not None:
+            out["anomaly"] = self.anomaly.stats()
+        return out
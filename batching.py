@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects feature rows from many messages/devices and runs them through
+    ModelService.predict_batch together: a batch is closed after window_ms
+    (counted from its first row) or as soon as max_rows rows are waiting.
+    on_result(context, label) is called for every row, in submit order,
+    from the batcher thread.
+    """
+
+    def __init__(self, model, on_result, window_ms=20, max_rows=256, metrics=None):
+        self.model = model
+        self.metrics = metrics
+        self.on_result = on_result
+        self.window = max(0.0, window_ms / 1000.0)
+        self.max_rows = max(1, int(max_rows))
+
+        self._cond = threading.Condition()
+        self._items = []
+        self._first = 0.0
+        self._stop = False
+        self._thread = None
+
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, features, context):
+        with self._cond:
+            self._items.append((features, context))
+            n = len(self._items)
+            if n == 1:
+                self._first = time.monotonic()
+                self._cond.notify()
+            elif n >= self.max_rows:
+                self._cond.notify()
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._items)
+        avg = self.rows / self.batches if self.batches else 0.0
+        return {"batches": self.batches, "rows": self.rows, "avg_batch": avg, "pending": pending}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._stop:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                deadline = self._first + self.window
+                while len(self._items) < self.max_rows and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._items[:self.max_rows]
+                self._items = self._items[self.max_rows:]
+                if self._items:
+                    self._first = time.monotonic()
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            X = np.vstack([np.asarray(f, dtype=float).reshape(1, -1) for f, _ in batch])
+            t0 = time.perf_counter()
+            labels = self.model.predict_batch(X)
+            if self.metrics is not None:
+                self.metrics.observe("predict_batch", time.perf_counter() - t0)
+        except Exception as e:
+            print("[BATCH] AI prediction error:", e)
+            labels = ["GOOD"] * len(batch)
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, context), label in zip(batch, labels):
+            try:
+                self.on_result(context, label)
+            except Exception as e:
+                print("[BATCH] on_result error:", e)
@@ -0,0 +1,79 @@
+"""
+Anomaly detector cost vs fleet size, and what it catches.
+
+    python -m benchmarks.bench_anomaly [--devices 10,1000,10000] [--updates 400000] [--spike 0.002]
+
+Per fleet size: AnomalyDetector.update() latency percentiles, updates/s
+on one thread and state bytes per device; both should stay flat as the
+number of devices grows. On the same synthetic stream (gas spikes from
+benchmarks/synth.py) it also reports the share of spike readings scored
+>= threshold (recall) and the share of ordinary readings that were
+(false_positive_ratio), counting only devices past warmup.
+"""
+import argparse
+import time
+
+from anomaly import AnomalyDetector
+from benchmarks.common import percentiles, write_result
+from benchmarks.synth import generate
+
+SPIKE_GAS = (800.0, 2000.0)
+
+
+def run_one(rows, n_devices):
+    det = AnomalyDetector()
+    update = det.update
+    lat = []
+    scores = []
+    t0 = time.perf_counter()
+    for r in rows:
+        t = time.perf_counter()
+        scores.append(update(r["device"], r["ts"], r["temp"], r["hum"], r["gas"], r["heartrate"]))
+        lat.append((time.perf_counter() - t) * 1e6)
+    elapsed = time.perf_counter() - t0
+
+    spikes = hits = normal = false = 0
+    for i, (r, s) in enumerate(zip(rows, scores)):
+        if i // n_devices < det.warmup:
+            continue
+        if r["gas"] >= SPIKE_GAS[0]:
+            spikes += 1
+            hits += s >= det.threshold
+        else:
+            normal += 1
+            false += s >= det.threshold
+    stats = det.stats()
+    out = {"updates_per_s": len(rows) / elapsed, "bytes_per_device": stats["bytes_per_device"],
+           "recall": hits / spikes if spikes else None,
+           "false_positive_ratio": false / normal if normal else None, "by_source": stats["by_source"]}
+    out.update({f"update_us_{k}": v for k, v in percentiles(lat).items()})
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", default="10,1000,10000")
+    parser.add_argument("--updates", type=int, default=400000)
+    parser.add_argument("--spike", type=float, default=0.002, help="probability per reading that a gas spike starts")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {"updates": args.updates, "spike": args.spike, "cells": []}
+    for n in [int(d) for d in args.devices.split(",")]:
+        rows = generate(args.updates, n_devices=n, gas_spike=args.spike, hr_dropout=0.05, spike_gas=SPIKE_GAS)
+        cell = run_one(rows, n)
+        cell["devices"] = n
+        results["cells"].append(cell)
+        recall = "-" if cell["recall"] is None else f"{cell['recall']:.3f}"
+        fp = "-" if cell["false_positive_ratio"] is None else f"{cell['false_positive_ratio']:.4f}"
+        print(f"[BENCH] devices={n:>6,} update p50={cell['update_us_p50']:.1f}us p99={cell['update_us_p99']:.1f}us "
+              f"{cell['updates_per_s']:,.0f}/s {cell['bytes_per_device']:,.0f} B/device "
+              f"recall={recall} fp={fp}")
+
+    if not args.no_save:
+        write_result("anomaly", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
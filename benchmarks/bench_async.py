@@ -0,0 +1,114 @@
+"""
+Threaded MQTTRunner vs AsyncMQTTRunner against the in-process broker
+(local_broker.py).
+
+    python -m benchmarks.bench_async [--messages 20000] [--rates 2000,0] [--devices 50]
+
+Both runners connect over real TCP to LocalBroker; messages are injected
+at the broker at `rate` msg/s (0 = all at once). Reports throughput
+(first inject -> last stored record) and inject -> live-update latency
+from each runner's subscribe() feed. Per-message log lines are
+discarded while measuring.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+from async_runner import AsyncMQTTRunner
+from local_broker import LocalBroker
+from mqtt_client import MQTTRunner
+from benchmarks.common import percentiles, write_result
+from benchmarks.synth import generate
+
+
+def _consume(sub, sent_at, latency, done, expected):
+    seen = 0
+    while seen < expected:
+        rec = sub.get(timeout=30)
+        if rec is None:
+            break
+        t = sent_at.get((rec["device"], rec["ts"]))
+        if t is not None:
+            latency.append((time.perf_counter() - t) * 1000.0)
+        seen += 1
+    done.set()
+
+
+def run_one(kind, broker, rows, rate, args, workdir):
+    csv_path = os.path.join(workdir, f"{kind}.csv")
+    common = {"model_path": args.model, "csv_path": csv_path, "model_engine": args.engine}
+    if kind == "threaded":
+        runner = MQTTRunner("127.0.0.1", broker.port, workers=1, **common)
+    else:
+        runner = AsyncMQTTRunner("127.0.0.1", broker.port, topic_shards=args.topic_shards,
+                                 connections=args.connections, **common)
+    topics = ["SHHE/data"] if kind == "threaded" or not args.topic_shards else \
+        [f"SHHE/data/{i}" for i in range(args.topic_shards)]
+
+    sent_at, latency, done = {}, [], threading.Event()
+    sub = runner.subscribe(len(rows) + 1)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        runner.start()
+        time.sleep(1.0)   # CONNACK + SUBACK
+        consumer = threading.Thread(target=_consume, args=(sub, sent_at, latency, done, len(rows)), daemon=True)
+        consumer.start()
+        t0 = time.perf_counter()
+        for i, row in enumerate(rows):
+            if rate > 0:
+                delay = t0 + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent_at[(row["device"], row["ts"])] = time.perf_counter()
+            broker.inject(topics[i % len(topics)], json.dumps(row))
+        done.wait(120)
+        elapsed = time.perf_counter() - t0
+        runner.stop()
+    out = {"runner": kind, "offered_per_s": rate or None, "messages": len(rows),
+           "stored": len(latency), "throughput_per_s": len(latency) / elapsed}
+    out.update({f"latency_ms_{k}": v for k, v in percentiles(latency).items()})
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--engine", choices=["sklearn", "compiled"], default="compiled")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rates", default="2000,0", help="msg/s, 0 = as fast as the broker takes them")
+    parser.add_argument("--topic-shards", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=2)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    broker = LocalBroker().start()
+    workdir = tempfile.mkdtemp()
+    results = {"broker": "local_broker", "cells": []}
+    try:
+        for rate in [int(x) for x in args.rates.split(",")]:
+            n = args.messages if rate <= 0 else min(args.messages, rate * 5)
+            for kind in ("threaded", "async"):
+                # fresh device names per run: the model's duplicate filter is per process
+                rows = generate(n, n_devices=args.devices)
+                for r in rows:
+                    r["device"] = f"{kind}{rate}-{r['device']}"
+                cell = run_one(kind, broker, rows, rate, args, workdir)
+                results["cells"].append(cell)
+                print(f"[BENCH] {kind:8s} offered={rate or 'max':>6} stored={cell['stored']}/{n} "
+                      f"throughput={cell['throughput_per_s']:,.0f}/s p50={cell['latency_ms_p50']:.1f}ms "
+                      f"p99={cell['latency_ms_p99']:.1f}ms")
+    finally:
+        broker.stop()
+
+    if not args.no_save:
+        write_result("async_runner", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Batch feature backfill (feature_backfill.py) vs the streaming replay.
+
+    python -m benchmarks.bench_backfill [--rows 200000] [--devices 64]
+
+Builds the same 12 features for a synthetic history both ways, checks
+they are bit-identical, then times a full relabel (features + chunked
+predict_batch). Exits non-zero on any mismatch.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+import feature_backfill
+from model import ModelService
+from benchmarks.common import timed, write_result
+from benchmarks.synth import feature_matrix, generate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=64)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = generate(args.rows, n_devices=args.devices)
+    df = pd.DataFrame(rows)
+
+    stream, t_stream = timed(feature_matrix, ModelService(args.model), rows)
+    batch, t_batch = timed(feature_backfill.compute_features, df, repeat=3)
+    identical = bool(np.array_equal(stream, batch))
+
+    svc = ModelService(args.model)
+    labels, t_relabel = timed(feature_backfill.relabel, df, svc)
+    label_parity = labels == svc.predict_batch(stream)
+
+    results = {
+        "rows": args.rows,
+        "devices": args.devices,
+        "streaming_rows_per_s": args.rows / t_stream,
+        "batch_rows_per_s": args.rows / t_batch,
+        "speedup": t_stream / t_batch,
+        "relabel_rows_per_s": args.rows / t_relabel,
+        "features_identical": identical,
+        "labels_identical": label_parity,
+    }
+    print(f"[BENCH] features: streaming {results['streaming_rows_per_s']:,.0f} rows/s, "
+          f"batch {results['batch_rows_per_s']:,.0f} rows/s ({results['speedup']:.1f}x), identical={identical}")
+    print(f"[BENCH] relabel: {results['relabel_rows_per_s']:,.0f} rows/s, labels identical={label_parity}")
+
+    if not args.no_save:
+        write_result("backfill", results)
+    if not (identical and label_parity):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
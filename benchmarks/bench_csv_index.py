@@ -0,0 +1,143 @@
+"""
+Range queries on data.csv with and without the sparse index.
+
+    python -m benchmarks.bench_csv_index [--sizes 10000,100000,1000000] [--devices 20] [--window-h 2]
+
+For each history size: the time to index an existing file from scratch,
+the sidecar size, the flush rate of CsvStore with index=True against a
+plain one, and the time of "one device over --window-h hours" via the
+index (CsvIndex.query) and via a full read_csv + filter (CsvStore.read).
+The indexed query should stay flat as the file grows; the full read
+grows with it. Before that, check_formats() asserts that indexed and full
+reads agree on timestamps devices send in other shapes.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from csv_index import CsvIndex
+from storage import CsvStore, _coerce, _filter
+from benchmarks.common import timed, write_result
+from benchmarks.synth import generate, write_history
+
+START = datetime(2025, 1, 1)
+
+
+# ts shapes a device may send instead of "YYYY-MM-DD HH:MM:SS"
+TS_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "garbage-%H"]
+
+
+def check_formats(workdir):
+    """Indexed and plain CsvStore.read must return the same rows whatever the ts looks like."""
+    for fmt in TS_FORMATS:
+        path = os.path.join(workdir, "formats.csv")
+        for p in (path, path + ".idx"):
+            if os.path.exists(p):
+                os.remove(p)
+        rows = [dict(r, ts=(START + timedelta(minutes=30 * i)).strftime(fmt))
+                for i, r in enumerate(generate(40, n_devices=2, start=START))]
+        store = CsvStore(path, index=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.open_writer()
+        for row in rows:
+            store.append(dict(row, ai="GOOD"))
+        store.flush(timeout=30)
+        for device, since, until in [("dev-001", "2025-01-01 02:00", "2025-01-01 05:00"),
+                                     ("dev-000", None, "2025-01-01 01:00"), (None, "2025-01-01 09:00", None)]:
+            indexed = store.read(device=device, since=since, until=until)
+            full = _coerce(pd.read_csv(path))
+            full = _filter(full, device=device, since=since, until=until)
+            assert len(indexed) == len(full), (fmt, device, since, until, len(indexed), len(full))
+        store.close()
+
+
+def _flush_rate(path, rows, index):
+    store = CsvStore(path, index=index)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.open_writer()
+    t0 = time.perf_counter()
+    for row in rows:
+        store.append(row)
+    store.flush(timeout=300)
+    elapsed = time.perf_counter() - t0
+    store.close()
+    return len(rows) / elapsed
+
+
+def run_one(history_csv, n, args, appends, workdir):
+    path = os.path.join(workdir, "data.csv")
+    shutil.copyfile(history_csv, path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        idx = CsvIndex(path, writable=True)
+        build = time.perf_counter() - t0
+    stats = idx.stats()
+    idx.close()
+
+    # a window in the middle of the history (or its start, for small files)
+    span_s = n // args.devices
+    since = START + timedelta(seconds=max(0, span_s // 2 - args.window_h * 1800))
+    until = since + timedelta(hours=args.window_h)
+    device = "dev-001"
+    reader = CsvIndex(path)
+    indexed, indexed_s = timed(reader.query, device, since, until, repeat=args.repeat)
+    full, full_s = timed(CsvStore(path).read, device=device, since=since, until=until, repeat=args.repeat)
+    assert len(indexed) == len(full), (len(indexed), len(full))
+    read_bytes = sum(e - s for s, e in reader.ranges(device, since, until))
+
+    plain_csv = os.path.join(workdir, "plain.csv")
+    shutil.copyfile(history_csv, plain_csv)
+    return {"history_rows": n, "file_bytes": os.path.getsize(path), "build_s": build,
+            "sidecar_bytes": stats["sidecar_bytes"], "ranges": stats["ranges"],
+            "result_rows": len(indexed), "read_bytes": read_bytes,
+            "query_indexed_s": indexed_s, "query_full_s": full_s,
+            "flush_rows_per_s_indexed": _flush_rate(path, appends, True),
+            "flush_rows_per_s_plain": _flush_rate(plain_csv, appends, False)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--window-h", type=int, default=2)
+    parser.add_argument("--appends", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    history = generate(max(sizes), n_devices=args.devices, start=START)
+    after = START + timedelta(seconds=len(history) // args.devices + 1)
+    appends = [dict(r, ai="GOOD", heartrate=r["heartrate"] or 0)
+               for r in generate(args.appends, n_devices=args.devices, seed=1, start=after)]
+
+    workdir = tempfile.mkdtemp()
+    results = {"devices": args.devices, "window_h": args.window_h, "cells": []}
+    try:
+        check_formats(workdir)
+        for n in sizes:
+            history_csv = write_history(os.path.join(workdir, "history.csv"), history[:n])
+            cell = run_one(history_csv, n, args, appends, workdir)
+            results["cells"].append(cell)
+            print(f"[BENCH] history={n:>9,} ({cell['file_bytes'] / 1e6:6.1f} MB) build={cell['build_s']:.2f}s "
+                  f"sidecar={cell['sidecar_bytes'] / 1e3:.1f} kB query indexed={cell['query_indexed_s'] * 1000:.1f}ms "
+                  f"full={cell['query_full_s'] * 1000:.1f}ms ({cell['result_rows']} rows, "
+                  f"{cell['read_bytes'] / 1e3:.0f} kB read) flush {cell['flush_rows_per_s_indexed']:,.0f} vs "
+                  f"{cell['flush_rows_per_s_plain']:,.0f} rows/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not args.no_save:
+        write_result("csv_index", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
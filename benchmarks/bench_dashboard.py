@@ -0,0 +1,103 @@
+"""
+Dashboard data-prep time vs history length.
+
+    python -m benchmarks.bench_dashboard [--sizes 1000,10000,100000,1000000] [--devices 20]
+
+For each history size, a data.csv in the writer's format and the steps
+app.py's load_live_data / trend chart run on it:
+
+  tail_*        TailCache path (csv backend): first refresh (cold start),
+                frame(), aggregates(), series() for all / last hour, and
+                a refresh after 100 new rows
+  store_read_*  store.read() + aggregates_from_frame + downsample_frame,
+                the path for the other backends / HISTORY_HOURS
+  naive_read_s  plain pd.read_csv of the whole file, for reference
+
+Only the cold refresh and the store.read path should grow with the
+history; everything a rerun does should stay flat.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from dashboard_data import TailCache, aggregates_from_frame
+from downsample import downsample_frame
+from storage import CsvStore
+from telemetry_writer import TelemetryWriter
+from benchmarks.common import timed, write_result
+from benchmarks.synth import generate, write_history
+
+TAIL_ROWS = 2000
+CHART_POINTS = 1000
+
+
+def _append(path, rows):
+    writer = TelemetryWriter(path, fsync="never").start()
+    for r in rows:
+        writer.append(dict(r, ai="GOOD"))
+    writer.close()
+
+
+def run_one(path, extra):
+    out = {}
+    _, out["tail_cold_refresh_s"] = timed(lambda: TailCache(path, capacity=TAIL_ROWS).refresh())
+    cache = TailCache(path, capacity=TAIL_ROWS)
+    cache.refresh()
+    _, out["tail_frame_s"] = timed(cache.frame, repeat=5)
+    _, out["tail_aggregates_s"] = timed(cache.aggregates, repeat=5)
+    _, out["tail_series_all_s"] = timed(cache.series, points=CHART_POINTS, repeat=5)
+    span = cache.span()
+    since = span[1] - 3600 if span else None
+    _, out["tail_series_1h_s"] = timed(cache.series, since=since, points=CHART_POINTS, repeat=5)
+    _, out["tail_noop_refresh_s"] = timed(cache.refresh, repeat=5)
+    _append(path, extra)
+    _, out["tail_incremental_refresh_s"] = timed(cache.refresh)
+
+    def store_path():
+        df = CsvStore(path).read()
+        aggregates_from_frame(df)
+        return downsample_frame(df, CHART_POINTS)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, out["store_read_prep_s"] = timed(store_path)
+    _, out["naive_read_s"] = timed(pd.read_csv, path)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    history = generate(max(sizes), n_devices=args.devices, hr_dropout=0.02, gas_spike=0.005)
+    workdir = tempfile.mkdtemp()
+    results = {"devices": args.devices, "tail_rows": TAIL_ROWS, "chart_points": CHART_POINTS, "cells": []}
+    try:
+        for n in sizes:
+            path = write_history(os.path.join(workdir, "data.csv"), history[:n])
+            start = datetime(2025, 1, 1) + timedelta(seconds=n // args.devices + 1)
+            extra = generate(100, n_devices=args.devices, seed=1, start=start)
+            cell = run_one(path, extra)
+            cell["history_rows"] = n
+            results["cells"].append(cell)
+            print(f"[BENCH] history={n:>9,} " + " ".join(
+                f"{k[:-2]}={v * 1000:.1f}ms" for k, v in cell.items() if k.endswith("_s")))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not args.no_save:
+        write_result("dashboard", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
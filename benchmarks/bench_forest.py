@@ -0,0 +1,98 @@
+"""
+sklearn RandomForest vs compiled forest (forest_compiler.py).
+
+    python -m benchmarks.bench_forest [--model models/smarthealth_retrained.pkl] [--csv data.csv]
+
+Checks prediction parity on recorded rows (data.csv, or synthetic rows
+when the CSV is too short), then reports single-row latency and batch
+throughput for both engines. Exits non-zero if the engines disagree.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from forest_compiler import export_npz
+from model import ModelService
+from benchmarks.common import percentiles, timed, write_result
+from benchmarks.synth import feature_matrix, generate
+
+
+def load_rows(csv_path, n_rows, min_rows=500):
+    if csv_path and os.path.exists(csv_path):
+        df = pd.read_csv(csv_path)
+        if len(df) >= min_rows:
+            df = df.tail(n_rows)
+            print(f"[BENCH] using {len(df)} recorded rows from {csv_path}")
+            return df[["device", "ts", "temp", "hum", "gas", "heartrate"]].to_dict("records")
+    print(f"[BENCH] using {n_rows} synthetic rows")
+    return generate(n_rows, n_devices=8)
+
+
+def single_row_latency(svc, X, n):
+    lat = []
+    for i in range(min(n, len(X))):
+        t0 = time.perf_counter()
+        svc.predict_from_features(X[i:i + 1])
+        lat.append((time.perf_counter() - t0) * 1e6)
+    return percentiles(lat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--csv", default="data.csv")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--single", type=int, default=300, help="rows for the single-row latency loop")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = load_rows(args.csv, args.rows)
+    sk = ModelService(args.model)
+    X = feature_matrix(ModelService(args.model), rows)
+
+    npz = os.path.join(tempfile.mkdtemp(), "forest.npz")
+    export_npz(args.model, npz)
+    _, load_s = timed(ModelService, args.model, engine="compiled", compiled_path=npz)
+    comp = ModelService(args.model, engine="compiled", compiled_path=npz)
+
+    # ---------------- parity ----------------
+    Xs_sk = sk._prepare(X)
+    Xs_c = comp._prepare(X)
+    raw_sk = sk.model.predict(Xs_sk)
+    raw_c = comp.compiled.predict(Xs_c)
+    proba_diff = float(np.abs(sk.model.predict_proba(Xs_sk) - comp.compiled.predict_proba(Xs_c)).max())
+    labels_sk = sk.predict_batch(X)
+    labels_c = comp.predict_batch(X)
+    parity = {
+        "rows": len(X),
+        "forest_mismatches": int((raw_sk != raw_c).sum()),
+        "label_mismatches": int(sum(a != b for a, b in zip(labels_sk, labels_c))),
+        "max_proba_diff": proba_diff,
+    }
+    print(f"[BENCH] parity: {parity}")
+
+    # ---------------- speed ----------------
+    results = {"parity": parity, "compiled_load_s": load_s, "engines": {}}
+    for name, svc in (("sklearn", sk), ("compiled", comp)):
+        eng = {"single_row_us": single_row_latency(svc, X, args.single), "batch": {}}
+        for bs in (1, 64, 256, 4096):
+            bs = min(bs, len(X))
+            _, t = timed(svc.predict_batch, X[:bs], repeat=3)
+            eng["batch"][str(bs)] = {"seconds": t, "rows_per_s": bs / t if t else 0.0}
+        results["engines"][name] = eng
+        print(f"[BENCH] {name:8s} single p50={eng['single_row_us']['p50']:.0f}us "
+              + " ".join(f"bs{k}={v['rows_per_s']:.0f}/s" for k, v in eng["batch"].items()))
+
+    if not args.no_save:
+        write_result("forest", results)
+    ok = parity["forest_mismatches"] == 0 and parity["label_mismatches"] == 0
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
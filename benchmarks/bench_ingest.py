@@ -0,0 +1,102 @@
+"""
+Messages/s through MQTTRunner._on_message, without a broker.
+
+    python -m benchmarks.bench_ingest [--messages 5000] [--devices 20] [--hr-dropout 0.05] [--gas-spike 0.01]
+
+Each configuration builds a fresh MQTTRunner (never started, so nothing
+connects) writing to a temp data.csv, feeds it raw SHHE/data payloads
+the way paho would and waits until every message is stored or rejected
+as a duplicate. Reports msg/s and the per-stage p50s from the runner's
+own metrics (histogram bucket upper bounds, so coarse). Per-message log lines are discarded while measuring.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from mqtt_client import MQTTRunner
+from benchmarks.common import write_result
+from benchmarks.synth import generate, payloads
+
+CONFIGS = [
+    # name, MQTTRunner kwargs
+    ("inline", {"workers": 0}),
+    ("workers=1", {"workers": 1}),
+    ("workers=1 batch=5ms", {"workers": 1, "batch_window_ms": 5}),
+    ("inline cache", {"workers": 0, "prediction_cache": {"capacity": 4096}}),
+]
+
+
+def _settled(runner):
+    counters = runner.metrics.snapshot()["counters"]
+    done = 0
+    for name in ("messages_processed", "duplicates"):
+        done += counters.get(name, {}).get("total", 0)
+    return done
+
+
+def run_one(model, engine, kwargs, raw, workdir):
+    csv_path = os.path.join(workdir, "ingest.csv")
+    if os.path.exists(csv_path):
+        os.remove(csv_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner = MQTTRunner("127.0.0.1", 1883, model_path=model, csv_path=csv_path,
+                            model_engine=engine, **kwargs)
+        on_message = runner._on_message
+        t0 = time.perf_counter()
+        for payload in raw:
+            on_message(None, None, SimpleNamespace(payload=payload))
+        deadline = time.monotonic() + 300
+        while _settled(runner) < len(raw) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - t0
+        snap = runner.get_metrics()
+        cache = runner.get_pipeline_stats().get("prediction_cache")
+        runner.stop()
+    counters = snap["counters"]
+    return {
+        "messages": len(raw),
+        "processed": counters.get("messages_processed", {}).get("total", 0),
+        "duplicates": counters.get("duplicates", {}).get("total", 0),
+        "msg_per_s": len(raw) / elapsed,
+        "stage_p50_us": {k: v["p50_s"] * 1e6 for k, v in sorted(snap["stages"].items())},
+        "cache_hit_ratio": cache["hit_ratio"] if cache else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--engines", default="sklearn,compiled")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--hr-dropout", type=float, default=0.05)
+    parser.add_argument("--gas-spike", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = generate(args.messages, n_devices=args.devices, seed=args.seed,
+                    hr_dropout=args.hr_dropout, gas_spike=args.gas_spike)
+    raw = payloads(rows)
+    workdir = tempfile.mkdtemp()
+    results = {"messages": args.messages, "devices": args.devices, "seed": args.seed,
+               "hr_dropout": args.hr_dropout, "gas_spike": args.gas_spike, "cells": []}
+    for engine in args.engines.split(","):
+        for name, kwargs in CONFIGS:
+            cell = run_one(args.model, engine, kwargs, raw, workdir)
+            cell.update({"engine": engine, "config": name})
+            results["cells"].append(cell)
+            stages = " ".join(f"{k}={v:.0f}us" for k, v in cell["stage_p50_us"].items())
+            print(f"[BENCH] {engine:8s} {name:20s} {cell['msg_per_s']:>9,.0f} msg/s  {stages}")
+
+    if not args.no_save:
+        write_result("ingest", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
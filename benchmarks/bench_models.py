@@ -0,0 +1,101 @@
+"""
+Single-row vs batch inference latency for every model in models/.
+
+    python -m benchmarks.bench_models [--rows 2000] [--batches 1,32,256] [--engines sklearn,compiled]
+
+Features come from replaying synthetic readings through
+ModelService.compute_features, so every model sees realistic inputs.
+Single-row: predict_from_features per row (what the inline ingest path
+does). Batch: predict_batch over chunks of each size (what MicroBatcher
+and the backfill do), reported per row.
+
+A model whose forest does not take ModelService's 12 features (the
+older smarthealth_rf.pkl is a bare 9-feature classifier) cannot run
+the full pipeline; it is timed as the bare estimator on the leading
+columns and marked "pipeline": "estimator".
+"""
+import argparse
+import time
+import warnings
+
+from model import FEATURE_NAMES, ModelService
+from model_registry import available_models, load_model_data
+from benchmarks.common import percentiles, timed, write_result
+from benchmarks.synth import feature_matrix, generate
+
+
+class _Estimator:
+    """predict_from_features / predict_batch over the bare forest (no scaler, no rules)."""
+
+    def __init__(self, model, engine):
+        self.n = model.n_features_in_
+        if engine == "compiled":
+            from forest_compiler import CompiledForest
+            model = CompiledForest.from_model(model, None)
+        self.forest = model
+
+    def predict_batch(self, X):
+        return self.forest.predict(X[:, :self.n])
+
+    def predict_from_features(self, X):
+        return self.predict_batch(X)[0]
+
+
+def _service(path, engine):
+    model = load_model_data(path)["model"]
+    if getattr(model, "n_features_in_", len(FEATURE_NAMES)) == len(FEATURE_NAMES):
+        return ModelService(path, engine=engine), "model_service"
+    return _Estimator(model, engine), "estimator"
+
+
+def single_row(svc, X):
+    lat = []
+    for i in range(len(X)):
+        t0 = time.perf_counter()
+        svc.predict_from_features(X[i:i + 1])
+        lat.append((time.perf_counter() - t0) * 1e6)
+    return lat
+
+
+def batched(svc, X, size):
+    for i in range(0, len(X), size):
+        svc.predict_batch(X[i:i + size])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", default="models/*.pkl")
+    parser.add_argument("--engines", default="sklearn,compiled")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--batches", default="1,32,256")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    # the estimator-only path feeds plain arrays to forests fitted on frames
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    rows = generate(args.rows, n_devices=args.devices, gas_spike=0.02)
+    results = {"rows": args.rows, "cells": []}
+    for path in available_models(args.models):
+        X = feature_matrix(ModelService(path), rows)
+        for engine in args.engines.split(","):
+            svc, pipeline = _service(path, engine)
+            svc.predict_from_features(X[:1])   # warm-up
+            lat = single_row(svc, X)
+            cell = {"model": path, "engine": engine, "pipeline": pipeline,
+                    "single_row_us": percentiles(lat)}
+            for size in [int(b) for b in args.batches.split(",")]:
+                _, t = timed(batched, svc, X, size, repeat=3)
+                cell[f"batch_{size}_us_per_row"] = t / len(X) * 1e6
+            results["cells"].append(cell)
+            batches = " ".join(f"{k[6:-11]}:{v:.1f}us" for k, v in cell.items() if k.startswith("batch_"))
+            print(f"[BENCH] {path} {engine:8s} {pipeline:13s} single p50={cell['single_row_us']['p50']:.0f}us "
+                  f"p99={cell['single_row_us']['p99']:.0f}us | batch per row {batches}")
+
+    if not args.no_save:
+        write_result("models", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
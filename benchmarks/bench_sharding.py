@@ -0,0 +1,139 @@
+"""
+Load generator for sharded inference (sharding.py): devices x message
+rate x shard count.
+
+    python -m benchmarks.bench_sharding [--shards 1,2,4] [--devices 10,100,1000] [--rates 2000,10000,0]
+
+Each cell offers `rate` msg/s (0 = as fast as possible, a burst of
+--burst messages) spread round-robin over `devices` for --seconds, then
+waits for the last result. Reports achieved throughput and submit ->
+on_result latency. The baseline row is the in-process path (one
+ModelService, compute_features + predict_from_features per message),
+which is what a single pipeline worker does.
+"""
+import argparse
+import os
+import threading
+import time
+
+from model import ModelService
+from sharding import ShardedInference
+from benchmarks.common import percentiles, write_result
+from benchmarks.synth import generate
+
+
+def make_rows(n_rows, n_devices, prefix):
+    rows = generate(n_rows, n_devices=n_devices, seed=n_devices)
+    for r in rows:
+        r["device"] = f"{prefix}-{r['device']}"
+    return rows
+
+
+def baseline(model, engine, rows):
+    svc = ModelService(model, engine=engine)
+    t0 = time.perf_counter()
+    for r in rows:
+        if svc.state.accept_ts(r["device"], r["ts"]):
+            svc.predict_from_features(svc.compute_features(r["device"], r["temp"], r["hum"], r["gas"],
+                                                           r["ts"], r["heartrate"]))
+    return len(rows) / (time.perf_counter() - t0)
+
+
+class _Sink:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.count = 0
+        self.latency = []
+
+    def __call__(self, record, label):
+        now = time.perf_counter()
+        with self.cond:
+            self.latency.append((now - record["_t0"]) * 1000.0)
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait_for(self, n, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.count < n and time.monotonic() < deadline:
+                self.cond.wait(0.1)
+            return self.count >= n
+
+
+def run_cell(engine, sink, rows, rate, seconds):
+    sink.count, sink.latency = 0, []
+    t0 = time.perf_counter()
+    sent = 0
+    if rate <= 0:
+        for r in rows:
+            r["_t0"] = time.perf_counter()
+            engine.submit(r)
+        sent = len(rows)
+    else:
+        end = t0 + seconds
+        while sent < len(rows):
+            now = time.perf_counter()
+            if now >= end:
+                break
+            due = min(len(rows), int((now - t0) * rate))
+            while sent < due:
+                rows[sent]["_t0"] = time.perf_counter()
+                engine.submit(rows[sent])
+                sent += 1
+            time.sleep(0.001)
+    complete = sink.wait_for(sent, timeout=120)
+    elapsed = time.perf_counter() - t0
+    out = {"offered_per_s": rate or None, "sent": sent, "received": sink.count,
+           "complete": complete, "achieved_per_s": sink.count / elapsed}
+    out.update({f"latency_ms_{k}": v for k, v in percentiles(sink.latency).items()})
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--engine", choices=["sklearn", "compiled"], default="compiled")
+    parser.add_argument("--shards", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    parser.add_argument("--devices", default="10,100,1000")
+    parser.add_argument("--rates", default="2000,10000,0", help="msg/s per cell, 0 = unthrottled burst")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--burst", type=int, default=50000)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    shard_counts = [int(x) for x in args.shards.split(",")]
+    device_counts = [int(x) for x in args.devices.split(",")]
+    rates = [int(x) for x in args.rates.split(",")]
+
+    base = baseline(args.model, args.engine, make_rows(min(args.burst, 20000), 100, "base"))
+    print(f"[BENCH] in-process baseline: {base:,.0f} msg/s")
+    results = {"engine": args.engine, "baseline_per_s": base, "cells": []}
+
+    for n in shard_counts:
+        sink = _Sink()
+        engine = ShardedInference(args.model, sink, shards=n, engine=args.engine).start()
+        # first batch pays for the workers importing numpy/sklearn
+        warm = make_rows(n * 64, n * 8, f"warm{n}")
+        for r in warm:
+            r["_t0"] = time.perf_counter()
+            engine.submit(r)
+        sink.wait_for(len(warm), timeout=120)
+        for devices in device_counts:
+            for rate in rates:
+                n_rows = args.burst if rate <= 0 else int(rate * args.seconds)
+                rows = make_rows(n_rows, devices, f"s{n}d{devices}r{rate}")
+                cell = run_cell(engine, sink, rows, rate, args.seconds)
+                cell.update({"shards": n, "devices": devices})
+                results["cells"].append(cell)
+                print(f"[BENCH] shards={n} devices={devices:5d} offered={rate or 'max':>6} "
+                      f"achieved={cell['achieved_per_s']:,.0f}/s p50={cell['latency_ms_p50']:.1f}ms "
+                      f"p99={cell['latency_ms_p99']:.1f}ms")
+        results.setdefault("stats", {})[str(n)] = engine.stats()
+        engine.close()
+
+    if not args.no_save:
+        write_result("sharding", results)
+
+
+if __name__ == "__main__":
+    main()
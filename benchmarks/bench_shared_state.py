@@ -0,0 +1,129 @@
+"""
+Shared-memory latest-state table: reader throughput while a writer
+hammers the same slots.
+
+    python -m benchmarks.bench_shared_state [--readers 4] [--devices 64] [--seconds 3]
+
+The writer stores the same counter in temp/hum/gas/heartrate of every
+update, so a reader that ever sees those four differ has observed a
+torn slot. Each reader process does point reads (random device) for
+half the time and full-table snapshots for the other half.
+"""
+import argparse
+import multiprocessing as mp
+import random
+import time
+
+from benchmarks.common import write_result
+
+
+def _writer(name, devices, stop, out):
+    from shared_state import SharedStateTable
+    table = SharedStateTable.attach(name)
+    table.owner = False
+    # reuse the slots the parent pre-created so device -> slot is stable
+    table._index = {f"dev{i}".encode(): i for i in range(devices)}
+    n = 0
+    t0 = time.perf_counter()
+    while not stop.is_set():
+        v = float(n)
+        table.update(f"dev{n % devices}", 1.7e9 + n, v, v, v, v, "GOOD")
+        n += 1
+    out.put({"role": "writer", "updates": n, "seconds": time.perf_counter() - t0})
+    table.close()
+
+
+def _reader(name, devices, seconds, seed, out):
+    from shared_state import SharedStateTable
+    table = SharedStateTable.attach(name)
+    rng = random.Random(seed)
+    keys = [f"dev{i}" for i in range(devices)]
+    torn = 0
+
+    reads = 0
+    t0 = time.perf_counter()
+    end = t0 + seconds / 2
+    while time.perf_counter() < end:
+        rec = table.read(keys[rng.randrange(devices)])
+        if not (rec["temp"] == rec["hum"] == rec["gas"] == rec["heartrate"]):
+            torn += 1
+        reads += 1
+    read_s = time.perf_counter() - t0
+    read_retries = table.retries
+
+    snaps = 0
+    t0 = time.perf_counter()
+    end = t0 + seconds / 2
+    while time.perf_counter() < end:
+        snap = table.snapshot()
+        torn += int(((snap["temp"] != snap["hum"]) | (snap["gas"] != snap["heartrate"])
+                     | (snap["temp"] != snap["gas"])).sum())
+        snaps += 1
+    snap_s = time.perf_counter() - t0
+    out.put({"role": "reader", "reads": reads, "read_s": read_s, "read_retries": read_retries,
+             "snapshots": snaps, "snapshot_s": snap_s, "snapshot_retries": table.retries - read_retries,
+             "torn": torn})
+    table.close()
+
+
+def run(readers, devices, seconds, with_writer=True):
+    from shared_state import SharedStateTable
+    table = SharedStateTable.create(n_slots=max(devices, 1))
+    for i in range(devices):
+        table.update(f"dev{i}", 1.7e9, 0.0, 0.0, 0.0, 0.0, "GOOD")
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    stop = ctx.Event()
+    procs = []
+    if with_writer:
+        procs.append(ctx.Process(target=_writer, args=(table.name, devices, stop, out)))
+    procs += [ctx.Process(target=_reader, args=(table.name, devices, seconds, i, out)) for i in range(readers)]
+    for p in procs:
+        p.start()
+    reports = [out.get() for _ in range(readers)]
+    stop.set()
+    if with_writer:
+        reports.append(out.get())
+    for p in procs:
+        p.join()
+    table.close()
+
+    rs = [r for r in reports if r["role"] == "reader"]
+    w = [r for r in reports if r["role"] == "writer"]
+    return {
+        "readers": readers,
+        "devices": devices,
+        "writer_updates_per_s": w[0]["updates"] / w[0]["seconds"] if w else 0.0,
+        "reads_per_s_per_reader": sum(r["reads"] / r["read_s"] for r in rs) / len(rs),
+        "reads_per_s_total": sum(r["reads"] / r["read_s"] for r in rs),
+        "snapshots_per_s_per_reader": sum(r["snapshots"] / r["snapshot_s"] for r in rs) / len(rs),
+        "read_retry_rate": sum(r["read_retries"] for r in rs) / max(1, sum(r["reads"] for r in rs)),
+        "snapshot_retries": sum(r["snapshot_retries"] for r in rs),
+        "torn": sum(r["torn"] for r in rs),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label, with_writer in (("idle_writer", False), ("busy_writer", True)):
+        r = run(args.readers, args.devices, args.seconds, with_writer)
+        results[label] = r
+        print(f"[BENCH] {label:12s} writer={r['writer_updates_per_s']:,.0f}/s "
+              f"reads={r['reads_per_s_per_reader']:,.0f}/s/reader "
+              f"snapshots={r['snapshots_per_s_per_reader']:,.0f}/s/reader "
+              f"retry_rate={r['read_retry_rate']:.4f} torn={r['torn']}")
+
+    if not args.no_save:
+        write_result("shared_state", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Startup cost: import, model load and first prediction, cold and warm.
+
+    python -m benchmarks.bench_startup [--model models/smarthealth_retrained.pkl] [--runs 3]
+
+"cold" runs each measurement in a fresh interpreter; "warm" repeats it
+inside the same process, where model_registry already holds the model.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.common import write_result
+
+_PROBE = r"""
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+model_path, engine = sys.argv[1], sys.argv[2]
+out = {}
+t = time.perf_counter(); import mqtt_client; out["import_s"] = time.perf_counter() - t
+from model import ModelService
+import numpy as np
+x = np.zeros((1, 12))
+for phase in ("cold", "warm"):
+    t = time.perf_counter(); svc = ModelService(model_path, engine=engine)
+    out[phase + "_model_load_s"] = time.perf_counter() - t
+    t = time.perf_counter(); svc.predict_from_features(x)
+    out[phase + "_first_predict_s"] = time.perf_counter() - t
+t = time.perf_counter(); import streamlit; out["import_streamlit_s"] = time.perf_counter() - t
+print(json.dumps(out))
+"""
+
+
+def probe(model_path, engine):
+    proc = subprocess.run([sys.executable, "-c", _PROBE, model_path, engine],
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for engine in ("sklearn", "compiled"):
+        runs = [probe(args.model, engine) for _ in range(args.runs)]
+        best = {k: min(r[k] for r in runs) for k in runs[0]}
+        results[engine] = {"best": best, "runs": runs}
+        print(f"[BENCH] {engine:8s} " + " ".join(f"{k}={v * 1000:.1f}ms" for k, v in best.items()))
+
+    if not args.no_save:
+        write_result("startup", results)
+
+
+if __name__ == "__main__":
+    main()
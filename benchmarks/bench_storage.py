@@ -0,0 +1,100 @@
+"""
+Storage append cost vs history size.
+
+    python -m benchmarks.bench_storage [--sizes 0,10000,100000,1000000] [--appends 5000] [--backends csv,parquet]
+
+For each pre-filled history size: time to open the store (header check
+and crash recovery of the tail), the per-call cost of store.append()
+(what MQTTRunner._append_csv pays on the ingest thread) and the rows/s
+until everything is flushed to disk. Append cost should not grow with
+the size of the file.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from storage import CsvStore, ParquetStore, migrate_csv
+from benchmarks.common import percentiles, write_result
+from benchmarks.synth import generate, write_history
+
+
+def _fixture(kind, history_csv, workdir):
+    if kind == "csv":
+        path = os.path.join(workdir, "data.csv")
+        shutil.copyfile(history_csv, path)
+        return path
+    root = os.path.join(workdir, "data_store")
+    shutil.rmtree(root, ignore_errors=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate_csv(history_csv, root)
+    return root
+
+
+def _size_on_disk(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def run_one(kind, history_csv, rows, workdir):
+    path = _fixture(kind, history_csv, workdir)
+    t0 = time.perf_counter()
+    store = CsvStore(path) if kind == "csv" else ParquetStore(path)
+    store.open_writer()
+    opened = time.perf_counter() - t0
+
+    lat = []
+    t0 = time.perf_counter()
+    for row in rows:
+        t = time.perf_counter()
+        store.append(row)
+        lat.append((time.perf_counter() - t) * 1e6)
+    store.flush(timeout=300)
+    elapsed = time.perf_counter() - t0
+    store.close()
+    out = {"open_s": opened, "rows_per_s": len(rows) / elapsed, "bytes": _size_on_disk(path)}
+    out.update({f"append_us_{k}": v for k, v in percentiles(lat).items()})
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="0,10000,100000,1000000")
+    parser.add_argument("--appends", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--backends", default="csv,parquet")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    history = generate(max(sizes), n_devices=args.devices)
+    start = datetime(2025, 1, 1) + timedelta(seconds=len(history) // args.devices + 1)
+    rows = [dict(r, ai="GOOD") for r in generate(args.appends, n_devices=args.devices, seed=1, start=start)]
+
+    workdir = tempfile.mkdtemp()
+    results = {"appends": args.appends, "devices": args.devices, "cells": []}
+    try:
+        for n in sizes:
+            history_csv = write_history(os.path.join(workdir, "history.csv"), history[:n])
+            for kind in args.backends.split(","):
+                cell = run_one(kind, history_csv, rows, workdir)
+                cell.update({"backend": kind, "history_rows": n})
+                results["cells"].append(cell)
+                print(f"[BENCH] {kind:8s} history={n:>9,} open={cell['open_s'] * 1000:7.1f}ms "
+                      f"append p50={cell['append_us_p50']:.1f}us p99={cell['append_us_p99']:.1f}us "
+                      f"flushed={cell['rows_per_s']:,.0f} rows/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not args.no_save:
+        write_result("storage", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
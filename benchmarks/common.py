@@ -0,0 +1,52 @@
+"""Shared helpers for the benchmark scripts (run them from the repo root: python -m benchmarks.<name>)."""
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def timed(fn, *args, repeat=1, **kwargs):
+    """Run fn `repeat` times, return (last result, best wall time in seconds)."""
+    best = float("inf")
+    out = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def percentiles(samples, ps=(50, 90, 99)):
+    if not samples:
+        return {f"p{p}": 0.0 for p in ps}
+    s = sorted(samples)
+    return {f"p{p}": s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))] for p in ps}
+
+
+def environment():
+    import numpy as np
+    env = {"python": sys.version.split()[0], "platform": platform.platform(),
+           "cpus": os.cpu_count(), "numpy": np.__version__}
+    try:
+        import sklearn
+        env["sklearn"] = sklearn.__version__
+    except ImportError:
+        pass
+    return env
+
+
+def write_result(name, results, out_dir=None):
+    """Store one benchmark run as JSON: <out_dir>/<name>-<UTC timestamp>.json."""
+    out_dir = out_dir or RESULTS_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(out_dir, f"{name}-{stamp}.json")
+    doc = {"benchmark": name, "created": stamp, "env": environment(), "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, default=float)
+    print(f"[BENCH] wrote {path}")
+    return path
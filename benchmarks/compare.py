@@ -0,0 +1,91 @@
+"""
+Compare two benchmark result files (any bench_* output or a run_all suite).
+
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 0.10]
+
+Numbers are matched by path; entries of a "cells" list are matched by
+their identifying fields (engine, config, backend, model, history_rows,
+...). Keys ending in _s / _us / _ms are costs (lower is better), keys
+containing per_s are rates (higher is better). Changes worse than
+--threshold are flagged REGRESSION and make the exit status 1.
+"""
+import argparse
+import json
+import sys
+
+_ID_KEYS = ("runner", "offered_per_s", "engine", "config", "pipeline", "backend", "model", "history_rows", "devices")
+
+
+def _cell_id(cell):
+    return ",".join(f"{k}={cell[k]}" for k in _ID_KEYS if k in cell) or "?"
+
+
+def flatten(obj, prefix=""):
+    """{dotted path: number} for every numeric leaf."""
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(flatten(v, f"{prefix}{k}."))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            key = _cell_id(v) if isinstance(v, dict) else str(i)
+            out.update(flatten(v, f"{prefix}[{key}]."))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix[:-1]] = float(obj)
+    return out
+
+
+def direction(path):
+    """+1 if higher is better, -1 if lower is better, 0 if not a measurement."""
+    leaf = path.rsplit(".", 1)[-1]
+    parts = path.split(".")
+    if "per_s" in leaf:
+        return 1
+    if leaf.endswith(("_s", "_us", "_ms")) or any(p.endswith(("_us", "_ms")) for p in parts[:-1]):
+        return -1
+    return 0
+
+
+def compare(old, new, threshold=0.10):
+    a, b = flatten(old.get("results", old)), flatten(new.get("results", new))
+    rows = []
+    for path in sorted(set(a) & set(b)):
+        sign = direction(path)
+        if not sign or not a[path]:
+            continue
+        change = (b[path] - a[path]) / abs(a[path])
+        verdict = ""
+        if sign * change < -threshold:
+            verdict = "REGRESSION"
+        elif sign * change > threshold:
+            verdict = "improved"
+        rows.append((path, a[path], b[path], change, verdict))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--all", action="store_true", help="also print unchanged measurements")
+    args = parser.parse_args(argv)
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if old.get("env") != new.get("env"):
+        print("[BENCH] note: results come from different environments")
+
+    rows = compare(old, new, args.threshold)
+    for path, x, y, change, verdict in rows:
+        if verdict or args.all:
+            print(f"{verdict:10s} {change:+7.1%}  {x:12.6g} -> {y:12.6g}  {path}")
+    regressions = sum(1 for r in rows if r[4] == "REGRESSION")
+    print(f"[BENCH] {len(rows)} measurements compared, {regressions} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Run the ingest / inference / storage / dashboard benchmarks in one go
+and store them as a single JSON document.
+
+    python -m benchmarks.run_all [--quick] [--only ingest,models] [--seed 0]
+    python -m benchmarks.compare results/suite-A.json results/suite-B.json
+
+Data is synthetic and seeded (benchmarks/synth.py), so two runs on the
+same machine measure the same work. --quick shrinks every size for a
+smoke run (seconds instead of minutes).
+"""
+import argparse
+import time
+
+from benchmarks import bench_anomaly, bench_csv_index, bench_dashboard, bench_ingest, bench_models, bench_storage
+from benchmarks.common import write_result
+
+SUITE = [
+    # name, module, full args, --quick args
+    ("ingest", bench_ingest, [], ["--messages", "500"]),
+    ("models", bench_models, [], ["--rows", "200", "--batches", "1,32"]),
+    ("storage", bench_storage, [], ["--sizes", "0,10000", "--appends", "1000"]),
+    ("dashboard", bench_dashboard, [], ["--sizes", "1000,10000"]),
+    ("anomaly", bench_anomaly, [], ["--devices", "10,1000", "--updates", "20000"]),
+    ("csv_index", bench_csv_index, [], ["--sizes", "10000,100000", "--appends", "2000"]),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--only", default="", help="comma separated subset of " + ",".join(s[0] for s in SUITE))
+    parser.add_argument("--seed", type=int, default=0, help="synthetic data seed for the ingest run")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    only = set(filter(None, args.only.split(",")))
+    results = {"quick": args.quick, "seed": args.seed}
+    for name, module, full, quick in SUITE:
+        if only and name not in only:
+            continue
+        bench_args = (quick if args.quick else full) + ["--no-save"]
+        if name == "ingest":
+            bench_args += ["--seed", str(args.seed)]
+        print(f"[BENCH] === {name} ===")
+        t0 = time.perf_counter()
+        results[name] = module.main(bench_args)
+        print(f"[BENCH] {name} done in {time.perf_counter() - t0:.1f}s")
+
+    if not args.no_save:
+        write_result("suite", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Synthetic sensor data in the shape MQTTRunner receives on SHHE/data."""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def generate(n_rows, n_devices=4, seed=0, start=None, interval_s=1.0, rate_hz=None,
+             hr_dropout=0.0, gas_spike=0.0, spike_len=5, spike_gas=(800.0, 2000.0)):
+    """
+    Return a list of payload dicts (device, ts, temp, hum, gas, heartrate),
+    round-robin over devices, each device sampling every `interval_s`
+    (or, with rate_hz, the whole fleet sending rate_hz messages/s).
+
+    hr_dropout: probability a row has no heart rate (None, as a sensor
+    that lost contact sends it). gas_spike: probability per row that a
+    device starts a spike of `spike_len` samples with gas drawn from
+    `spike_gas`. Both come from their own random stream, so the base
+    readings for a seed do not change when they are switched on.
+    """
+    rng = np.random.default_rng(seed)
+    events = np.random.default_rng(seed + 1_000_003) if (hr_dropout or gas_spike) else None
+    start = start or datetime(2025, 1, 1)
+    if rate_hz:
+        interval_s = n_devices / float(rate_hz)
+    devices = [f"dev-{i:03d}" for i in range(n_devices)]
+
+    base_temp = rng.uniform(22, 30, n_devices)
+    base_hum = rng.uniform(40, 75, n_devices)
+    base_gas = rng.uniform(250, 600, n_devices)
+    base_hr = rng.uniform(65, 95, n_devices)
+    spiking = [0] * n_devices
+
+    rows = []
+    for i in range(n_rows):
+        d = i % n_devices
+        step = i // n_devices
+        ts = start + timedelta(seconds=step * interval_s)
+        row = {
+            "device": devices[d],
+            "ts": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "temp": round(float(base_temp[d] + rng.normal(0, 0.4)), 1),
+            "hum": round(float(base_hum[d] + rng.normal(0, 1.5)), 1),
+            "gas": round(float(base_gas[d] + rng.normal(0, 40)), 0),
+            "heartrate": round(float(base_hr[d] + rng.normal(0, 4)), 0),
+        }
+        if events is not None:
+            if hr_dropout and events.random() < hr_dropout:
+                row["heartrate"] = None
+            if gas_spike and not spiking[d] and events.random() < gas_spike:
+                spiking[d] = spike_len
+            if spiking[d]:
+                row["gas"] = round(float(events.uniform(*spike_gas)), 0)
+                spiking[d] -= 1
+        rows.append(row)
+    return rows
+
+
+def payloads(rows):
+    """Rows as the raw SHHE/data message bodies."""
+    return [json.dumps(r).encode() for r in rows]
+
+
+def write_history(path, rows, label="GOOD"):
+    """Write rows as a data.csv (same writer and format MQTTRunner uses)."""
+    from telemetry_writer import TelemetryWriter
+    if os.path.exists(path):
+        os.remove(path)
+    writer = TelemetryWriter(path, max_queue=len(rows) + 1, batch_size=8192, fsync="never").start()
+    for r in rows:
+        writer.append({**r, "ai": r.get("ai", label), "heartrate": r["heartrate"] or 0})
+    writer.close(timeout=600)
+    return path
+
+
+def feature_matrix(model_service, rows):
+    """Replay rows through ModelService.compute_features -> (N, 12) array."""
+    feats = [model_service.compute_features(r["device"], r["temp"], r["hum"], r["gas"],
+                                            r["ts"], r["heartrate"]) for r in rows]
+    return np.vstack(feats) if feats else np.empty((0, 12))
@@ -0,0 +1,81 @@
+"""
+In-process pub/sub for live records.
+
+MQTTRunner publishes every processed record to a Broadcaster. Readers
+either keep their own bounded Subscription (drop-oldest, so a slow
+viewer never holds up ingest) or only compare `version`, which is
+enough to know whether anything has to be redrawn at all.
+"""
+import threading
+from collections import deque
+
+
+class Subscription:
+    def __init__(self, owner, maxsize):
+        self._owner = owner
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def _push(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Next item, or None after `timeout` seconds without one."""
+        with self._cond:
+            if not self._items and not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def drain(self):
+        """Everything queued so far (possibly empty), without waiting."""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def close(self):
+        self._owner.unsubscribe(self)
+
+
+class Broadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._subs = []
+        self.version = 0
+        self.latest = None
+
+    def publish(self, item):
+        with self._cond:
+            self.version += 1
+            self.latest = item
+            subs = list(self._subs)
+            self._cond.notify_all()
+        for sub in subs:
+            sub._push(item)
+
+    def subscribe(self, maxsize=1000):
+        sub = Subscription(self, maxsize)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def wait(self, version, timeout=None):
+        """Block until something newer than `version` is published; returns the current version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version, timeout)
+            return self.version
+
+    def subscribers(self):
+        with self._lock:
+            return len(self._subs)
@@ -0,0 +1,468 @@
+"""
+Sparse time-bucket index over data.csv.
+
+"Device X between 02:00 and 04:00" used to mean pd.read_csv of the
+whole file and a filter in pandas. CsvIndex keeps, for every
+(time bucket, device), the byte ranges of data.csv holding its rows, so
+a range query seeks to those ranges and parses only them; its cost
+follows the size of the answer, not of the file.
+
+    idx = CsvIndex("data.csv")
+    df = idx.query(device="dev-003", since="2025-01-01 02:00", until="2025-01-01 04:00")
+
+Buckets are timestamp prefixes ("YYYY-MM-DD HH" for bucket="hour"), so
+indexing a row in the usual format costs a string slice; other formats
+are parsed first, and rows with no usable ts land in a bucket every
+query reads. Ranges of one key closer than
+merge_gap bytes are merged: the index stays at about one range per
+(device, bucket) and a query reads a little extra instead of seeking
+per row. With many devices writing at once a range also holds the
+other devices' rows of that bucket; query() drops those lines by a byte
+match on ",<device>," before parsing, then filters exactly like
+CsvStore.read.
+
+The index lives next to the CSV in <csv>.idx, JSON lines: a header
+({"v", "bucket", "ino", "head", "columns"}) and one line per indexed batch
+({"e": end offset, "r": [[device, bucket, start, end], ...]}). Only the
+writing side appends to it (CsvStore(index=True) hooks add_batch into
+TelemetryWriter, after every flushed batch). Any reader catches up on
+its own: it reads the new sidecar lines and scans CSV bytes not indexed
+yet, so a lost or stale sidecar only costs one scan. A CSV that shrank,
+was replaced (different inode) or rewritten in place (checksum of its
+first HEAD_BYTES, last indexed byte not a line end) is indexed again
+from scratch.
+
+    python csv_index.py build data.csv [--bucket hour]
+    python csv_index.py query data.csv --device dev-003 --since "2025-01-01 02:00" --until "2025-01-01 04:00"
+"""
+import argparse
+import bisect
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import pandas as pd
+
+from storage import _coerce, _filter
+from telemetry_writer import CSV_COLUMNS
+
+# bucket name -> length of the "YYYY-MM-DD HH:MM:SS" prefix it keeps
+BUCKETS = {"day": 10, "hour": 13, "10min": 15, "minute": 16}
+MERGE_GAP = 64 * 1024
+SCAN_CHUNK = 1 << 20
+HEAD_BYTES = 4096
+VERSION = 2
+# bucket of rows whose ts does not parse (or carries a UTC offset): every
+# query reads it, the exact filter decides
+UNPARSED = ""
+_CANONICAL = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(\.\d+)?$").match
+
+
+def _bucket_key(ts, n):
+    """Bucket of a since/until bound (anything pd.Timestamp accepts)."""
+    return pd.Timestamp(ts).strftime("%Y-%m-%d %H:%M:%S")[:n]
+
+
+def _row_bucket(ts, n):
+    """
+    Bucket of a stored ts. Devices send ts as they like ("2025-01-01T02:30:00",
+    "2025-01-01 2:30"); anything not already "YYYY-MM-DD HH:MM:SS" is parsed
+    like storage._coerce does (pd.to_datetime, errors="coerce").
+    """
+    text = str(ts)
+    if _CANONICAL(text):
+        return text[:n]
+    t = pd.to_datetime(text, errors="coerce")
+    if pd.isna(t) or t.tzinfo is not None:
+        return UNPARSED
+    return t.strftime("%Y-%m-%d %H:%M:%S")[:n]
+
+
+class CsvIndex:
+    def __init__(self, csv_path, bucket="hour", path=None, writable=False, merge_gap=MERGE_GAP):
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {list(BUCKETS)}")
+        self.csv_path = csv_path
+        self.path = path or csv_path + ".idx"
+        self.bucket = bucket
+        self.writable = writable
+        self.merge_gap = merge_gap
+        self._n = BUCKETS[bucket]
+        self._lock = threading.RLock()
+        self._sidecar = None
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self._ranges = {}       # bucket -> {device: [[start, end], ...]}
+        self._buckets = []      # sorted bucket keys
+        self.end = 0            # CSV bytes indexed so far
+        self.columns = None
+        self._ino = None
+        self._head = None       # [length, crc32] of the start of the CSV
+        self._idx_pos = 0       # sidecar bytes already applied
+        self._idx_ino = None
+        self.scanned_bytes = 0
+        self.batches = 0
+        if self._sidecar is not None:
+            self._sidecar.close()
+            self._sidecar = None
+
+    # ---------------- STRUCTURE ----------------
+    def _add(self, device, bucket, start, end):
+        devices = self._ranges.get(bucket)
+        if devices is None:
+            devices = self._ranges[bucket] = {}
+            bisect.insort(self._buckets, bucket)
+        ranges = devices.get(device)
+        if ranges is None:
+            devices[device] = [[start, end]]
+            return
+        last = ranges[-1]
+        if start <= last[1] + self.merge_gap and end >= last[0]:
+            last[0] = min(last[0], start)
+            last[1] = max(last[1], end)
+        else:
+            ranges.append([start, end])
+
+    def _header(self):
+        """Read the CSV header: (columns, offset of the first data row)."""
+        with open(self.csv_path, "rb") as f:
+            line = f.readline()
+        fields = next(csv.reader([line.decode("utf-8", errors="replace").rstrip("\r\n")]), [])
+        if {"ts", "device"}.issubset(fields):
+            return fields, len(line)
+        return list(CSV_COLUMNS), 0   # header-less file
+
+    def _head_crc(self, length):
+        with open(self.csv_path, "rb") as f:
+            return zlib.crc32(f.read(length))
+
+    def _same_file(self, st):
+        """Is this still the CSV the index was built from (only appended to since)?"""
+        if st.st_ino != self._ino or st.st_size < self.end:
+            return False
+        try:
+            with open(self.csv_path, "rb") as f:
+                if self.end:
+                    f.seek(self.end - 1)
+                    if f.read(1) != b"\n":
+                        return False
+                f.seek(0)
+                return self._head is None or zlib.crc32(f.read(self._head[0])) == self._head[1]
+        except OSError:
+            return False
+
+    # ---------------- WRITER HOOK ----------------
+    def add_batch(self, rows, start, data):
+        """
+        TelemetryWriter.on_write: `rows` were appended as `data` at byte
+        `start`. Row boundaries come from the line breaks; if a quoted
+        field hid one, the whole batch range is used for every row.
+        """
+        end = start + len(data)
+        lines = data.split(b"\n")[:-1]
+        if len(lines) == len(rows):
+            bounds = []
+            pos = start
+            for line in lines:
+                bounds.append((pos, pos + len(line) + 1))
+                pos += len(line) + 1
+        else:
+            bounds = [(start, end)] * len(rows)
+        n = self._n
+        keys = {}
+        for row, (s, e) in zip(rows, bounds):
+            key = (str(row.get("device", "")), _row_bucket(row.get("ts", ""), n))
+            r = keys.get(key)
+            if r is None:
+                keys[key] = [s, e]
+            else:
+                r[1] = e
+        entries = [[device, bucket, s, e] for (device, bucket), (s, e) in keys.items()]
+        with self._lock:
+            if self.columns is None:
+                return   # not initialised against this file (yet); refresh() will scan it
+            for device, bucket, s, e in entries:
+                self._add(device, bucket, s, e)
+            self.end = max(self.end, end)
+            self.batches += 1
+            self._log({"e": end, "r": entries})
+
+    # ---------------- SIDECAR ----------------
+    def _log(self, entry):
+        if not self.writable:
+            return
+        try:
+            if self._sidecar is None:
+                self._sidecar = open(self.path, "a", encoding="utf-8")
+            line = json.dumps(entry, separators=(",", ":")) + "\n"
+            self._sidecar.write(line)
+            self._sidecar.flush()
+            # our own lines need not be read back
+            self._idx_pos += len(line.encode("utf-8"))
+        except OSError as e:
+            print("[INDEX] Warning: cannot write", self.path, e)
+
+    def _start_sidecar(self):
+        if not self.writable:
+            return
+        if self._sidecar is not None:
+            self._sidecar.close()
+            self._sidecar = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"v": VERSION, "bucket": self.bucket, "ino": self._ino,
+                                "head": self._head, "columns": self.columns}) + "\n")
+        os.replace(tmp, self.path)
+        self._idx_ino = os.stat(self.path).st_ino
+        self._idx_pos = os.path.getsize(self.path)
+
+    def _read_sidecar(self):
+        """Apply sidecar lines added since the last call. False if the sidecar does not describe this CSV."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if st.st_ino != self._idx_ino or st.st_size < self._idx_pos:
+            # new / rewritten sidecar: start over from its header
+            if self._idx_ino is not None:
+                return False
+            self._idx_pos = 0
+        if st.st_size == self._idx_pos:
+            return self._idx_ino is not None
+        with open(self.path, "rb") as f:
+            f.seek(self._idx_pos)
+            data = f.read(st.st_size - self._idx_pos)
+        cut = data.rfind(b"\n") + 1
+        for line in data[:cut].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "v" in entry:
+                if (entry["v"], entry.get("bucket"), entry.get("ino")) != (VERSION, self.bucket, self._ino):
+                    return False
+                head = entry.get("head")
+                if not head or self._head_crc(head[0]) != head[1]:
+                    return False
+                self._head = head
+                self.columns = entry.get("columns") or self.columns
+                self._idx_ino = st.st_ino
+                continue
+            if self._idx_ino is None:
+                return False   # entries without a header
+            for device, bucket, s, e in entry["r"]:
+                self._add(device, bucket, s, e)
+            self.end = max(self.end, entry["e"])
+            self.batches += 1
+        self._idx_pos += cut
+        return self._idx_ino is not None
+
+    # ---------------- CATCH UP ----------------
+    def _scan(self, start, size):
+        """Index complete CSV lines in [start, size) by reading them."""
+        ts_pos, dev_pos = self.columns.index("ts"), self.columns.index("device")
+        n = self._n
+        pos = start
+        entries = []
+        with open(self.csv_path, "rb") as f:
+            f.seek(start)
+            pending = b""
+            while pos + len(pending) < size:
+                chunk = f.read(min(SCAN_CHUNK, size - pos - len(pending)))
+                if not chunk:
+                    break
+                data = pending + chunk
+                cut = data.rfind(b"\n") + 1
+                pending = data[cut:]
+                keys = {}
+                for line in data[:cut].split(b"\n")[:-1]:
+                    end = pos + len(line) + 1
+                    text = line.decode("utf-8", errors="replace").rstrip("\r")
+                    fields = text.split(",") if '"' not in text else next(csv.reader([text]), [])
+                    if len(fields) > max(ts_pos, dev_pos):
+                        key = (fields[dev_pos], _row_bucket(fields[ts_pos], n))
+                        r = keys.get(key)
+                        if r is None:
+                            keys[key] = [pos, end]
+                        else:
+                            r[1] = end
+                    pos = end
+                for (device, bucket), (s, e) in keys.items():
+                    self._add(device, bucket, s, e)
+                    entries.append([device, bucket, s, e])
+        self.scanned_bytes += pos - start
+        self.end = max(self.end, pos)
+        if entries:
+            self._log({"e": pos, "r": entries})
+
+    def _init(self, st):
+        """First look at this CSV: load the sidecar if it matches, otherwise start an empty index."""
+        self._ino = st.st_ino
+        self.columns, self.end = self._header()
+        if self._read_sidecar() and self._same_file(st):
+            if self.writable and os.path.getsize(self.path) > self._idx_pos:
+                # half-written last line of a crashed writer: new lines go behind whole ones
+                with open(self.path, "rb+") as f:
+                    f.truncate(self._idx_pos)
+            return
+        self._reset()
+        self._ino = st.st_ino
+        self.columns, self.end = self._header()
+        length = min(st.st_size, HEAD_BYTES)
+        self._head = [length, self._head_crc(length)]
+        self._start_sidecar()
+
+    def refresh(self):
+        """Bring the index up to the current end of the CSV."""
+        with self._lock:
+            try:
+                st = os.stat(self.csv_path)
+            except OSError:
+                self._reset()
+                return self
+            if self._ino is not None and not self._same_file(st):
+                print(f"[INDEX] {self.csv_path} was replaced or rewritten, re-indexing")
+                self._reset()
+            if self.columns is None:
+                self._init(st)
+            elif not self.writable and not self._read_sidecar():
+                # the writer started a new sidecar: read it from the top next time
+                self._idx_ino, self._idx_pos = None, 0
+            if st.st_size > self.end:
+                t0 = time.perf_counter()
+                start = self.end
+                self._scan(start, st.st_size)
+                if st.st_size - start > SCAN_CHUNK:
+                    print(f"[INDEX] indexed {st.st_size - start:,} bytes of {self.csv_path} "
+                          f"in {time.perf_counter() - t0:.1f}s")
+        return self
+
+    # ---------------- QUERY ----------------
+    def ranges(self, device=None, since=None, until=None):
+        """Merged, sorted (start, end) byte ranges that can hold matching rows."""
+        n = self._n
+        with self._lock:
+            lo = bisect.bisect_left(self._buckets, _bucket_key(since, n)) if since is not None else 0
+            hi = (bisect.bisect_right(self._buckets, _bucket_key(until, n)) if until is not None
+                  else len(self._buckets))
+            buckets = self._buckets[lo:hi]
+            if lo > 0 and self._buckets[0] == UNPARSED:
+                buckets = [UNPARSED] + buckets
+            found = []
+            for bucket in buckets:
+                devices = self._ranges[bucket]
+                if device is not None:
+                    found.extend(devices.get(str(device), ()))
+                else:
+                    for r in devices.values():
+                        found.extend(r)
+        found.sort()
+        merged = []
+        for s, e in found:
+            if merged and s <= merged[-1][1] + self.merge_gap:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        return merged
+
+    def _device_token(self, device):
+        """Bytes every row of `device` contains (",dev-003,"), or None if that cannot be told."""
+        if device is None:
+            return None
+        device = str(device)
+        pos = self.columns.index("device")
+        # csv.writer only quotes fields with these characters; first / last
+        # column have no comma on one side
+        if any(c in device for c in ',"\r\n') or not 0 < pos < len(self.columns) - 1:
+            return None
+        return ("," + device + ",").encode("utf-8")
+
+    def query(self, device=None, since=None, until=None, columns=None):
+        """Typed frame of the rows of `device` with since <= ts < until (same result as CsvStore.read)."""
+        self.refresh()
+        wanted = list(columns or CSV_COLUMNS)
+        if self.columns is None:
+            return _coerce(pd.DataFrame(columns=wanted), wanted)
+        need = set(wanted) | {"ts"}
+        if device is not None:
+            need.add("device")
+        ranges = self.ranges(device, since, until)
+        chunks = []
+        with open(self.csv_path, "rb") as f:
+            for s, e in ranges:
+                f.seek(s)
+                chunks.append(f.read(e - s))
+        data = b"".join(chunks)
+        token = self._device_token(device)
+        if token is not None and data:
+            # ranges also hold the other devices' rows of those buckets: drop
+            # them before pandas parses anything (exact filter still follows)
+            lines = [line for line in data.split(b"\n") if token in line]
+            data = b"\n".join(lines) + b"\n" if lines else b""
+        names = self.columns
+        if data:
+            df = pd.read_csv(io.BytesIO(data), header=None, names=names,
+                             usecols=[c for c in names if c in need])
+        else:
+            df = pd.DataFrame(columns=[c for c in names if c in need])
+        df = _filter(_coerce(df, list(need)), device, since, until)
+        return df[wanted].reset_index(drop=True)
+
+    # ---------------- INTROSPECTION ----------------
+    def stats(self):
+        with self._lock:
+            n_ranges = sum(len(r) for devices in self._ranges.values() for r in devices.values())
+            keys = sum(len(devices) for devices in self._ranges.values())
+            try:
+                sidecar = os.path.getsize(self.path)
+            except OSError:
+                sidecar = 0
+            return {"bucket": self.bucket, "buckets": len(self._buckets), "keys": keys, "ranges": n_ranges,
+                    "indexed_bytes": self.end, "batches": self.batches, "scanned_bytes": self.scanned_bytes,
+                    "sidecar_bytes": sidecar}
+
+    def close(self):
+        with self._lock:
+            if self._sidecar is not None:
+                self._sidecar.close()
+                self._sidecar = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sparse time-bucket index over data.csv")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="(re)index a CSV and write its .idx sidecar")
+    b.add_argument("csv_path")
+    b.add_argument("--bucket", choices=list(BUCKETS), default="hour")
+    q = sub.add_parser("query", help="rows of one device / time range via the index")
+    q.add_argument("csv_path")
+    q.add_argument("--bucket", choices=list(BUCKETS), default="hour")
+    q.add_argument("--device", default=None)
+    q.add_argument("--since", default=None)
+    q.add_argument("--until", default=None)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        idx_path = args.csv_path + ".idx"
+        if os.path.exists(idx_path):
+            os.remove(idx_path)
+        idx = CsvIndex(args.csv_path, bucket=args.bucket, writable=True)
+        idx.close()
+        print("[INDEX]", idx.stats())
+    else:
+        idx = CsvIndex(args.csv_path, bucket=args.bucket)
+        t0 = time.perf_counter()
+        df = idx.query(args.device, args.since, args.until)
+        print(df.to_string(max_rows=20))
+        print(f"[INDEX] {len(df)} rows in {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
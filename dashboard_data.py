@@ -0,0 +1,155 @@
+"""
+Incremental data access for the dashboard.
+
+TailCache follows data.csv like `tail -f`: it remembers the byte offset
+it has read up to and, on refresh(), parses only the bytes appended
+since. It keeps the last `capacity` rows in a ring buffer and feeds every
+row into a StreamingStats (all-time / last hour / last day, global and
+per device) and a SeriesPyramid (multi-resolution min/max buckets for
+the trend chart), so a rerun costs the same whether the history holds a
+hundred rows or a hundred million.
+"""
+import csv
+import io
+import os
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from downsample import SeriesPyramid
+from stats import StreamingStats, WINDOW_ALL, _epoch
+from storage import NUMERIC_COLUMNS, _coerce
+from telemetry_writer import CSV_COLUMNS
+
+_READ_CHUNK = 8 * 1024 * 1024
+
+
+def _to_float(v):
+    # same rule as the dashboard always used: non-numeric -> 0
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if f != f else f
+
+
+def aggregates_from_frame(df):
+    """Same shape as TailCache.aggregates(), computed from an already loaded frame."""
+    out = {}
+    for col in NUMERIC_COLUMNS:
+        if df.empty or col not in df.columns:
+            out[col] = {"count": 0, "min": 0.0, "max": 0.0, "mean": 0.0}
+        else:
+            s = df[col]
+            out[col] = {"count": int(s.count()), "min": float(s.min()),
+                        "max": float(s.max()), "mean": float(s.mean())}
+    return out
+
+
+class TailCache:
+    def __init__(self, path, capacity=2000):
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self._inode = None
+        self._columns = None
+        self._positions = None
+        self.rows = deque(maxlen=self.capacity)
+        self.total_rows = 0
+        self.stats = StreamingStats(metrics=NUMERIC_COLUMNS)
+        self.pyramid = SeriesPyramid(metrics=NUMERIC_COLUMNS)
+
+    # ---------------- READ ----------------
+    def refresh(self):
+        """Parse whatever was appended since the last call. Returns the number of new rows."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return 0
+            # file replaced or truncated -> start over
+            if st.st_ino != self._inode or st.st_size < self.offset:
+                self._reset()
+                self._inode = st.st_ino
+            if st.st_size == self.offset:
+                return 0
+
+            added = 0
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                pending = b""
+                while True:
+                    data = f.read(_READ_CHUNK)
+                    if not data:
+                        break
+                    data = pending + data
+                    # only complete lines; a row still being written waits for the next refresh
+                    cut = data.rfind(b"\n")
+                    if cut < 0:
+                        pending = data
+                        continue
+                    added += self._parse(data[:cut + 1].decode("utf-8", errors="replace"))
+                    self.offset += cut + 1
+                    pending = data[cut + 1:]
+            return added
+
+    def _parse(self, text):
+        reader = csv.reader(io.StringIO(text))
+        added = 0
+        batch = []
+        for fields in reader:
+            if not fields:
+                continue
+            if self._positions is None:
+                if set(CSV_COLUMNS).issubset(fields):
+                    self._columns = fields
+                    self._positions = [fields.index(c) for c in CSV_COLUMNS]
+                    continue
+                # header-less file: first 7 columns, positionally
+                self._columns = CSV_COLUMNS
+                self._positions = list(range(len(CSV_COLUMNS)))
+            row = {}
+            for col, pos in zip(CSV_COLUMNS, self._positions):
+                row[col] = fields[pos] if pos < len(fields) else ""
+            for col in NUMERIC_COLUMNS:
+                row[col] = _to_float(row[col])
+            batch.append(row)
+            self.rows.append(row)
+            self.total_rows += 1
+            added += 1
+        if batch:
+            times = [_epoch(r["ts"]) if r["ts"] else None for r in batch]
+            self.stats.add_many([r["device"] for r in batch], batch, times=times)
+            values = np.array([[r[c] for c in NUMERIC_COLUMNS] for r in batch])
+            self.pyramid.add(np.array(times, dtype=float), values)
+        return added
+
+    # ---------------- SNAPSHOTS ----------------
+    def frame(self, n=None):
+        """Recent rows (at most `capacity`) as a typed frame, like storage read()."""
+        with self._lock:
+            rows = list(self.rows) if n is None else list(self.rows)[-n:]
+        df = pd.DataFrame(rows, columns=CSV_COLUMNS)
+        return _coerce(df)
+
+    def latest(self):
+        with self._lock:
+            return dict(self.rows[-1]) if self.rows else None
+
+    def series(self, since=None, until=None, points=1000):
+        """Min/max-decimated history for the chart (see downsample.SeriesPyramid.query)."""
+        return self.pyramid.query(since=since, until=until, points=points)
+
+    def span(self):
+        return self.pyramid.span()
+
+    def aggregates(self, window=WINDOW_ALL, device=None):
+        """count/min/max/mean/var/percentiles per sensor column (see stats.StreamingStats)."""
+        return self.stats.snapshot(device=device, window=window)
@@ -0,0 +1,263 @@
+"""
+Per-device rolling state for feature computation.
+
+Device ids are interned to integer slots. Each slot's numeric state is
+one row of a preallocated float64 table, so an update is a single row
+read and a single row write:
+
+  ring      (roll per metric)  last `roll` temp/hum/gas readings
+  sums      (3)                running sums of the ring (O(1) rolling mean)
+  last      (3)                previous reading, for the deltas
+  prev_avg  (2)                previous rolling temp/gas mean, for the trends
+  fill/pos/has_last/has_avg    ring bookkeeping
+
+last_ts (duplicate filter) is a separate per-slot array. Slots come from
+a SlotAllocator, which the other per-device tables (anomaly.py,
+stats.py) use as well: slots are freed by TTL (evict_expired) or, once
+max_devices is reached, by evicting the least recently updated device.
+A freed slot is reused by the next new device, and the table grows by
+doubling up to max_devices.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SlotAllocator:
+    """
+    Device id -> integer row of an owner's per-device arrays.
+
+    Devices are kept in least-recently-used order, so the LRU eviction at
+    max_devices and the TTL sweep only touch the devices they drop. The
+    owner resizes its arrays in grow(old, new) and clears a freed row in
+    clear(slot). Not locked: owners call it under their own lock.
+    """
+
+    def __init__(self, grow, clear, capacity=64, max_devices=None, ttl=None, sweep_every=1024):
+        self._grow = grow
+        self._clear = clear
+        self.max_devices = max_devices
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self._lru = OrderedDict()   # device -> slot, least recently used first
+        self._free = []
+        self._ops = 0
+        self.evicted = 0
+        self.capacity = 0
+        self.seen = np.zeros(0, dtype=np.float64)   # monotonic time of each slot's last use
+        self._alloc(max(1, min(capacity, max_devices or capacity)))
+
+    def _alloc(self, n):
+        old = self.capacity
+        seen = np.zeros(n, dtype=np.float64)
+        seen[:old] = self.seen
+        self.seen = seen
+        self._grow(old, n)
+        self.capacity = n
+        self._free.extend(range(n - 1, old - 1, -1))
+
+    def _drop(self, slot):
+        self._clear(slot)
+        self._free.append(slot)
+        self.evicted += 1
+
+    def slot(self, device, now):
+        """Slot of `device` (allocated, or taken from the LRU device, if new); marks it used at `now`."""
+        slot = self._lru.get(device)
+        if slot is None:
+            if not self._free:
+                if self.max_devices and self.capacity >= self.max_devices:
+                    self._drop(self._lru.popitem(last=False)[1])
+                else:
+                    size = self.capacity * 2
+                    self._alloc(min(size, self.max_devices) if self.max_devices else size)
+            slot = self._free.pop()
+            self._lru[device] = slot
+        else:
+            self._lru.move_to_end(device)
+        self.seen[slot] = now
+        self._ops += 1
+        if self.ttl is not None and self._ops % self.sweep_every == 0:
+            self.evict_expired(now)
+        return slot
+
+    def get(self, device):
+        """Slot of a known device without marking it used (None if unknown)."""
+        return self._lru.get(device)
+
+    def release(self, device):
+        slot = self._lru.pop(device, None)
+        if slot is not None:
+            self._drop(slot)
+        return slot is not None
+
+    def evict_expired(self, now):
+        """Drop devices not used for `ttl` seconds. Returns how many were dropped."""
+        if self.ttl is None:
+            return 0
+        cutoff = now - self.ttl
+        n = 0
+        while self._lru:
+            device, slot = next(iter(self._lru.items()))
+            if self.seen[slot] >= cutoff:
+                break
+            del self._lru[device]
+            self._drop(slot)
+            n += 1
+        return n
+
+    def __len__(self):
+        return len(self._lru)
+
+    def __contains__(self, device):
+        return device in self._lru
+
+    def devices(self):
+        return list(self._lru)
+
+    def items(self):
+        return list(self._lru.items())
+
+
+class DeviceStateStore:
+    def __init__(self, roll_size=3, capacity=64, max_devices=None, ttl=None, sweep_every=1024):
+        self.roll = R = int(roll_size)
+        self.max_devices = max_devices
+        self.ttl = ttl
+        # column layout of one slot row
+        self.SUM = 3 * R
+        self.LAST = self.SUM + 3
+        self.AVG = self.LAST + 3
+        self.FILL, self.POS, self.HAS_LAST, self.HAS_AVG = range(self.AVG + 2, self.AVG + 6)
+        self.width = self.AVG + 6
+        self._lock = threading.Lock()
+        self.table = np.zeros((0, self.width), dtype=np.float64)
+        self.last_ts = np.full(0, None, dtype=object)
+        self._slots = SlotAllocator(self._grow, self._clear, capacity, max_devices, ttl, sweep_every)
+
+    def _grow(self, old, n):
+        table = np.zeros((n, self.width), dtype=np.float64)
+        last_ts = np.full(n, None, dtype=object)
+        table[:old] = self.table
+        last_ts[:old] = self.last_ts
+        self.table, self.last_ts = table, last_ts
+
+    def _clear(self, slot):
+        self.table[slot] = 0.0
+        self.last_ts[slot] = None
+
+    @property
+    def capacity(self):
+        return self._slots.capacity
+
+    @property
+    def evicted(self):
+        return self._slots.evicted
+
+    # named views on the table (for inspection / vectorised use)
+    @property
+    def ring(self):
+        return self.table[:, :self.SUM].reshape(self.capacity, 3, self.roll)
+
+    @property
+    def sums(self):
+        return self.table[:, self.SUM:self.SUM + 3]
+
+    def _slot(self, device, now):
+        return self._slots.slot(device, now)
+
+    # ---------------- UPDATES ----------------
+    def accept_ts(self, device, ts):
+        """False if ts is not newer than the last accepted ts of this device (old/duplicate packet)."""
+        with self._lock:
+            slot = self._slot(device, time.monotonic())
+            last_ts = self.last_ts[slot]
+            if last_ts and ts <= last_ts:
+                return False
+            self.last_ts[slot] = ts
+            return True
+
+    def update(self, device, temp, hum, gas):
+        """
+        Push one reading; returns (d_temp, d_hum, d_gas, r_temp, r_hum,
+        r_gas, trend_temp, trend_gas) exactly as ModelService defines them.
+        """
+        R, S, L, A = self.roll, self.SUM, self.LAST, self.AVG
+        with self._lock:
+            slot = self._slot(device, time.monotonic())
+            row = self.table[slot].tolist()
+
+            if row[self.HAS_LAST]:
+                d_temp, d_hum, d_gas = temp - row[L], hum - row[L + 1], gas - row[L + 2]
+            else:
+                d_temp = d_hum = d_gas = 0.0
+                row[self.HAS_LAST] = 1.0
+            row[L], row[L + 1], row[L + 2] = temp, hum, gas
+
+            p, n = int(row[self.POS]), int(row[self.FILL])
+            if n == R:
+                row[S] -= row[p]
+                row[S + 1] -= row[R + p]
+                row[S + 2] -= row[2 * R + p]
+            else:
+                n += 1
+                row[self.FILL] = n
+            row[p], row[R + p], row[2 * R + p] = temp, hum, gas
+            row[S] += temp
+            row[S + 1] += hum
+            row[S + 2] += gas
+            p += 1
+            if p == R:
+                # ring is in arrival order again: re-sum once per lap so
+                # float error cannot accumulate
+                p = 0
+                row[S], row[S + 1], row[S + 2] = sum(row[:R]), sum(row[R:2 * R]), sum(row[2 * R:3 * R])
+            row[self.POS] = p
+
+            r_temp, r_hum, r_gas = row[S] / n, row[S + 1] / n, row[S + 2] / n
+            if row[self.HAS_AVG]:
+                trend_temp, trend_gas = r_temp - row[A], r_gas - row[A + 1]
+            else:
+                trend_temp = trend_gas = 0.0
+                row[self.HAS_AVG] = 1.0
+            row[A], row[A + 1] = r_temp, r_gas
+
+            self.table[slot] = row
+            return d_temp, d_hum, d_gas, r_temp, r_hum, r_gas, trend_temp, trend_gas
+
+    # ---------------- EVICTION ----------------
+    def evict_expired(self, now=None):
+        """Drop devices not updated for `ttl` seconds. Returns how many were dropped."""
+        with self._lock:
+            return self._slots.evict_expired(time.monotonic() if now is None else now)
+
+    def forget(self, device):
+        with self._lock:
+            self._slots.release(device)
+
+    # ---------------- INTROSPECTION ----------------
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+    def __contains__(self, device):
+        with self._lock:
+            return device in self._slots
+
+    def devices(self):
+        with self._lock:
+            return self._slots.devices()
+
+    def memory_bytes(self):
+        """Bytes held by the slot arrays (object columns counted as pointers)."""
+        return sum(a.nbytes for a in (self.table, self.last_ts, self._slots.seen))
+
+    def stats(self):
+        with self._lock:
+            n = len(self._slots)
+            mem = self.memory_bytes()
+            return {"devices": n, "capacity": self.capacity, "evicted": self.evicted,
+                    "memory_bytes": mem, "bytes_per_slot": mem / self.capacity,
+                    "bytes_per_device": mem / n if n else 0.0}
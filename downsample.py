@@ -0,0 +1,216 @@
+"""
+Downsampling for the trend chart.
+
+Two pieces:
+
+  * lttb_indices() / downsample_frame(): Largest-Triangle-Three-Buckets
+    over an already loaded frame (the live tail, or a store.read() result).
+  * SeriesPyramid: min/max/sum/count per time bucket at several
+    resolutions (base_s, base_s*factor, base_s*factor^2, ...), filled
+    incrementally as rows arrive. query() picks the finest level that
+    still covers the requested range and folds its buckets down to the
+    pixel budget, so a week of 1 Hz data costs at most `capacity`
+    buckets instead of a scan over the raw rows.
+"""
+import threading
+from datetime import timezone
+
+import numpy as np
+import pandas as pd
+
+from stats import METRICS
+
+
+def lttb_indices(x, y, n_out):
+    """Row indices that LTTB keeps when reducing (x, y) to n_out points."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # first and last point are always kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nx, ny = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            nx, ny = x[-1], y[-1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - nx) * (by - y[a]) - (x[a] - bx) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_frame(df, points=1000, metrics=METRICS, ts_col="ts"):
+    """
+    LTTB per metric on a typed frame (ts datetime); returns the union of
+    the kept rows so all metrics still share one ts column.
+    """
+    if len(df) <= points:
+        return df
+    cols = [m for m in metrics if m in df.columns]
+    if not cols:
+        return df.iloc[np.linspace(0, len(df) - 1, points).astype(np.int64)]
+    x = pd.to_datetime(df[ts_col]).astype("int64").to_numpy() / 1e9
+    per_metric = max(3, points // len(cols))
+    keep = np.unique(np.concatenate([lttb_indices(x, df[c].to_numpy(), per_metric) for c in cols]))
+    return df.iloc[keep]
+
+
+class _Level:
+    """Direct-mapped ring of `capacity` buckets of `width` seconds (slot = epoch % capacity)."""
+
+    def __init__(self, width, capacity, n_metrics):
+        self.width = width
+        self.capacity = capacity
+        self.epochs = np.full(capacity, -1, dtype=np.int64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.sum = np.zeros((capacity, n_metrics), dtype=np.float64)
+        self.min = np.zeros((capacity, n_metrics), dtype=np.float32)
+        self.max = np.zeros((capacity, n_metrics), dtype=np.float32)
+        self.first = None
+        self.latest = None
+
+    def add(self, t, values):
+        e = np.floor(t / self.width).astype(np.int64)
+        order = np.argsort(e, kind="stable")
+        e, values = e[order], values[order]
+        epochs, starts = np.unique(e, return_index=True)
+        counts = np.diff(np.append(starts, len(e)))
+        sums = np.add.reduceat(values, starts, axis=0)
+        mins = np.minimum.reduceat(values, starts, axis=0)
+        maxs = np.maximum.reduceat(values, starts, axis=0)
+
+        latest = int(epochs[-1]) if self.latest is None else max(self.latest, int(epochs[-1]))
+        # anything older than the ring can hold is already folded into coarser levels
+        keep = epochs > latest - self.capacity
+        if not keep.all():
+            epochs, counts, sums, mins, maxs = epochs[keep], counts[keep], sums[keep], mins[keep], maxs[keep]
+        slots = epochs % self.capacity
+        current = self.epochs[slots]
+        live = current <= epochs
+        epochs, slots, counts, sums, mins, maxs = (
+            epochs[live], slots[live], counts[live], sums[live], mins[live], maxs[live])
+        fresh = self.epochs[slots] != epochs
+        if fresh.any():
+            fs = slots[fresh]
+            self.epochs[fs] = epochs[fresh]
+            self.count[fs] = 0
+            self.sum[fs] = 0.0
+            self.min[fs] = np.inf
+            self.max[fs] = -np.inf
+        self.count[slots] += counts
+        self.sum[slots] += sums
+        self.min[slots] = np.minimum(self.min[slots], mins)
+        self.max[slots] = np.maximum(self.max[slots], maxs)
+
+        first = int(e[0])
+        self.first = first if self.first is None else min(self.first, first)
+        self.latest = latest
+
+    def covers(self, e0):
+        """True if no bucket at or after epoch e0 has been evicted."""
+        if self.latest is None:
+            return True
+        oldest_kept = self.latest - self.capacity + 1
+        return e0 >= oldest_kept or self.first >= oldest_kept
+
+    def buckets(self, e0, e1):
+        """Non-empty buckets in [e0, e1] (epochs ascending)."""
+        e1 = min(e1, self.latest)
+        e0 = max(e0, self.latest - self.capacity + 1)
+        if e1 < e0:
+            return None
+        want = np.arange(e0, e1 + 1, dtype=np.int64)
+        slots = want % self.capacity
+        ok = (self.epochs[slots] == want) & (self.count[slots] > 0)
+        slots = slots[ok]
+        return want[ok], self.count[slots], self.sum[slots], self.min[slots], self.max[slots]
+
+
+class SeriesPyramid:
+    def __init__(self, metrics=METRICS, base_s=1.0, factor=4, levels=8, capacity=16384):
+        self.metrics = tuple(metrics)
+        self.capacity = capacity
+        self.levels = [_Level(base_s * factor ** k, capacity, len(self.metrics)) for k in range(levels)]
+        self._lock = threading.Lock()
+        self.rows = 0
+
+    def add(self, t, values):
+        """t: epoch seconds (n,), values: (n, len(metrics)). Rows with NaN t are ignored."""
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(t), len(self.metrics))
+        ok = np.isfinite(t)
+        if not ok.all():
+            t, values = t[ok], values[ok]
+        if not len(t):
+            return
+        with self._lock:
+            for level in self.levels:
+                level.add(t, values)
+            self.rows += len(t)
+
+    def span(self):
+        """(first, latest) epoch seconds seen, or None when empty."""
+        base = self.levels[0]
+        if base.latest is None:
+            return None
+        return base.first * base.width, (base.latest + 1) * base.width
+
+    def query(self, since=None, until=None, points=1000, mode="minmax"):
+        """
+        Frame with a ts column and one column per metric, at most `points`
+        rows. mode="minmax" emits each output bucket's min then max (spikes
+        survive decimation); mode="mean" emits one averaged point.
+        """
+        empty = pd.DataFrame({"ts": pd.to_datetime([]), **{m: [] for m in self.metrics}})
+        with self._lock:
+            span = self.span()
+            if span is None:
+                return empty
+            t0 = span[0] if since is None else max(_seconds(since), span[0])
+            t1 = span[1] if until is None else min(_seconds(until), span[1])
+            if t1 < t0:
+                return empty
+            n_out = max(1, points // 2 if mode == "minmax" else points)
+            for level in self.levels:
+                e0, e1 = int(t0 // level.width), int(t1 // level.width)
+                if e1 - e0 + 1 <= level.capacity and level.covers(e0):
+                    break
+            got = level.buckets(e0, e1)
+        if got is None or not len(got[0]):
+            return empty
+        epochs, count, total, mn, mx = got
+
+        # fold buckets into at most n_out groups
+        n = e1 - e0 + 1
+        group = (epochs - e0) * n_out // n
+        starts = np.flatnonzero(np.diff(group, prepend=-1))
+        t_first = epochs[starts] * level.width
+        t_last = (np.append(epochs[starts[1:] - 1], epochs[-1]) + 1) * level.width
+        if mode == "mean":
+            means = np.add.reduceat(total, starts, axis=0) / np.add.reduceat(count, starts)[:, None]
+            ts, data = (t_first + t_last) / 2, means
+        else:
+            lo = np.minimum.reduceat(mn, starts, axis=0)
+            hi = np.maximum.reduceat(mx, starts, axis=0)
+            ts = np.column_stack([t_first, (t_first + t_last) / 2]).ravel()
+            data = np.stack([lo, hi], axis=1).reshape(-1, len(self.metrics))
+        out = pd.DataFrame(data, columns=list(self.metrics))
+        out.insert(0, "ts", pd.to_datetime(ts, unit="s"))
+        return out
+
+
+def _seconds(t):
+    if isinstance(t, (int, float)):
+        return float(t)
+    t = pd.Timestamp(t)
+    if t.tzinfo is None:
+        t = t.tz_localize(timezone.utc)
+    return t.timestamp()
@@ -0,0 +1,203 @@
+"""
+Batch feature engine: the 12 ModelService features for a whole stored
+history at once.
+
+    python feature_backfill.py features data.csv features.npy
+    python feature_backfill.py relabel data.csv relabeled.csv [--engine compiled]
+    python feature_backfill.py parity data.csv [--rows 200000]
+
+Rows are grouped by device (stable, so each device keeps its arrival
+order) and every feature is computed with array operations. The rolling
+means replay DeviceStateStore's arithmetic exactly: a running sum
+(S - oldest) + newest, re-summed from the ring once per lap. Only the
+position inside a lap is looped over (roll_size iterations), never the
+rows. The result is bit-identical to calling
+ModelService.compute_features row by row, which `parity` checks.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomaly import DEFAULT_THRESHOLD, raise_label
+from telemetry_writer import CSV_COLUMNS, OPTIONAL_COLUMNS
+
+SENSORS = ["temp", "hum", "gas"]
+
+
+def read_history(path, backend="csv"):
+    """Stored rows in arrival order. CSV floats are parsed round-trip exact (parity needs it)."""
+    if backend == "csv":
+        df = pd.read_csv(path, float_precision="round_trip", dtype={"device": str, "ts": str})
+        missing = [c for c in CSV_COLUMNS if c not in df.columns]
+        if missing:
+            df = pd.read_csv(path, header=None, float_precision="round_trip").iloc[:, :len(CSV_COLUMNS)]
+            df.columns = CSV_COLUMNS
+    else:
+        from storage import open_store
+        df = open_store(backend, path).read(columns=CSV_COLUMNS + OPTIONAL_COLUMNS)
+        df["device"] = df["device"].astype(str)
+    for c in SENSORS + ["heartrate"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype(np.float64)
+    return df
+
+
+def accepted_mask(df):
+    """
+    Rows MQTTRunner would keep: per device, ts must be newer than the last
+    accepted ts (old / duplicate packets are dropped). Accepted ts only
+    grow, so "last accepted" is the running max of the earlier rows.
+    """
+    ts = df["ts"].fillna("").astype(str)
+    prev_max = ts.groupby(df["device"].astype(str).to_numpy(), sort=False).transform(
+        lambda s: s.cummax().shift())
+    return (prev_max.isna() | (prev_max == "") | (ts > prev_max)).to_numpy()
+
+
+def compute_features(df, roll_size=3):
+    """
+    (N, 12) float64 matrix in df's row order, columns as model.FEATURE_NAMES.
+    Same values as feeding the rows through one fresh ModelService.
+    """
+    n_rows = len(df)
+    out = np.zeros((n_rows, 12), dtype=np.float64)
+    if not n_rows:
+        return out
+    R = int(roll_size)
+    codes, _ = pd.factorize(df["device"].astype(str).to_numpy(), sort=False)
+    order = np.argsort(codes, kind="stable")
+    X = df[SENSORS].to_numpy(dtype=np.float64)[order]
+    hr = df["heartrate"].to_numpy(dtype=np.float64)[order]
+    g = codes[order]
+
+    first = np.empty(n_rows, dtype=bool)
+    first[0] = True
+    first[1:] = g[1:] != g[:-1]
+    idx = np.arange(n_rows)
+    k = idx - np.maximum.accumulate(np.where(first, idx, 0))  # position inside the device
+
+    # deltas vs. the previous reading of the same device
+    d = np.zeros_like(X)
+    d[1:] = X[1:] - X[:-1]
+    d[first] = 0.0
+
+    # rolling sums exactly as DeviceStateStore.update() produces them
+    S = np.empty_like(X)
+    lap = k % R
+    rows = np.flatnonzero(lap == R - 1)
+    acc = np.zeros((len(rows), 3))
+    for i in range(R):
+        acc = acc + X[rows - (R - 1) + i]
+    S[rows] = acc
+    for j in range(R - 1):
+        rows = np.flatnonzero(lap == j)
+        kr = k[rows]
+        prev = np.where((kr > 0)[:, None], S[rows - 1], 0.0)
+        filling = (kr < R)[:, None]
+        S[rows] = np.where(filling, prev + X[rows], (prev - X[rows - R]) + X[rows])
+    r = S / np.minimum(k + 1, R)[:, None]
+
+    trend = np.zeros((n_rows, 2))
+    trend[1:] = r[1:, [0, 2]] - r[:-1, [0, 2]]
+    trend[first] = 0.0
+
+    hr = np.where(np.isnan(hr), 0.0, hr)
+    feats = np.column_stack([X, d, r, hr, trend])
+    out[order] = feats
+    return out
+
+
+def relabel(df, model_service, chunk_rows=65536, anomaly_threshold=None):
+    """
+    New label per row (list), features computed in one pass, prediction in
+    chunks. With anomaly_threshold, a stored anomaly score raises the label
+    the same way the live runner did (anomaly.raise_label).
+    """
+    X = compute_features(df, model_service.roll_size)
+    labels = []
+    for i in range(0, len(X), chunk_rows):
+        labels.extend(model_service.predict_batch(X[i:i + chunk_rows]))
+    if anomaly_threshold is not None and "anomaly" in df.columns:
+        scores = pd.to_numeric(df["anomaly"], errors="coerce").to_numpy()
+        labels = [label if s != s else raise_label(label, s, anomaly_threshold)
+                  for label, s in zip(labels, scores.tolist())]
+    return labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch feature backfill / relabel for stored telemetry")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("features", "relabel", "parity"):
+        p = sub.add_parser(name)
+        p.add_argument("src")
+        if name != "parity":
+            p.add_argument("dst")
+        p.add_argument("--backend", choices=["csv", "parquet"], default="csv")
+        p.add_argument("--roll-size", type=int, default=3)
+        p.add_argument("--keep-duplicates", action="store_true",
+                       help="do not drop rows the live runner would reject as old/duplicate")
+        if name != "features":
+            p.add_argument("--model", default="models/smarthealth_retrained.pkl")
+        if name == "relabel":
+            p.add_argument("--engine", choices=["sklearn", "compiled"], default="sklearn")
+            p.add_argument("--anomaly-threshold", type=float, default=DEFAULT_THRESHOLD,
+                           help="stored anomaly score from which a label is raised to ALERT (0 = ignore)")
+        if name == "parity":
+            p.add_argument("--rows", type=int, default=None, help="only check the first N rows")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    df = read_history(args.src, args.backend)
+    if args.cmd == "parity" and args.rows:
+        df = df.iloc[:args.rows]
+    if not args.keep_duplicates:
+        df = df[accepted_mask(df)].reset_index(drop=True)
+    t_read = time.perf_counter() - t0
+    print(f"[BACKFILL] {len(df)} rows from {args.src} in {t_read:.2f}s")
+
+    if args.cmd == "features":
+        t = time.perf_counter()
+        X = compute_features(df, args.roll_size)
+        print(f"[BACKFILL] features: {len(df) / max(time.perf_counter() - t, 1e-9):,.0f} rows/s")
+        np.save(args.dst, X)
+
+    elif args.cmd == "relabel":
+        from model import ModelService
+        svc = ModelService(args.model, roll_size=args.roll_size, engine=args.engine)
+        t = time.perf_counter()
+        labels = relabel(df, svc, anomaly_threshold=args.anomaly_threshold or None)
+        elapsed = time.perf_counter() - t
+        changed = int((df["ai"].astype(str).to_numpy() != np.asarray(labels)).sum())
+        df["ai"] = labels
+        df.to_csv(args.dst, index=False,
+                  columns=[c for c in CSV_COLUMNS + OPTIONAL_COLUMNS if c in df.columns])
+        print(f"[BACKFILL] relabel: {len(df) / max(elapsed, 1e-9):,.0f} rows/s, "
+              f"{changed} labels changed -> {args.dst}")
+
+    else:
+        from model import ModelService
+        t = time.perf_counter()
+        batch = compute_features(df, args.roll_size)
+        t_batch = time.perf_counter() - t
+        svc = ModelService(args.model, roll_size=args.roll_size)
+        t = time.perf_counter()
+        stream = np.empty_like(batch)
+        cols = zip(df["device"].astype(str), df["temp"].tolist(), df["hum"].tolist(), df["gas"].tolist(),
+                   df["heartrate"].tolist())
+        for i, (device, temp, hum, gas, hr) in enumerate(cols):
+            # CSV rows without a heart rate reach the live path as None
+            stream[i] = svc.compute_features(device, temp, hum, gas, heartrate=None if hr != hr else hr)[0]
+        t_stream = time.perf_counter() - t
+        same = (batch == stream) | (np.isnan(batch) & np.isnan(stream))
+        bad = np.flatnonzero(~same.all(axis=1))
+        print(f"[BACKFILL] parity: {len(df) - len(bad)}/{len(df)} rows identical, "
+              f"batch {len(df) / max(t_batch, 1e-9):,.0f} rows/s vs streaming {len(df) / max(t_stream, 1e-9):,.0f} rows/s")
+        if len(bad):
+            i = int(bad[0])
+            print(f"[BACKFILL] first mismatch at row {i}: batch={batch[i].tolist()} stream={stream[i].tolist()}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Flatten a scikit-learn RandomForestClassifier (+ optional StandardScaler)
+into a handful of contiguous NumPy arrays and evaluate all trees over a
+batch with vectorised traversal.
+
+    python forest_compiler.py models/smarthealth_retrained.pkl models/smarthealth_retrained.npz
+
+The .npz is written uncompressed so load_npz() can memory-map every
+array straight out of the archive.
+"""
+import argparse
+import zipfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _plain(a):
+    # object arrays (string class labels) would need pickle to load back
+    a = np.asarray(a)
+    return a.astype(str) if a.dtype == object else a
+
+
+def compile_forest(model, scaler=None):
+    """Return a dict of flat arrays describing `model` (and `scaler`)."""
+    trees = [est.tree_ for est in model.estimators_]
+    n_classes = int(model.n_classes_)
+
+    sizes = [t.node_count for t in trees]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    total = int(sum(sizes))
+
+    feature = np.empty(total, dtype=np.int32)
+    threshold = np.empty(total, dtype=np.float64)
+    left = np.empty(total, dtype=np.int32)
+    right = np.empty(total, dtype=np.int32)
+    value = np.empty((total, n_classes), dtype=np.float64)
+
+    for off, t in zip(offsets, trees):
+        n = t.node_count
+        sl = slice(off, off + n)
+        is_leaf = t.children_left == -1
+        feature[sl] = np.where(is_leaf, 0, t.feature)
+        threshold[sl] = t.threshold
+        # children become global node ids; leaves point to themselves
+        own = np.arange(off, off + n, dtype=np.int32)
+        left[sl] = np.where(is_leaf, own, t.children_left + off)
+        right[sl] = np.where(is_leaf, own, t.children_right + off)
+        v = t.value[:, 0, :].astype(np.float64)
+        norm = v.sum(axis=1, keepdims=True)
+        norm[norm == 0] = 1.0
+        value[sl] = v / norm
+
+    arrays = {
+        "version": np.array([FORMAT_VERSION], dtype=np.int32),
+        "feature": feature,
+        "threshold": threshold,
+        "left": left,
+        "right": right,
+        "value": value,
+        "roots": offsets,
+        "max_depth": np.array([max(t.max_depth for t in trees)], dtype=np.int32),
+        "n_features": np.array([int(model.n_features_in_)], dtype=np.int32),
+        "classes": _plain(model.classes_),
+    }
+    if scaler is not None:
+        arrays["scaler_mean"] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays["scaler_scale"] = np.asarray(scaler.scale_, dtype=np.float64)
+    return arrays
+
+
+def export_npz(model_source, path):
+    """model_source: pkl path or {'model':..., 'scaler':...} dict (same as ModelService)."""
+    if isinstance(model_source, str):
+        import joblib
+        data = joblib.load(model_source)
+    else:
+        data = model_source
+    if not isinstance(data, dict):
+        data = {"model": data}
+    arrays = compile_forest(data["model"], data.get("scaler"))
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+    return path
+
+
+def load_npz(path, mmap=True):
+    """
+    Load an exported forest. With mmap=True every array is a read-only
+    np.memmap into the (uncompressed) archive, so processes loading the
+    same file share its pages.
+    """
+    if not mmap:
+        with np.load(path, allow_pickle=False) as z:
+            return {k: z[k] for k in z.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as raw:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # local file header: 30 bytes + name + extra field, then the .npy
+            raw.seek(info.header_offset)
+            header = raw.read(30)
+            name_len = int.from_bytes(header[26:28], "little")
+            extra_len = int.from_bytes(header[28:30], "little")
+            data_start = info.header_offset + 30 + name_len + extra_len
+            raw.seek(data_start)
+            major, _ = np.lib.format.read_magic(raw)
+            if major == 1:
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(raw)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(raw)
+            if dtype.hasobject:
+                raise ValueError(f"{path}:{name} holds Python objects and cannot be memory-mapped")
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=raw.tell(),
+                                     shape=shape, order="F" if fortran else "C")
+    return arrays
+
+
+class CompiledForest:
+    """Vectorised evaluator over the arrays produced by compile_forest()."""
+
+    def __init__(self, arrays):
+        version = int(arrays["version"][0])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled forest version {version}")
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = np.asarray(arrays["roots"])
+        self.max_depth = int(arrays["max_depth"][0])
+        self.n_features_in_ = int(arrays["n_features"][0])
+        self.classes_ = np.asarray(arrays["classes"])
+        self.n_estimators = len(self.roots)
+        self.scaler_mean = arrays.get("scaler_mean")
+        self.scaler_scale = arrays.get("scaler_scale")
+
+    @classmethod
+    def from_model(cls, model, scaler=None):
+        return cls(compile_forest(model, scaler))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return cls(load_npz(path, mmap=mmap))
+
+    @property
+    def has_scaler(self):
+        return self.scaler_mean is not None
+
+    def transform(self, X):
+        """StandardScaler.transform on a plain array (same float64 ops)."""
+        X = np.array(X, dtype=np.float64, copy=True)
+        if self.has_scaler:
+            X -= self.scaler_mean
+            X /= self.scaler_scale
+        return X
+
+    def apply(self, X):
+        """Leaf node id per (tree, row): shape (n_trees, n_rows)."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, nf = X.shape
+        flat = X.ravel()
+        # one flat lane per (tree, row); leaves point to themselves, so
+        # max_depth steps land every lane on its leaf without a mask
+        base = np.tile(np.arange(n, dtype=np.int64) * nf, self.n_estimators)
+        idx = np.repeat(self.roots, n)
+        for _ in range(self.max_depth):
+            go_left = flat.take(base + self.feature.take(idx)) <= self.threshold.take(idx)
+            idx = np.where(go_left, self.left.take(idx), self.right.take(idx))
+        return idx.reshape(self.n_estimators, n)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        return self.value[leaves].sum(axis=0) / self.n_estimators
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a RandomForest .pkl to a flat, mmap-able .npz")
+    parser.add_argument("model_path")
+    parser.add_argument("out_path")
+    args = parser.parse_args(argv)
+    export_npz(args.model_path, args.out_path)
+    forest = CompiledForest.load(args.out_path)
+    print(f"[FOREST] {forest.n_estimators} trees, {len(forest.feature)} nodes, "
+          f"depth {forest.max_depth} -> {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
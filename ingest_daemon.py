@@ -0,0 +1,115 @@
+"""
+Standalone ingest service: one broker connection, one model, one writer.
+
+    python ingest_daemon.py --broker broker.emqx.io --store-backend csv --store-path data.csv
+
+Runs an MQTTRunner (subscribe SHHE/data -> features -> prediction ->
+storage -> SHHE/status) and serves its state on a Unix socket (ipc.py).
+Dashboards started with INGEST_SOCKET set attach to it instead of each
+opening their own connection and appending to data.csv; they only read
+state and ask the daemon to publish schedules. With
+--shm-name the latest record per device is also kept in shared memory
+(shared_state.py) for readers that should not pay a socket round trip.
+--runner async swaps in AsyncMQTTRunner (async_runner.py).
+"""
+import argparse
+import signal
+import threading
+
+from anomaly import DEFAULT_THRESHOLD
+from async_runner import AsyncMQTTRunner
+from ipc import DEFAULT_SOCKET, IngestServer
+from mqtt_client import MQTTRunner
+from pipeline import OVERLOAD_POLICIES, DROP_OLDEST
+from shared_state import SharedStateTable
+from storage import open_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SmartHealth MQTT ingest daemon")
+    parser.add_argument("--broker", default="broker.emqx.io")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--model", default="models/smarthealth_retrained.pkl")
+    parser.add_argument("--engine", choices=["sklearn", "compiled"], default="sklearn")
+    parser.add_argument("--store-backend", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--store-path", default=None)
+    parser.add_argument("--csv-index", action="store_true",
+                        help="csv backend: keep a time-bucket index next to the file (csv_index.py)")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--overload", choices=OVERLOAD_POLICIES, default=DROP_OLDEST)
+    parser.add_argument("--batch-window-ms", type=float, default=0)
+    parser.add_argument("--shards", type=int, default=0,
+                        help="run features + prediction in this many worker processes (0 = in this process)")
+    parser.add_argument("--max-devices", type=int, default=None,
+                        help="keep feature history for at most this many devices (LRU)")
+    parser.add_argument("--device-ttl", type=float, default=None,
+                        help="forget a device's feature history after this many idle seconds")
+    parser.add_argument("--prediction-cache", type=int, default=0,
+                        help="memoise forest results for this many distinct readings (0 = off)")
+    parser.add_argument("--prediction-cache-ttl", type=float, default=None,
+                        help="seconds a memoised forest result stays valid")
+    parser.add_argument("--rules", default=None,
+                        help="JSON safety rule table, reloaded when it changes (default: built-in rules)")
+    parser.add_argument("--no-anomaly", action="store_true",
+                        help="skip the per-device anomaly scores (anomaly.py)")
+    parser.add_argument("--anomaly-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="anomaly score from which a reading is raised to ALERT")
+    parser.add_argument("--shm-name", default=None,
+                        help="also publish the latest record per device in this shared memory table")
+    parser.add_argument("--shm-slots", type=int, default=1024)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus text metrics on http://127.0.0.1:<port>/metrics")
+    parser.add_argument("--runner", choices=["threaded", "async"], default="threaded",
+                        help="async: asyncio tasks instead of paho loop_forever + worker threads")
+    parser.add_argument("--topic-shards", type=int, default=0,
+                        help="async runner: also subscribe SHHE/data/0..N-1")
+    parser.add_argument("--connections", type=int, default=1,
+                        help="async runner: broker connections the topics are spread over")
+    args = parser.parse_args(argv)
+
+    table = SharedStateTable.create(args.shm_name, n_slots=args.shm_slots) if args.shm_name else None
+    store_path = args.store_path or ("data.csv" if args.store_backend == "csv" else "data_store")
+    common = dict(
+        broker=args.broker,
+        port=args.port,
+        model_path=args.model,
+        csv_path=store_path,
+        store=open_store(args.store_backend, store_path,
+                         **({"index": True} if args.csv_index and args.store_backend == "csv" else {})),
+        queue_size=args.queue_size,
+        overload=args.overload,
+        model_engine=args.engine,
+        shared_state=table,
+        max_devices=args.max_devices,
+        device_ttl=args.device_ttl,
+        metrics_port=args.metrics_port,
+        prediction_cache={"capacity": args.prediction_cache, "ttl": args.prediction_cache_ttl}
+        if args.prediction_cache > 0 else None,
+        rules_path=args.rules,
+        anomaly=False if args.no_anomaly else {"threshold": args.anomaly_threshold},
+    )
+    if args.runner == "async":
+        runner = AsyncMQTTRunner(topic_shards=args.topic_shards, connections=args.connections, **common)
+    else:
+        runner = MQTTRunner(batch_window_ms=args.batch_window_ms, workers=args.workers,
+                            shards=args.shards, **common)
+    server = IngestServer(runner, args.socket).start()
+    runner.start()
+    print(f"[DAEMON] ingesting {args.broker}:{args.port} -> {args.store_backend}:{store_path}, serving {args.socket}")
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    stop.wait()
+
+    print("[DAEMON] shutting down")
+    server.close()
+    runner.stop()
+    if table is not None:
+        table.close()
+
+
+if __name__ == "__main__":
+    main()
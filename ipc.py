@@ -0,0 +1,330 @@
+"""
+Local IPC between the ingest daemon and dashboards.
+
+One Unix stream socket, newline-delimited JSON. Each request line is
+{"op": ..., ...} and gets exactly one reply line {"ok": true, "result": ...}
+(or {"ok": false, "error": ...}), except "subscribe", which turns the
+connection into a stream of one record per line.
+
+    latest            -> MQTTRunner.get_latest_record()
+    status            -> MQTTRunner.get_last_status()
+    version           -> MQTTRunner.get_version()
+    stats             -> MQTTRunner.get_stats(device, window)
+    pipeline_stats    -> MQTTRunner.get_pipeline_stats()
+    metrics           -> MQTTRunner.get_metrics()
+    publish_obat      -> MQTTRunner.publish_obat(schedules)
+    publish_schedule  -> MQTTRunner.publish_schedule(payload)
+    subscribe         -> stream of records as they are processed
+
+IngestClient exposes the same methods as MQTTRunner, so app.py can use
+either one. The client never touches the broker or the store itself.
+Given the daemon's shared memory table name it answers latest/version
+from there without a round trip.
+
+The socket is not read-only: publish_obat / publish_schedule make the
+daemon publish to the broker on the client's behalf. Anyone who can
+connect can do that, so access is limited by the socket's file mode
+(0660, owner and group).
+
+An {"ok": false} reply is treated like an unreachable daemon by the
+MQTTRunner-style getters: logged, and the caller gets the fallback value.
+call() raises it as RuntimeError.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from collections import deque
+
+from stats import WINDOW_ALL
+
+DEFAULT_SOCKET = "/tmp/smarthealth-ingest.sock"
+
+
+def _jsonable(o):
+    # numpy scalars / datetimes in records and stats snapshots
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+def _dumps(obj):
+    return (json.dumps(obj, default=_jsonable) + "\n").encode("utf-8")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        with self.server.conn_lock:
+            self.server.conns.add(self.request)
+
+    def finish(self):
+        with self.server.conn_lock:
+            self.server.conns.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        runner = self.server.runner
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                op = req.get("op")
+                if op == "subscribe":
+                    self._stream(runner, int(req.get("maxsize", 1000)))
+                    return
+                result = self._call(runner, op, req)
+                reply = {"ok": True, "result": result}
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write(_dumps(reply))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def _call(self, runner, op, req):
+        if op == "latest":
+            return runner.get_latest_record()
+        if op == "status":
+            return runner.get_last_status()
+        if op == "version":
+            return runner.get_version()
+        if op == "stats":
+            return runner.get_stats(device=req.get("device"), window=req.get("window", WINDOW_ALL))
+        if op == "pipeline_stats":
+            return runner.get_pipeline_stats()
+        if op == "metrics":
+            return runner.get_metrics()
+        if op == "publish_obat":
+            runner.publish_obat(req.get("schedules") or [])
+            return True
+        if op == "publish_schedule":
+            runner.publish_schedule(req.get("payload"))
+            return True
+        raise ValueError(f"unknown op {op!r}")
+
+    def _stream(self, runner, maxsize):
+        sub = runner.subscribe(maxsize)
+        try:
+            while not self.server.closing:
+                item = sub.get(timeout=1.0)
+                # empty line = keepalive, lets us notice a closed reader
+                self.wfile.write(_dumps(item) if item is not None else b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            sub.close()
+
+
+class IngestServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves one MQTTRunner over a Unix socket; start() runs it on a daemon thread."""
+
+    daemon_threads = True
+
+    def __init__(self, runner, path=DEFAULT_SOCKET):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.runner = runner
+        self.path = path
+        self.closing = False
+        self.conns = set()
+        self.conn_lock = threading.Lock()
+        self._thread = None
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="ingest-ipc", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.closing = True
+        self.shutdown()
+        self.server_close()
+        with self.conn_lock:
+            conns = list(self.conns)
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ClientSubscription:
+    """Same surface as broadcast.Subscription, fed by a streaming connection."""
+
+    def __init__(self, path, maxsize=1000, timeout=2.0):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(path)
+        self._sock.sendall(_dumps({"op": "subscribe", "maxsize": maxsize}))
+        self._sock.settimeout(None)
+        self._thread = threading.Thread(target=self._read, name="ingest-sub", daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            for line in self._sock.makefile("rb"):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                with self._cond:
+                    if len(self._items) == self._items.maxlen:
+                        self.dropped += 1
+                    self._items.append(item)
+                    self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items and not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            return self._items.popleft() if self._items else None
+
+    def drain(self):
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class IngestClient:
+    """
+    Read-only handle on a running ingest daemon with MQTTRunner's getter
+    API. Requests share one connection (reconnected on failure); if the
+    daemon is down, getters return the same empty values a fresh
+    MQTTRunner would.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=2.0, shm_name=None):
+        self.path = path
+        self.timeout = timeout
+        self.shm_name = shm_name
+        self._table = None
+        self._lock = threading.Lock()
+        self._sock = None
+        self._rfile = None
+
+    def _shared(self):
+        if self._table is None and self.shm_name:
+            from shared_state import SharedStateTable
+            try:
+                self._table = SharedStateTable.attach(self.shm_name)
+            except FileNotFoundError:
+                return None
+        return self._table
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def _drop(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._rfile = None
+
+    def call(self, op, **kw):
+        req = _dumps(dict(kw, op=op))
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(req)
+                    line = self._rfile.readline()
+                    if not line:
+                        raise ConnectionError("ingest daemon closed the connection")
+                    break
+                except OSError:
+                    self._drop()
+                    if attempt:
+                        raise
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply["result"]
+
+    def _get(self, op, default, **kw):
+        try:
+            return self.call(op, **kw)
+        except OSError as e:
+            print("[IPC] ingest daemon unavailable:", e)
+            return default
+        except RuntimeError as e:
+            print(f"[IPC] ingest daemon failed {op}:", e)
+            return default
+
+    # ---- MQTTRunner-compatible surface ----
+    def start(self):
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._drop()
+
+    def get_latest_record(self):
+        table = self._shared()
+        if table is not None:
+            return table.latest()
+        return self._get("latest", None)
+
+    def get_last_status(self):
+        return self._get("status", "N/A")
+
+    def get_version(self):
+        table = self._shared()
+        if table is not None:
+            return table.version()
+        return self._get("version", 0)
+
+    def get_stats(self, device=None, window=WINDOW_ALL):
+        return self._get("stats", {}, device=device, window=window)
+
+    def get_pipeline_stats(self):
+        return self._get("pipeline_stats", {})
+
+    def get_metrics(self):
+        return self._get("metrics", {})
+
+    def publish_obat(self, schedules):
+        if schedules:
+            self._get("publish_obat", False, schedules=schedules)
+
+    def publish_schedule(self, payload):
+        if payload:
+            self._get("publish_schedule", False, payload=payload)
+
+    def subscribe(self, maxsize=1000):
+        return ClientSubscription(self.path, maxsize=maxsize, timeout=self.timeout)
@@ -0,0 +1,177 @@
+"""
+Minimal in-process MQTT 3.1.1 broker for tests and benchmarks.
+
+    broker = LocalBroker().start()          # own thread + event loop
+    runner = MQTTRunner("127.0.0.1", broker.port, ...)
+    broker.inject("SHHE/data", payload)     # publish without a client
+
+Speaks just enough of the protocol for paho clients: CONNECT, SUBSCRIBE
+(+ and # wildcards), UNSUBSCRIBE, PUBLISH at QoS 0/1 (delivered at QoS 0),
+PINGREQ and DISCONNECT. No retained messages, sessions or auth. Every
+delivered message is counted per topic so tests can check what was
+published (e.g. SHHE/status).
+"""
+import asyncio
+import threading
+from collections import Counter
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    p, t = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        b, n = n % 128, n // 128
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+
+def _packet(ptype, body, flags=0):
+    return bytes([ptype << 4 | flags]) + _varint(len(body)) + body
+
+
+def _publish_packet(topic, payload):
+    t = topic.encode("utf-8")
+    return _packet(PUBLISH, len(t).to_bytes(2, "big") + t + payload)
+
+
+class _Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.filters = set()
+
+
+class LocalBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self._server = None
+        self._sessions = set()
+        self._thread = None
+        self._ready = threading.Event()
+        self.received = Counter()   # topic -> messages published to the broker
+        self.last_payload = {}      # topic -> last payload bytes
+        self.delivered = 0
+
+    # ---------------- LIFECYCLE ----------------
+    def start(self):
+        """Run the broker on its own thread; returns once it is listening."""
+        self._thread = threading.Thread(target=self._run, name="local-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.serve())
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def serve(self):
+        """Start listening on the current loop (for callers that already run asyncio)."""
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        if self.loop is None:
+            return
+        fut = asyncio.run_coroutine_threadsafe(self.aclose(), self.loop)
+        fut.result(5)
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(5)
+
+    async def aclose(self):
+        self._server.close()
+        for s in list(self._sessions):
+            s.writer.close()
+        await self._server.wait_closed()
+
+    # ---------------- ROUTING ----------------
+    def inject(self, topic, payload):
+        """Publish from outside the loop, as if a client had sent it."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.loop.call_soon_threadsafe(self._route, topic, payload)
+
+    def _route(self, topic, payload):
+        self.received[topic] += 1
+        self.last_payload[topic] = payload
+        packet = None
+        for s in self._sessions:
+            if any(topic_matches(f, topic) for f in s.filters):
+                packet = packet or _publish_packet(topic, payload)
+                s.writer.write(packet)
+                self.delivered += 1
+
+    async def _read_packet(self, reader):
+        head = await reader.readexactly(1)
+        length, shift = 0, 0
+        while True:
+            b = (await reader.readexactly(1))[0]
+            length |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        return head[0] >> 4, head[0] & 0x0F, await reader.readexactly(length)
+
+    async def _client(self, reader, writer):
+        session = _Session(writer)
+        self._sessions.add(session)
+        try:
+            while True:
+                ptype, flags, body = await self._read_packet(reader)
+                if ptype == CONNECT:
+                    writer.write(_packet(CONNACK, b"\x00\x00"))
+                elif ptype == PUBLISH:
+                    n = int.from_bytes(body[:2], "big")
+                    topic = body[2:2 + n].decode("utf-8")
+                    pos = 2 + n
+                    if (flags >> 1) & 3:
+                        writer.write(_packet(PUBACK, body[pos:pos + 2]))
+                        pos += 2
+                    self._route(topic, body[pos:])
+                elif ptype in (SUBSCRIBE, UNSUBSCRIBE):
+                    pid, pos, granted = body[:2], 2, b""
+                    while pos < len(body):
+                        n = int.from_bytes(body[pos:pos + 2], "big")
+                        topic = body[pos + 2:pos + 2 + n].decode("utf-8")
+                        pos += 2 + n
+                        if ptype == SUBSCRIBE:
+                            pos += 1   # requested QoS; everything goes out at QoS 0
+                            session.filters.add(topic)
+                            granted += b"\x00"
+                        else:
+                            session.filters.discard(topic)
+                    if ptype == SUBSCRIBE:
+                        writer.write(_packet(SUBACK, pid + granted))
+                    else:
+                        writer.write(_packet(UNSUBACK, pid))
+                elif ptype == PINGREQ:
+                    writer.write(_packet(PINGRESP, b""))
+                elif ptype == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            writer.close()
@@ -0,0 +1,266 @@
+"""
+Medicine schedules as recurrence rules.
+
+The scheduler tab used to expand start..end x times into every
+"YYYY-MM-DD HH:MM" string, keep that list in the browser session and
+publish it whole on SHHE/obat. Now a schedule is one rule
+
+    {"id": "r3", "medicine": "Paracetamol", "start": "2025-01-01",
+     "end": "2025-01-07", "times": ["08:00", "20:00"], "every_days": 1}
+
+and doses are generated from it when needed (occurrences, next_dose,
+dose_count). ScheduleStore keeps the rules in a JSON file, so they
+survive restarts and every browser session sees the same list, plus a
+heap of each rule's next dose for next_due() / upcoming().
+
+Every change bumps the store version and returns the compact SHHE/obat
+payload describing it, instead of a list of datetimes:
+
+    {"op": "put", "v": 4, "base": 3, "rules": [{"id": "r3", "m": "Paracetamol",
+     "s": "2025-01-01", "e": "2025-01-07", "t": ["08:00", "20:00"]}]}
+    {"op": "del", "v": 5, "base": 4, "ids": ["r3"]}
+    {"op": "sync", "v": 5, "rules": [...]}
+
+"put" adds or replaces rules by id ("d": every_days, only when > 1).
+A device whose version differs from "base" missed a change and needs
+a "sync" (sync_payload()).
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+DATE_FMT = "%Y-%m-%d"
+TIME_FMT = "%H:%M"
+
+
+def _date(v):
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    return datetime.strptime(v, DATE_FMT).date()
+
+
+def _time(v):
+    if isinstance(v, time):
+        return v.replace(second=0, microsecond=0)
+    return datetime.strptime(v, TIME_FMT).time()
+
+
+# ---------------- RULES ----------------
+def make_rule(medicine, start, end, times, every_days=1, rule_id=None):
+    medicine = (medicine or "").strip()
+    if not medicine:
+        raise ValueError("medicine name is empty")
+    start, end = _date(start), _date(end)
+    if start > end:
+        raise ValueError("start date is after end date")
+    times = sorted({_time(t).strftime(TIME_FMT) for t in times or ()})
+    if not times:
+        raise ValueError("no dose times")
+    every_days = int(every_days)
+    if every_days < 1:
+        raise ValueError("every_days must be >= 1")
+    return {"id": rule_id, "medicine": medicine, "start": start.strftime(DATE_FMT),
+            "end": end.strftime(DATE_FMT), "times": times, "every_days": every_days}
+
+
+def dose_count(rule):
+    days = (_date(rule["end"]) - _date(rule["start"])).days // rule.get("every_days", 1) + 1
+    return days * len(rule["times"])
+
+
+def occurrences(rule, since=None, until=None):
+    """Dose datetimes of a rule in order, from `since` (inclusive) to `until` (inclusive)."""
+    start, end = _date(rule["start"]), _date(rule["end"])
+    step = rule.get("every_days", 1)
+    times = [_time(t) for t in rule["times"]]
+    day = start
+    if since is not None and since.date() > start:
+        # jump straight to the period holding `since` instead of walking there
+        day = start + timedelta(days=(since.date() - start).days // step * step)
+    while day <= end:
+        for t in times:
+            dt = datetime.combine(day, t)
+            if since is not None and dt < since:
+                continue
+            if until is not None and dt > until:
+                return
+            yield dt
+        day += timedelta(days=step)
+
+
+def next_dose(rule, now):
+    return next(occurrences(rule, since=now), None)
+
+
+def compact(rule):
+    """Rule as sent on SHHE/obat (short keys)."""
+    out = {"id": rule["id"], "m": rule["medicine"], "s": rule["start"], "e": rule["end"], "t": rule["times"]}
+    if rule.get("every_days", 1) > 1:
+        out["d"] = rule["every_days"]
+    return out
+
+
+def _mergeable(a, b):
+    """b continues / overlaps a: same medicine, times and step, aligned day grid."""
+    if (a["medicine"], a["times"], a.get("every_days", 1)) != (b["medicine"], b["times"], b.get("every_days", 1)):
+        return False
+    step = timedelta(days=a.get("every_days", 1))
+    a0, a1, b0, b1 = _date(a["start"]), _date(a["end"]), _date(b["start"]), _date(b["end"])
+    if (b0 - a0).days % step.days:
+        return False
+    return b0 <= a1 + step and b1 >= a0 - step
+
+
+def _tagged(rule, tie, since):
+    for dt in occurrences(rule, since=since):
+        yield dt, tie, rule
+
+
+# ---------------- STORE ----------------
+class ScheduleStore:
+    def __init__(self, path="medicine_schedules.json", clock=datetime.now):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.RLock()
+        self.rules = {}       # id -> rule, insertion order
+        self.version = 0
+        self._next_id = 1
+        self._rev = {}        # id -> revision, to spot stale heap entries
+        self._heap = []       # (next dose, tiebreak, id, revision)
+        self._tie = itertools.count()
+        self._load()
+
+    # ---- persistence ----
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError) as e:
+            print("[OBAT] Warning: cannot read", self.path, e)
+            return
+        self.version = int(doc.get("version", 0))
+        self._next_id = int(doc.get("next_id", 1))
+        for rule in doc.get("rules", []):
+            self.rules[rule["id"]] = rule
+            self._index(rule)
+
+    def _save(self):
+        if not self.path:
+            return
+        doc = {"version": self.version, "next_id": self._next_id, "rules": list(self.rules.values())}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=1)
+        os.replace(tmp, self.path)
+
+    # ---- next-dose index ----
+    def _index(self, rule, now=None):
+        rid = rule["id"]
+        rev = self._rev.get(rid, 0) + 1
+        self._rev[rid] = rev
+        first = next_dose(rule, now) if now is not None else next(occurrences(rule), None)
+        if first is not None:
+            heapq.heappush(self._heap, (first, next(self._tie), rid, rev))
+
+    def _settle(self, now):
+        """Drop removed/replaced entries and move past doses on to their next one."""
+        heap = self._heap
+        while heap:
+            dt, _, rid, rev = heap[0]
+            if self._rev.get(rid) != rev or rid not in self.rules:
+                heapq.heappop(heap)
+                continue
+            if dt >= now:
+                return
+            nxt = next_dose(self.rules[rid], now)
+            if nxt is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (nxt, next(self._tie), rid, rev))
+
+    def next_due(self, now=None):
+        """(datetime, rule) of the next dose at or after now, or None."""
+        now = now or self.clock()
+        with self._lock:
+            self._settle(now)
+            if not self._heap:
+                return None
+            dt, _, rid, _ = self._heap[0]
+            return dt, self.rules[rid]
+
+    def upcoming(self, now=None, n=10):
+        """The next n doses over all rules, in time order: [(datetime, rule), ...]."""
+        now = now or self.clock()
+        with self._lock:
+            self._settle(now)
+            live = [self.rules[rid] for _, _, rid, rev in self._heap if self._rev.get(rid) == rev]
+        streams = [_tagged(rule, i, now) for i, rule in enumerate(live)]
+        return [(dt, rule) for dt, _, rule in itertools.islice(heapq.merge(*streams), n)]
+
+    # ---- changes ----
+    def _change(self, payload):
+        payload["base"] = self.version
+        self.version += 1
+        payload["v"] = self.version
+        self._save()
+        return payload
+
+    def add(self, medicine, start, end, times, every_days=1):
+        """
+        Add a rule, or extend an existing one it continues. Returns
+        (payload, new doses); payload is None when every dose was
+        already scheduled.
+        """
+        rule = make_rule(medicine, start, end, times, every_days)
+        with self._lock:
+            for old in self.rules.values():
+                if not _mergeable(old, rule):
+                    continue
+                merged = dict(old, start=min(old["start"], rule["start"]), end=max(old["end"], rule["end"]))
+                added = dose_count(merged) - dose_count(old)
+                if not added:
+                    return None, 0
+                self.rules[old["id"]] = merged
+                self._index(merged, self.clock())
+                return self._change({"op": "put", "rules": [compact(merged)]}), added
+            rule["id"] = f"r{self._next_id}"
+            self._next_id += 1
+            self.rules[rule["id"]] = rule
+            self._index(rule, self.clock())
+            return self._change({"op": "put", "rules": [compact(rule)]}), dose_count(rule)
+
+    def remove(self, rule_id):
+        with self._lock:
+            if self.rules.pop(rule_id, None) is None:
+                return None
+            self._rev.pop(rule_id, None)
+            return self._change({"op": "del", "ids": [rule_id]})
+
+    def clear(self):
+        with self._lock:
+            self.rules.clear()
+            self._rev.clear()
+            self._heap = []
+            return self._change({"op": "sync", "rules": []})
+
+    def sync_payload(self):
+        with self._lock:
+            return {"op": "sync", "v": self.version, "rules": [compact(r) for r in self.rules.values()]}
+
+    # ---- introspection ----
+    def list(self):
+        with self._lock:
+            return [dict(r, doses=dose_count(r)) for r in self.rules.values()]
+
+    def stats(self):
+        with self._lock:
+            rules = list(self.rules.values())
+        return {"rules": len(rules), "doses": sum(dose_count(r) for r in rules),
+                "medicines": len({r["medicine"] for r in rules}), "version": self.version}
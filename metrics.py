@@ -0,0 +1,214 @@
+"""
+In-process ingest metrics with a Prometheus text endpoint.
+
+    metrics = Metrics()
+    t0 = time.perf_counter()
+    ...
+    metrics.observe("decode", time.perf_counter() - t0)   # stage latency histogram
+    metrics.inc("labels", label="GOOD")                    # counter
+    metrics.gauge("writer_queue_depth", store.writer.queue_depth)
+    MetricsServer(metrics, port=9108).start()              # GET /metrics
+
+Kept cheap enough to leave on: an observation is one bisect over fixed
+bucket bounds plus three additions under a per-histogram lock, and
+gauges are callables evaluated only when /metrics is scraped.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds, 10us .. 2.5s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5)
+DEFAULT_PORT = 9108
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)   # first bound >= value ("le")
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-quantile (inf if it is past the last bound)."""
+        counts, _, n = self.snapshot()
+        if not n:
+            return 0.0
+        rank, seen = q * n, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+def _escape(value):
+    """Label value as the Prometheus text format wants it (\\, \" and \\n escaped)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metrics:
+    def __init__(self, prefix="smarthealth"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}   # name -> {label pairs: value}
+        self._gauges = {}     # name -> (fn, kind, label, help)
+
+    # ---------------- RECORDING ----------------
+    def stage(self, name):
+        h = self._stages.get(name)
+        if h is None:
+            with self._lock:
+                h = self._stages.setdefault(name, Histogram())
+        return h
+
+    def observe(self, stage, seconds):
+        self.stage(stage).observe(seconds)
+
+    def inc(self, name, n=1, **labels):
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + n
+
+    def gauge(self, name, fn, kind="gauge", label="key", help=""):
+        """
+        fn() -> number, or {value of `label`: number} for one series per
+        key. kind="counter" for running totals owned by other components
+        (e.g. the writer's dropped rows). Evaluated at scrape time.
+        """
+        with self._lock:
+            self._gauges[name] = (fn, kind, label, help)
+
+    # ---------------- EXPORT ----------------
+    def snapshot(self):
+        """Plain dict for the dashboard / IPC: counters, gauges and p50/p99 per stage."""
+        with self._lock:
+            counters = {name: {",".join(f"{k}={v}" for k, v in key) or "total": n for key, n in series.items()}
+                        for name, series in self._counters.items()}
+            stages = dict(self._stages)
+            gauges = dict(self._gauges)
+        out = {"counters": counters, "stages": {}, "gauges": {}}
+        for name, h in stages.items():
+            _, total, n = h.snapshot()
+            out["stages"][name] = {"count": n, "mean_s": total / n if n else 0.0,
+                                   "p50_s": h.quantile(0.5), "p99_s": h.quantile(0.99)}
+        for name, (fn, _, _, _) in gauges.items():
+            try:
+                out["gauges"][name] = fn()
+            except Exception:
+                continue
+        return out
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        p = self.prefix
+        lines = []
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = {k: dict(v) for k, v in self._counters.items()}
+            gauges = dict(self._gauges)
+
+        if stages:
+            lines += [f"# HELP {p}_stage_seconds Time spent per ingest stage.",
+                      f"# TYPE {p}_stage_seconds histogram"]
+            for name, h in stages:
+                counts, total, n = h.snapshot()
+                cum = 0
+                for bound, c in zip(h.bounds + (float("inf"),), counts):
+                    cum += c
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cum}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {total!r}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {n}')
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            for key, n in sorted(counters[name].items()):
+                lines.append(f"{p}_{name}_total{_labels(key)} {_fmt(n)}")
+
+        for name in sorted(gauges):
+            fn, kind, label, help = gauges[name]
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            metric = f"{p}_{name}_total" if kind == "counter" else f"{p}_{name}"
+            if help:
+                lines.append(f"# HELP {metric} {help}")
+            lines.append(f"# TYPE {metric} {kind}")
+            if isinstance(value, dict):
+                for k, v in sorted(value.items()):
+                    lines.append(f"{metric}{_labels([(label, k)])} {_fmt(v)}")
+            else:
+                lines.append(f"{metric} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """GET /metrics on a local port, served from a daemon thread."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=DEFAULT_PORT):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        print(f"[METRICS] serving http://{self.host}:{self.port}/metrics")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,75 +1,100 @@
-import joblib
 import numpy as np
 import pandas as pd
-from collections import deque
 import os
+import time
+import model_registry
+from device_state import DeviceStateStore
+from prediction_cache import PredictionCache
+import rules as rules_mod
 
 class ModelService:
-    def __init__(self, model_source, roll_size=3):
+    def __init__(self, model_source, roll_size=3, engine="sklearn", compiled_path=None,
+                 max_devices=None, device_ttl=None, cache_options=None, cache_check_s=1.0,
+                 rules=None):
         """
         model_source: str (pkl path) atau dict {'model':..., 'scaler':..., 'features':...}
+        engine: "sklearn" or "compiled" (flattened forest, see forest_compiler.py);
+                compiled_path: optional exported .npz to memory-map instead of
+                compiling the forest in memory
+        max_devices / device_ttl: bound the per-device history (LRU / seconds idle)
+        cache_options: PredictionCache kwargs to memoise forest results
+                (None = off). With a pkl path the file is re-checked at most
+                every cache_check_s; a replaced artifact is reloaded and the
+                cache emptied.
+        rules: safety override table (rules.py) - a RuleEngine, a JSON
+                rules file (hot reloaded) or None for rules.DEFAULT_RULES
         """
         if isinstance(model_source, str):
-            import joblib, os
-            if not os.path.exists(model_source):
-                raise FileNotFoundError(f"Model not found at {model_source}")
-            data = joblib.load(model_source)
+            # loaded once per process (mmap'd), shared by every ModelService
+            data = model_registry.load_model_data(model_source)
         elif isinstance(model_source, dict):
             data = model_source
         else:
             raise ValueError("model_source must be a path or a dict")
 
-        self.model = data["model"]
-        self.scaler = data.get("scaler", None)
-        self.features = data.get("features", None)
+        if engine not in ("sklearn", "compiled"):
+            raise ValueError("engine must be 'sklearn' or 'compiled'")
+        self.engine = engine
+        self.model_source = model_source
+        self.compiled_path = compiled_path
+        self._use(data)
 
-        # history per device
-        from collections import deque
-        self.history = {}
-        self.last = {}
+        # rolling per-device state (interned slots, numpy ring buffers)
         self.roll_size = roll_size
+        self.state = DeviceStateStore(roll_size, max_devices=max_devices, ttl=device_ttl)
 
+        if isinstance(rules, rules_mod.RuleEngine):
+            self.rules = rules
+        else:
+            # one engine (and one set of hit counters) per rules file per process
+            self.rules = rules_mod.get_engine(rules)
+
+        self.cache = PredictionCache(**cache_options) if cache_options is not None else None
+        self.cache_check_s = cache_check_s
+        self._fingerprint = None
+        self._next_check = 0.0
+        if self.cache is not None and isinstance(model_source, str):
+            self._fingerprint = model_registry.fingerprint(model_source)
+            self._next_check = time.monotonic() + cache_check_s
+
+    def _use(self, data):
+        self.model = data["model"]
+        self.scaler = data.get("scaler", None)
+        self.features = data.get("features", None)
 
-    # ---------------- INTERNAL ----------------
-    def _ensure_device(self, device):
-        if device not in self.history:
-            self.history[device] = {"temp": deque(maxlen=self.roll_size),
-                                    "hum": deque(maxlen=self.roll_size),
-                                    "gas": deque(maxlen=self.roll_size)}
-            self.last[device] = {"temp": None, "hum": None, "gas": None}
+        self.compiled = None
+        if self.engine == "compiled":
+            if isinstance(self.model_source, str):
+                self.compiled = model_registry.get_compiled(self.model_source, self.compiled_path)
+            else:
+                from forest_compiler import CompiledForest
+                if self.compiled_path and os.path.exists(self.compiled_path):
+                    self.compiled = CompiledForest.load(self.compiled_path)
+                else:
+                    self.compiled = CompiledForest.from_model(self.model, self.scaler)
+
+    def _check_artifact(self):
+        """Reload + drop cached results if the pkl on disk was replaced."""
+        now = time.monotonic()
+        if self._fingerprint is None or now < self._next_check:
+            return
+        self._next_check = now + self.cache_check_s
+        try:
+            key = model_registry.fingerprint(self.model_source)
+        except OSError:
+            return   # mid-replace; keep the loaded model
+        if key == self._fingerprint:
+            return
+        self._use(model_registry.load_model_data(self.model_source))
+        self._fingerprint = key
+        self.cache.clear()
+        print(f"[MODEL] {self.model_source} changed on disk, reloaded; prediction cache cleared")
 
     # ---------------- FEATURES ----------------
     def compute_features(self, device, temp, hum, gas, ts=None, heartrate=None):
-        self._ensure_device(device)
-        last = self.last[device]
-
-        d_temp = 0.0 if last["temp"] is None else temp - last["temp"]
-        d_hum  = 0.0 if last["hum"] is None else hum - last["hum"]
-        d_gas  = 0.0 if last["gas"] is None else gas - last["gas"]
-
-    # update history
-        h = self.history[device]
-        h["temp"].append(temp)
-        h["hum"].append(hum)
-        h["gas"].append(gas)
-
-        r_temp = float(sum(h["temp"]) / len(h["temp"]))
-        r_hum  = float(sum(h["hum"]) / len(h["hum"]))
-        r_gas  = float(sum(h["gas"]) / len(h["gas"]))
-
-    # ================== NEW: trend features ==================
-        prev_avg = self.last.get(device + "_avg", None)
-        if prev_avg is None:
-            trend_temp = 0.0
-            trend_gas  = 0.0
-        else:
-            trend_temp = r_temp - prev_avg["temp"]
-            trend_gas  = r_gas  - prev_avg["gas"]
-
-        self.last[device + "_avg"] = {"temp": r_temp, "gas": r_gas}
-    # =========================================================
-
-        self.last[device] = {"temp": temp, "hum": hum, "gas": gas}
+        (d_temp, d_hum, d_gas,
+         r_temp, r_hum, r_gas,
+         trend_temp, trend_gas) = self.state.update(device, temp, hum, gas)
 
         hr = float(heartrate) if heartrate is not None else 0.0
 
@@ -84,20 +109,22 @@ class ModelService:
     
     # ---------------- PREDICTION ----------------
     def predict_from_features(self, features):
-        arr = np.asarray(features)
+        return self.predict_batch(features)[0]
+
+    def _prepare(self, arr):
+        """Sanitise + scale an (N, 12) feature matrix, one scaler call for all rows."""
+        arr = np.asarray(arr, dtype=float)
         if arr.ndim == 1:
             arr = arr.reshape(1, -1)
 
+        if self.compiled is not None:
+            # same NaN/inf cleanup + StandardScaler maths, without pandas
+            return self.compiled.transform(np.where(np.isfinite(arr), arr, 0.0))
+
     # Build DataFrame for scaler (it needs feature names)
         feat_names = self.features
         if feat_names is None:
-            feat_names = [
-                "temp","hum","gas",
-                "d_temp","d_hum","d_gas",
-                "r_temp","r_hum","r_gas",
-                "heartrate",
-                "trend_temp","trend_gas"
-            ]
+            feat_names = FEATURE_NAMES
 
         X_df = pd.DataFrame(arr, columns=feat_names)
 
@@ -111,40 +138,47 @@ class ModelService:
             X_scaled = X_df.values
 
     # RandomForest was trained WITHOUT feature names → give numpy
-        X_final = np.asarray(X_scaled)
+        return np.asarray(X_scaled)
 
-        pred = int(self.model.predict(X_final)[0])
-        ai_label = {0:"GOOD",1:"ALERT",2:"DANGER"}.get(pred, "UNKNOWN")
-
-    # ================= RULE ENGINE =================
-        vals = X_final[0] if isinstance(X_final, np.ndarray) else X_final.values[0]
-
-        temp, hum, gas, d_temp, d_hum, d_gas, r_temp, r_hum, r_gas, hr, trend_temp, trend_gas = vals
-
-
-        rule_label = ai_label
-
-    # ----- GAS rules -----
-        if gas > 1200 or r_gas > 1000:
-            rule_label = "DANGER" 
-        elif gas > 700:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
-
-    # ----- Temperature rules -----
-        if temp > 38 or temp < 18:
-            rule_label = "ALERT"
-
-    # ----- Heart rate rules -----
-        if hr > 140 or hr < 40:
-            rule_label = "DANGER"
-        elif hr > 110:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
+    def predict_batch(self, features):
+        """
+        features: (N, 12) array (or a list of compute_features() rows) from
+        any mix of devices. One scaler call + one forest call for the whole
+        batch, rule table applied as NumPy masks on the raw (unscaled)
+        readings. Returns N labels, the
+        same ones predict_from_features would give row by row.
+        """
+        arr = np.asarray(features, dtype=float)
+        if arr.ndim == 3:
+            arr = arr.reshape(-1, arr.shape[-1])
+        elif arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if self.cache is not None:
+            self._check_artifact()
+        X_final = self._prepare(arr)
+        if len(X_final) == 0:
+            return []
+
+        forest = self.compiled if self.compiled is not None else self.model
+        if self.cache is not None:
+            # forest output memoised on the raw readings; rules below stay per row
+            pred = self.cache.predict(arr, X_final, forest.predict)
+        else:
+            pred = forest.predict(X_final).astype(int)
+        codes = np.where(np.isin(pred, list(LABELS)), pred, -1).astype(np.int8)
 
-    # ----- Trend danger -----
-        if trend_gas > 80 or trend_temp > 2:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
+        raw = np.where(np.isfinite(arr), arr, 0.0)
+        return [LABEL_NAMES[c] for c in self.rules.apply(codes, raw)]
 
-    # ==============================================
 
-        return rule_label
+# label code -> name; -1 is "UNKNOWN" (LABEL_NAMES[-1])
+LABELS = {0: "GOOD", 1: "ALERT", 2: "DANGER"}
+LABEL_NAMES = ["GOOD", "ALERT", "DANGER", "UNKNOWN"]
 
+FEATURE_NAMES = [
+    "temp","hum","gas",
+    "d_temp","d_hum","d_gas",
+    "r_temp","r_hum","r_gas",
+    "heartrate",
+    "trend_temp","trend_gas"
+]
@@ -0,0 +1,76 @@
+"""
+Process-wide model registry.
+
+Every ModelService / MQTTRunner in the process gets the same loaded
+artifact instead of unpickling models/*.pkl again. Artifacts are loaded
+on first use with joblib's mmap_mode, so numpy arrays inside the pickle
+(and compiled .npz forests) are shared page-cache mappings across
+worker processes. Entries are keyed on the file's mtime/size and reload
+by themselves when the file on disk is replaced.
+"""
+import glob
+import os
+import threading
+
+_lock = threading.Lock()
+_models = {}
+_compiled = {}
+
+
+def fingerprint(path):
+    """Identity of the artifact currently on disk: (abs path, mtime_ns, size)."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def available_models(pattern="models/*.pkl"):
+    return sorted(glob.glob(pattern))
+
+
+def load_model_data(path, mmap_mode="r"):
+    """Return the {'model', 'scaler', 'features'} dict for a .pkl, loading it at most once."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model not found at {path}")
+    key = fingerprint(path)
+    with _lock:
+        entry = _models.get(key[0])
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        import joblib
+        data = joblib.load(path, mmap_mode=mmap_mode)
+        if not isinstance(data, dict):
+            data = {"model": data}
+        _models[key[0]] = (key, data)
+        _compiled.pop(key[0], None)
+        print(f"[REGISTRY] loaded {path}")
+        return data
+
+
+def get_compiled(path, npz_path=None):
+    """
+    CompiledForest for a .pkl. Uses npz_path (default: the .pkl path with
+    a .npz suffix) when it exists and is at least as new as the .pkl,
+    otherwise compiles the forest in memory.
+    """
+    from forest_compiler import CompiledForest
+
+    data = load_model_data(path)
+    key = fingerprint(path)
+    npz_path = npz_path or os.path.splitext(path)[0] + ".npz"
+    with _lock:
+        entry = _compiled.get(key[0])
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        if os.path.exists(npz_path) and os.stat(npz_path).st_mtime_ns >= key[1]:
+            forest = CompiledForest.load(npz_path)
+        else:
+            forest = CompiledForest.from_model(data["model"], data.get("scaler"))
+        _compiled[key[0]] = (key, forest)
+        return forest
+
+
+def clear():
+    with _lock:
+        _models.clear()
+        _compiled.clear()
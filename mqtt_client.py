@@ -1,121 +1,302 @@
 import json
 import threading
-import os
+import time
 from datetime import datetime
-import pandas as pd
 import paho.mqtt.client as mqtt
 from model import ModelService
+from telemetry_writer import FSYNC_INTERVAL
+from storage import CsvStore
+from batching import MicroBatcher
+from pipeline import IngestPipeline, DROP_OLDEST
+from stats import StreamingStats, WINDOW_ALL
+from broadcast import Broadcaster
+from sharding import ShardedInference
+from status_publisher import StatusPublisher
+from metrics import Metrics, MetricsServer
+from anomaly import AnomalyDetector
 
 TOPIC_DATA = "SHHE/data"
 TOPIC_STATUS = "SHHE/status"
 TOPIC_OBAT = "SHHE/obat"
 
+
+def decode_payload(raw):
+    """SHHE/data payload bytes -> record dict (device, ts, temp, hum, gas, heartrate)."""
+    return validate_payload(json.loads(raw.decode()))
+
+
+def validate_payload(payload):
+    device = payload.get("device", "Smart Home Health Ecosystem")
+    ts = payload.get("ts")
+    if not ts:
+        ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    temp = float(payload.get("temp", 0.0))
+    hum = float(payload.get("hum", 0.0))
+    gas = float(payload.get("gas", 0.0))
+
+    heartrate = payload.get("heartrate")
+    try:
+        heartrate = float(heartrate) if heartrate is not None else 0.0  # default awal 0
+    except:
+        heartrate = 0.0
+
+# VALIDASI HEARTRATE
+    if heartrate > 220 or heartrate < 30:
+        heartrate = 0
+
+    return {"device": device, "ts": ts, "temp": temp, "hum": hum,
+            "gas": gas, "heartrate": heartrate}
+
+
 class MQTTRunner:
-    def __init__(self, broker, port, model_path="models/smarthealth.retrained.pkl", csv_path="data.csv"):
+    def __init__(self, broker, port, model_path="models/smarthealth.retrained.pkl", csv_path="data.csv",
+                 write_batch_size=256, write_flush_interval=1.0, fsync=FSYNC_INTERVAL, store=None,
+                 batch_window_ms=0, batch_max_rows=256,
+                 workers=1, queue_size=10000, overload=DROP_OLDEST, model_engine="sklearn",
+                 shared_state=None, max_devices=None, device_ttl=None, shards=0, status_options=None,
+                 metrics_port=None, prediction_cache=None, rules_path=None,
+                 anomaly=True):
         self.broker = broker
         self.port = port
         self.client = mqtt.Client()
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.lock = threading.Lock()
+        # set by stop(): messages arriving after that are counted, not queued
+        self._stopping = False
         self.last_status = "N/A"
         self.latest_record = None
-        self.last_timestamp = {}
+        # running aggregates (all-time / 1h / 1d, global + per device)
+        self.stats = StreamingStats(max_devices=max_devices, device_ttl=device_ttl)
+        # live push to dashboard viewers (version counter + subscriptions)
+        self.updates = Broadcaster()
+        # optional shared_state.SharedStateTable so other processes can read
+        # the latest record per device without going through this one
+        self.shared_state = shared_state
+        # stage timings / counters, always on; metrics_port also serves
+        # them as Prometheus text on http://127.0.0.1:<port>/metrics
+        self.metrics = Metrics()
+        # SHHE/status per device: debounced, rate-limited, coalesced
+        # (status_options -> StatusPublisher kwargs)
+        self.status = StatusPublisher(self._publish, topic=TOPIC_STATUS, **(status_options or {})).start()
+
+        # anomaly: True (defaults), AnomalyDetector kwargs, or None/False
+        # for off; per-device baselines scored in _finish, in arrival
+        # order for every mode, raise the label and fill the `anomaly` column
+        self.anomaly = None
+        if anomaly:
+            options = anomaly if isinstance(anomaly, dict) else {}
+            self.anomaly = AnomalyDetector(**dict({"max_devices": max_devices, "ttl": device_ttl}, **options))
 
         # load model
-        # baru
-        # mqtt_client.py bagian __init__
+        # prediction_cache: PredictionCache kwargs (None = off), memoises
+        # forest results for repeated readings (prediction_cache.py)
+        # rules_path: JSON safety rule table, hot reloaded (rules.py);
+        # None = the built-in defaults
         self.model = None
-        if model_path:  # tetap pakai model_path sebagai argumen
+        # shards > 0: features + prediction run in that many worker
+        # processes (sharding.py); results come back here in order
+        self.sharded = None
+        if model_path and shards > 0:
+            try:
+                self.sharded = ShardedInference(model_path, self._on_shard_result, shards=shards,
+                                                engine=model_engine, max_devices=max_devices,
+                                                device_ttl=device_ttl, cache_options=prediction_cache,
+                                                rules=rules_path).start()
+            except Exception as e:
+                print("[MQTT] Warning: Failed to start inference shards:", e)
+        elif model_path:  # tetap pakai model_path sebagai argumen
            try:
         # panggil ModelService dengan model_source, bisa path atau dict
-                  self.model = ModelService(model_source=model_path)
+                  self.model = ModelService(model_source=model_path, engine=model_engine,
+                                            max_devices=max_devices, device_ttl=device_ttl,
+                                            cache_options=prediction_cache, rules=rules_path)
            except Exception as e:
                   print("[MQTT] Warning: Failed to load model:", e)
 
+        # micro-batching: gather messages for batch_window_ms (or up to
+        # batch_max_rows) and run one scaler+forest call for all of them.
+        # 0 = predict every message inline.
+        self.batcher = None
+        if self.model is not None and batch_window_ms > 0:
+            self.batcher = MicroBatcher(self.model, self._on_batch_result, window_ms=batch_window_ms,
+                                        max_rows=batch_max_rows, metrics=self.metrics).start()
 
+        # storage backend; default is the append-only data.csv writer which
+        # creates the file/header if missing and trims a partially written
+        # last row left by a crash
         self.csv_path = csv_path
-        try:
-            pd.read_csv(self.csv_path)
-        except Exception:
-            df = pd.DataFrame(columns=["ts", "device", "temp", "hum", "gas", "ai", "heartrate"])
-            df.to_csv(self.csv_path, index=False)
+        if store is None:
+            store = CsvStore(csv_path, batch_size=write_batch_size,
+                             flush_interval=write_flush_interval, fsync=fsync)
+        self.store = store
+        self.store.open_writer()
 
+        # worker pool behind the network thread. Devices are hashed onto
+        # workers so per-device order holds. workers=0 handles every
+        # message inline on the paho thread (old behaviour).
+        self.pipeline = None
+        if workers > 0:
+            self.pipeline = IngestPipeline(self._decode, self._handle, workers=workers,
+                                           max_queue=queue_size, overload=overload).start()
+
+        self._register_gauges()
+        self.metrics_server = None
+        if metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port=metrics_port).start()
+            except OSError as e:
+                print("[MQTT] Warning: metrics endpoint not started:", e)
+
+    def _register_gauges(self):
+        m = self.metrics
+        writer = getattr(self.store, "writer", None)
+        if writer is not None:
+            m.gauge("writer_queue_depth", writer.queue_depth, help="Rows waiting for the storage writer.")
+            m.gauge("writer_dropped", lambda: writer.dropped, kind="counter")
+        if self.pipeline is not None:
+            p = self.pipeline
+            m.gauge("ingress_queue_depth", lambda: len(p.ingress), help="Raw messages waiting for decode.")
+            m.gauge("ingress_queue_high_water", lambda: p.ingress.high_water)
+            m.gauge("worker_queue_depth", lambda: {i: len(q) for i, q in enumerate(p.shards)}, label="worker")
+            m.gauge("ingress_dropped", lambda: p.ingress.dropped, kind="counter",
+                    help="Messages dropped by the overload policy.")
+            m.gauge("ingress_refused", lambda: p.ingress.refused, kind="counter",
+                    help="Messages that arrived after the pipeline was closed.")
+            m.gauge("decode_errors", lambda: p.decode_errors, kind="counter")
+            m.gauge("process_errors", lambda: p.process_errors, kind="counter")
+        if self.batcher is not None:
+            m.gauge("batcher_pending", lambda: self.batcher.stats()["pending"])
+        if self.sharded is not None:
+            m.gauge("shard_in_flight", lambda: self.sharded.stats()["in_flight"])
+            m.gauge("shard_duplicates", lambda: self.sharded.duplicates, kind="counter")
+        if self.model is not None:
+            m.gauge("devices", lambda: len(self.model.state))
+        cache_stats = self._prediction_cache_stats
+        if cache_stats() is not None:
+            m.gauge("prediction_cache_hits", lambda: cache_stats()["hits"], kind="counter")
+            m.gauge("prediction_cache_misses", lambda: cache_stats()["misses"], kind="counter")
+            m.gauge("prediction_cache_size", lambda: cache_stats()["size"])
+        rule_stats = self._rule_stats
+        if self.model is not None or self.sharded is not None:
+            m.gauge("rule_hits", lambda: {k: c["hits"] for k, c in rule_stats()["counts"].items()},
+                    kind="counter", label="rule", help="Rows matched per safety rule.")
+            m.gauge("rule_changed", lambda: {k: c["changed"] for k, c in rule_stats()["counts"].items()},
+                    kind="counter", label="rule", help="Labels changed per safety rule.")
+        if self.anomaly is not None:
+            det = self.anomaly
+            m.gauge("anomalies", lambda: det.anomalies, kind="counter",
+                    help="Readings whose anomaly score crossed the threshold.")
+            m.gauge("anomaly_devices", lambda: len(det))
+        m.gauge("status_pending", lambda: self.status.stats()["pending"])
+        m.gauge("status_publishes", lambda: self.status.publishes, kind="counter")
+        m.gauge("live_version", lambda: self.updates.version, help="Records published to live viewers.")
     def _on_connect(self, client, userdata, flags, rc):
         print("[MQTT] Connected, subscribing ...")
         client.subscribe(TOPIC_DATA)
 
     def _on_message(self, client, userdata, msg):
+        self.metrics.inc("messages_received")
+        if self._stopping:
+            self.metrics.inc("messages_refused")
+            return
+        if self.pipeline is not None:
+            # network thread only queues the raw bytes; decode, features,
+            # prediction, storage and publish run on the pipeline workers
+            self.pipeline.submit(msg.payload)
+            return
         try:
-            payload = json.loads(msg.payload.decode())
-            device = payload.get("device", "Smart Home Health Ecosystem")
-            ts = payload.get("ts")
-            if not ts:
-                ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-            temp = float(payload.get("temp", 0.0))
-            hum = float(payload.get("hum", 0.0))
-            gas = float(payload.get("gas", 0.0))
-
-            heartrate = payload.get("heartrate")
-            try:
-                heartrate = float(heartrate) if heartrate is not None else 0.0  # default awal 0
-            except:
-                heartrate = 0.0
-
-# VALIDASI HEARTRATE
-            if heartrate > 220 or heartrate < 30:
-                heartrate = 0
-
-
-            # AI prediction
-            label = "GOOD"
-            if self.model is not None:
-                try:
-                    if hasattr(self.model, "predict_from_features"):
-                        last_ts = self.last_timestamp.get(device)
-                        if last_ts and ts <= last_ts:
-                            return   # drop packet lama / duplicate
-
-                        self.last_timestamp[device] = ts
-                        features = self.model.compute_features(device, temp, hum, gas, ts, heartrate)
-                        label = self.model.predict_from_features(features)
-                    else:
-                        print("[MQTT] Warning: self.model bukan ModelService, skipping AI prediction")
-                except Exception as e:
-                    print("[MQTT] AI prediction error:", e)
-
-            # CSV
-            row = {"ts": ts, "device": device, "temp": temp, "hum": hum,
-                   "gas": gas, "ai": label, "heartrate": heartrate}
-            self._append_csv(row)
-
-            # Publish status
-            if label != self.last_status:
-                out = {"status": label}
-                client.publish(TOPIC_STATUS, json.dumps(out))
-
-            with self.lock:
-                self.last_status = label
-                self.latest_record = row
-
-            print(f"[MQTT] {device} {ts} => T:{temp}°C H:{hum}% G:{gas} HR:{heartrate}BPM => {label}")
-
+            self._handle(self._decode(msg.payload))
         except Exception as e:
+            self.metrics.inc("errors", stage="on_message")
             print("[MQTT] on_message error:", e)
 
-    def _append_csv(self, row):
-        with self.lock:
+    def _decode(self, raw):
+        t0 = time.perf_counter()
+        payload = json.loads(raw.decode())
+        t1 = time.perf_counter()
+        rec = validate_payload(payload)
+        self.metrics.observe("decode", t1 - t0)
+        self.metrics.observe("validate", time.perf_counter() - t1)
+        return rec
+
+    def _handle(self, rec):
+        device, ts = rec["device"], rec["ts"]
+        temp, hum, gas, heartrate = rec["temp"], rec["hum"], rec["gas"], rec["heartrate"]
+
+        if self.sharded is not None:
+            # dedup, label, CSV and publish continue in _on_shard_result
+            self.sharded.submit(rec)
+            return
+
+        # AI prediction
+        label = "GOOD"
+        if self.model is not None:
             try:
-                df = pd.read_csv(self.csv_path)
-            except:
-                df = pd.DataFrame(columns=row.keys())
+                if hasattr(self.model, "predict_from_features"):
+                    # last accepted ts lives in the model's per-device state (evicted with it)
+                    if not self.model.state.accept_ts(device, ts):
+                        self.metrics.inc("duplicates")
+                        return   # drop packet lama / duplicate
+
+                    t0 = time.perf_counter()
+                    features = self.model.compute_features(device, temp, hum, gas, ts, heartrate)
+                    t1 = time.perf_counter()
+                    self.metrics.observe("compute_features", t1 - t0)
+                    if self.batcher is not None:
+                        # label, CSV and publish continue in _finish on the batcher thread
+                        self.batcher.submit(features, (device, ts, temp, hum, gas, heartrate))
+                        return
+                    label = self.model.predict_from_features(features)
+                    self.metrics.observe("predict", time.perf_counter() - t1)
+                else:
+                    print("[MQTT] Warning: self.model bukan ModelService, skipping AI prediction")
+            except Exception as e:
+                self.metrics.inc("errors", stage="predict")
+                print("[MQTT] AI prediction error:", e)
+
+        self._finish(device, ts, temp, hum, gas, heartrate, label)
 
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+    def _on_batch_result(self, context, label):
+        self._finish(*context, label)
 
-        tmp = self.csv_path + ".tmp"
-        df.to_csv(tmp, index=False)
-        os.replace(tmp, self.csv_path)
+    def _on_shard_result(self, rec, label):
+        self._finish(rec["device"], rec["ts"], rec["temp"], rec["hum"], rec["gas"], rec["heartrate"], label)
 
+    def _finish(self, device, ts, temp, hum, gas, heartrate, label):
+        # CSV
+        m = self.metrics
+        t0 = time.perf_counter()
+        score = None
+        if self.anomaly is not None:
+            label, score = self.anomaly.score_label(device, ts, temp, hum, gas, heartrate, label)
+            score = round(score, 3)
+            m.observe("anomaly", time.perf_counter() - t0)
+            t0 = time.perf_counter()
+        row = {"ts": ts, "device": device, "temp": temp, "hum": hum,
+               "gas": gas, "ai": label, "heartrate": heartrate, "anomaly": score}
+        self._append_csv(row)
+        t1 = time.perf_counter()
+        self.stats.add(device, row)
+        t2 = time.perf_counter()
+
+        # Publish status
+        self.status.observe(device, label)
+
+        with self.lock:
+            self.last_status = label
+            self.latest_record = row
+        self.updates.publish(row)
+        if self.shared_state is not None:
+            self.shared_state.update(device, ts, temp, hum, gas, heartrate, label)
+        m.observe("storage_append", t1 - t0)
+        m.observe("aggregate", t2 - t1)
+        m.observe("publish", time.perf_counter() - t2)
+        m.inc("labels", label=label)
+        m.inc("messages_processed")
+
+    def _append_csv(self, row):
+        self.store.append(row)
 
     def start(self):
         self.thread = threading.Thread(target=self._run_loop, daemon=True)
@@ -129,12 +310,45 @@ class MQTTRunner:
             return
         self.client.loop_forever()
 
+    def _publish(self, topic, payload):
+        self.client.publish(topic, payload)
+
+    def stop(self):
+        # stop feeding the stages first; the connection stays up for the
+        # last status flush below
+        self._stopping = True
+        try:
+            self.client.unsubscribe(TOPIC_DATA)
+        except Exception:
+            pass
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.sharded is not None:
+            self.sharded.close()
+        # last status flush goes out before the connection closes
+        self.status.close()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.store.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
     def publish_obat(self, schedules):
         if schedules:
             payload = {"schedules": schedules}
             self.client.publish(TOPIC_OBAT, json.dumps(payload))
             print("[MQTT] Published schedules:", schedules)
 
+    def publish_schedule(self, payload):
+        """Compact schedule rule change / sync (medicine_schedule.py) on SHHE/obat."""
+        if payload:
+            self.client.publish(TOPIC_OBAT, json.dumps(payload, separators=(",", ":")))
+            print(f"[MQTT] Published schedule {payload.get('op')} v{payload.get('v')}")
+
     def get_last_status(self):
         with self.lock:
             return self.last_status
@@ -143,5 +357,57 @@ class MQTTRunner:
         with self.lock:
             return self.latest_record
 
+    def subscribe(self, maxsize=1000):
+        """Bounded feed of every record processed from now on (see broadcast.Subscription)."""
+        return self.updates.subscribe(maxsize)
+
+    def get_version(self):
+        return self.updates.version
+
     def get_csv_path(self):
         return self.csv_path
+
+    def get_store(self):
+        return self.store
+
+    def get_stats(self, device=None, window=WINDOW_ALL):
+        return self.stats.snapshot(device=device, window=window)
+
+    def get_device_state_stats(self):
+        if self.sharded is not None:
+            return self.sharded.device_state_stats()
+        if self.model is None:
+            return {}
+        return self.model.state.stats()
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+    def _prediction_cache_stats(self):
+        if self.sharded is not None:
+            return self.sharded.prediction_cache_stats()
+        if self.model is None or self.model.cache is None:
+            return None
+        return self.model.cache.stats()
+
+    def _rule_stats(self):
+        if self.sharded is not None:
+            return self.sharded.rule_stats()
+        if self.model is None:
+            return None
+        return self.model.rules.stats()
+
+    def get_pipeline_stats(self):
+        out = {} if self.pipeline is None else self.pipeline.stats()
+        out["status"] = self.status.stats()
+        if self.sharded is not None:
+            out["sharding"] = self.sharded.stats()
+        cache = self._prediction_cache_stats()
+        if cache is not None:
+            out["prediction_cache"] = cache
+        rules = self._rule_stats()
+        if rules is not None:
+            out["rules"] = rules
+        if self.anomaly is not None:
+            out["anomaly"] = self.anomaly.stats()
+        return out
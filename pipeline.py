@@ -0,0 +1,190 @@
+import threading
+import time
+import zlib
+from collections import deque
+
+# overload policies for a full queue
+DROP_OLDEST = "drop_oldest"  # evict the oldest waiting item, keep the new one
+DROP_NEWEST = "drop_newest"  # reject the new item
+BLOCK = "block"              # wait for space (backpressure onto the caller)
+OVERLOAD_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+_STOP = object()
+
+
+class BoundedQueue:
+    """FIFO with a hard size limit and an explicit policy for what happens when it is full."""
+
+    def __init__(self, maxsize, overload=DROP_OLDEST, block_timeout=None):
+        if overload not in OVERLOAD_POLICIES:
+            raise ValueError(f"overload must be one of {OVERLOAD_POLICIES}, got {overload!r}")
+        self.maxsize = max(1, int(maxsize))
+        self.overload = overload
+        self.block_timeout = block_timeout
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+        self.refused = 0     # put() after the stop sentinel, never reached a consumer
+        self.high_water = 0
+        self.closed = False
+
+    def _drop_oldest(self):
+        # the stop sentinel is never the one evicted, or the consumer never stops
+        if self._items[0] is not _STOP:
+            self._items.popleft()
+            return True
+        for i, item in enumerate(self._items):
+            if item is not _STOP:
+                del self._items[i]
+                return True
+        return False
+
+    def put(self, item, force=False):
+        """
+        Returns False if `item` itself was dropped. force=True bypasses the
+        limit (control items). Once _STOP is queued nothing else is
+        accepted: it would sit behind the sentinel and never be taken.
+        """
+        with self._cond:
+            if self.closed:
+                self.refused += 1
+                return False
+            if item is _STOP:
+                self.closed = True
+            if not force and len(self._items) >= self.maxsize:
+                if self.overload == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overload == DROP_OLDEST:
+                    if self._drop_oldest():
+                        self.dropped += 1
+                else:
+                    deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+                    while len(self._items) >= self.maxsize:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self._cond.wait(remaining)
+            self._items.append(item)
+            if not force:
+                self.put_count += 1
+            if len(self._items) > self.high_water:
+                self.high_water = len(self._items)
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class IngestPipeline:
+    """
+    Moves message handling off the network thread.
+
+    submit(raw) only enqueues the raw payload on a bounded ingress queue.
+    A dispatcher thread decodes it (decode(raw) -> record dict or None)
+    and routes the record by hash(record["device"]) to one of `workers`
+    worker threads, each calling process(record). A device always lands
+    on the same worker, so per-device order (and per-device state such as
+    ModelService.compute_features history) is preserved.
+    """
+
+    def __init__(self, decode, process, workers=1, max_queue=10000, overload=DROP_OLDEST,
+                 block_timeout=None, worker_queue=1000):
+        self.decode = decode
+        self.process = process
+        self.n_workers = max(1, int(workers))
+        self.ingress = BoundedQueue(max_queue, overload, block_timeout)
+        # worker queues always block: backpressure goes to the dispatcher
+        # and from there to the ingress queue where the policy applies
+        self.shards = [BoundedQueue(worker_queue, BLOCK) for _ in range(self.n_workers)]
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.decode_errors = 0
+        self.process_errors = 0
+        self.processed = 0
+
+    def start(self):
+        if self._threads:
+            return self
+        t = threading.Thread(target=self._dispatch, name="ingest-dispatch", daemon=True)
+        self._threads.append(t)
+        for i, q in enumerate(self.shards):
+            self._threads.append(threading.Thread(target=self._work, args=(q,), name=f"ingest-worker-{i}", daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def submit(self, raw):
+        return self.ingress.put(raw)
+
+    def shard_for(self, device):
+        return zlib.crc32(str(device).encode("utf-8")) % self.n_workers
+
+    def close(self, timeout=None):
+        """Process everything already queued, then stop the threads."""
+        if not self._threads:
+            return
+        self.ingress.put(_STOP, force=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def stats(self):
+        with self._stats_lock:
+            out = {"processed": self.processed, "decode_errors": self.decode_errors,
+                   "process_errors": self.process_errors}
+        out.update({
+            "queue_depth": len(self.ingress),
+            "queue_high_water": self.ingress.high_water,
+            "dropped": self.ingress.dropped,
+            "refused": self.ingress.refused,
+            "submitted": self.ingress.put_count,
+            "worker_depths": [len(q) for q in self.shards],
+            "overload": self.ingress.overload,
+        })
+        return out
+
+    def _dispatch(self):
+        while True:
+            raw = self.ingress.get()
+            if raw is _STOP:
+                for q in self.shards:
+                    q.put(_STOP, force=True)
+                return
+            try:
+                record = self.decode(raw)
+            except Exception as e:
+                with self._stats_lock:
+                    self.decode_errors += 1
+                print("[PIPELINE] decode error:", e)
+                continue
+            if record is None:
+                continue
+            self.shards[self.shard_for(record.get("device"))].put(record)
+
+    def _work(self, q):
+        while True:
+            record = q.get()
+            if record is _STOP:
+                return
+            try:
+                self.process(record)
+                with self._stats_lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.process_errors += 1
+                print("[PIPELINE] worker error:", e)
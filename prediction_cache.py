@@ -0,0 +1,105 @@
+"""
+Memoised forest predictions for steady-state readings.
+
+A device that keeps reporting the same temp/hum/gas/heartrate produces
+the same 12 features over and over, and ModelService used to run the
+whole forest for every one of them. PredictionCache maps a feature row,
+quantised to sensor resolution, to the forest's class code:
+
+    cache = PredictionCache(capacity=4096, ttl=600)
+    codes = cache.predict(raw_rows, scaled_rows, forest.predict)
+
+Only the forest's output is cached. The rule overrides (rules.py)
+still run on every row, so a gas/heart-rate rule fires exactly as
+without the cache. Rows that differ by less than RESOLUTION
+share one forest result; the sensors do not report finer steps anyway.
+
+LRU over an OrderedDict, optional TTL, one lock (ModelService is shared
+by the pipeline workers). clear() drops everything; ModelService calls it
+when the model artifact on disk changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# per feature, compute_features order: temp, hum, gas, d_temp, d_hum, d_gas,
+# r_temp, r_hum, r_gas, heartrate, trend_temp, trend_gas
+RESOLUTION = (0.1, 0.1, 1.0, 0.1, 0.1, 1.0, 0.1, 0.1, 1.0, 1.0, 0.1, 1.0)
+
+
+class PredictionCache:
+    def __init__(self, capacity=4096, ttl=None, resolution=RESOLUTION, clock=time.monotonic):
+        self.capacity = max(1, int(capacity))
+        self.ttl = float(ttl) if ttl else None
+        self.resolution = np.asarray(resolution, dtype=float)
+        self.clock = clock
+        self._entries = OrderedDict()   # key -> (code, stored at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def keys(self, raw):
+        """One bytes key per row of an (N, 12) raw feature matrix."""
+        arr = np.asarray(raw, dtype=float)
+        # NaN/inf become 0 before scaling (ModelService._prepare), same here
+        arr = np.where(np.isfinite(arr), arr, 0.0)
+        q = np.rint(arr / self.resolution[:arr.shape[1]]).astype(np.int64)
+        return [row.tobytes() for row in q]
+
+    def predict(self, raw, X, predict_fn):
+        """
+        Forest codes for every row: cached where possible, the distinct
+        misses in one predict_fn(X[rows]) call. raw: unscaled features (the
+        cache key), X: the rows predict_fn expects.
+        """
+        keys = self.keys(raw)
+        out = np.empty(len(keys), dtype=np.int64)
+        missing = {}   # key -> rows waiting for it
+        now = self.clock()
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    missing.setdefault(key, []).append(i)
+                    continue
+                self._entries.move_to_end(key)
+                out[i] = entry[0]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            first = [rows[0] for rows in missing.values()]
+            codes = np.asarray(predict_fn(X[first])).astype(np.int64)
+            with self._lock:
+                for (key, rows), code in zip(missing.items(), codes):
+                    out[rows] = code
+                    self._entries[key] = (int(code), now)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits,
+                    "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "expired": self.expired,
+                    "invalidations": self.invalidations}
@@ -0,0 +1,257 @@
+"""
+Declarative safety overrides on top of the forest's label.
+
+Each rule is one row of a table, applied in order to a batch of raw
+(unscaled) feature rows in model.FEATURE_NAMES order:
+
+    {"name": "gas_danger", "any": [["gas", ">", 1200], ["r_gas", ">", 1000]],
+     "action": "set", "label": "DANGER"}
+
+  any     conditions OR'ed together      (at least one of any / all)
+  all     conditions AND'ed together     (both given: any AND all)
+  action  "set"   label = `label` for matching rows
+          "raise" label = max(label, `label`)
+  label   GOOD / ALERT / DANGER
+
+Conditions are [feature, op, number] with op one of > >= < <= == !=.
+A table is validated once (unknown feature, op, label or action ->
+ValueError naming the rule) and compiled into per-rule column indices
+and comparison ufuncs, so applying it is a few NumPy mask operations
+per rule for the whole batch.
+
+RuleEngine follows a JSON file (a list of rules, or {"rules": [...]}):
+a changed file is reloaded on the next batch after check_s seconds; a
+file that fails validation is reported and the previous rules stay in
+force. Every rule counts the rows it matched (hits) and the rows whose
+label it actually changed.
+
+    python rules.py dump > rules.json     # default table, to edit
+    python rules.py check rules.json
+"""
+import argparse
+import json
+import operator
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+LEVELS = {"GOOD": 0, "ALERT": 1, "DANGER": 2}
+ACTIONS = ("set", "raise")
+OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+       "==": np.equal, "!=": np.not_equal}
+
+# the overrides predict_from_features always had, in the same order;
+# hr_danger now also needs heartrate > 0, since 0 means "no reading"
+# (the old check sent every reading without a heart rate to DANGER)
+DEFAULT_RULES = [
+    {"name": "gas_danger", "any": [["gas", ">", 1200], ["r_gas", ">", 1000]], "action": "set", "label": "DANGER"},
+    {"name": "gas_alert", "any": [["gas", ">", 700]], "action": "raise", "label": "ALERT"},
+    {"name": "temp_range", "any": [["temp", ">", 38], ["temp", "<", 18]], "action": "set", "label": "ALERT"},
+    {"name": "hr_danger", "any": [["heartrate", ">", 140], ["heartrate", "<", 40]],
+     "all": [["heartrate", ">", 0]], "action": "set", "label": "DANGER"},
+    {"name": "hr_alert", "any": [["heartrate", ">", 110]], "action": "raise", "label": "ALERT"},
+    {"name": "trend", "any": [["trend_gas", ">", 80], ["trend_temp", ">", 2]], "action": "raise", "label": "ALERT"},
+]
+
+
+def _feature_names():
+    from model import FEATURE_NAMES
+    return FEATURE_NAMES
+
+
+# ---------------- COMPILE ----------------
+class RuleSet:
+    """A validated, compiled rule table."""
+
+    def __init__(self, rules, features=None):
+        features = list(features or _feature_names())
+        index = {name: i for i, name in enumerate(features)}
+        self.rules = []
+        self.names = []
+        seen = set()
+        if not isinstance(rules, list):
+            raise ValueError("rule table must be a list of rules")
+        for n, rule in enumerate(rules):
+            if not isinstance(rule, dict):
+                raise ValueError(f"rule {n}: {rule!r} is not an object")
+            name = rule.get("name") or f"rule_{n}"
+            if not isinstance(name, str):
+                raise ValueError(f"rule {n}: name {name!r} is not a string")
+            if name in seen:
+                raise ValueError(f"rule {name!r}: duplicate name")
+            seen.add(name)
+            if rule.get("action", "set") not in ACTIONS:
+                raise ValueError(f"rule {name!r}: action must be one of {ACTIONS}")
+            if not isinstance(rule.get("label"), str) or rule["label"] not in LEVELS:
+                raise ValueError(f"rule {name!r}: label must be one of {list(LEVELS)}")
+            for key in ("any", "all"):
+                if rule.get(key) is not None and not isinstance(rule[key], list):
+                    raise ValueError(f"rule {name!r}: {key} must be a list of conditions")
+            any_ = [self._condition(name, c, index) for c in rule.get("any") or ()]
+            all_ = [self._condition(name, c, index) for c in rule.get("all") or ()]
+            if not any_ and not all_:
+                raise ValueError(f"rule {name!r}: needs at least one condition")
+            unknown = set(rule) - {"name", "any", "all", "action", "label", "note"}
+            if unknown:
+                raise ValueError(f"rule {name!r}: unknown keys {sorted(unknown)}")
+            self.rules.append((name, any_, all_, rule.get("action", "set") == "raise", LEVELS[rule["label"]]))
+            self.names.append(name)
+        self.table = [dict(r) for r in rules]
+
+    @staticmethod
+    def _condition(name, cond, index):
+        try:
+            feature, op, value = cond
+        except (TypeError, ValueError):
+            raise ValueError(f"rule {name!r}: condition {cond!r} is not [feature, op, value]")
+        if not isinstance(feature, str) or feature not in index:
+            raise ValueError(f"rule {name!r}: unknown feature {feature!r} (expected one of {list(index)})")
+        if not isinstance(op, str) or op not in OPS:
+            raise ValueError(f"rule {name!r}: unknown operator {op!r}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"rule {name!r}: threshold {value!r} is not a number")
+        return index[feature], OPS[op], float(value)
+
+    @staticmethod
+    def _mask(conds, X, combine):
+        mask = None
+        for col, op, value in conds:
+            m = op(X[:, col], value)
+            mask = m if mask is None else combine(mask, m)
+        return mask
+
+    def apply(self, codes, X):
+        """
+        codes: (N,) int label codes, X: (N, features) raw rows. Returns
+        (new codes, [(hits, changed) per rule]).
+        """
+        codes = np.array(codes, dtype=np.int8, copy=True)
+        X = np.asarray(X, dtype=float)
+        counts = []
+        for _, any_, all_, raise_, level in self.rules:
+            mask = self._mask(any_, X, operator.or_) if any_ else None
+            if all_:
+                m = self._mask(all_, X, operator.and_)
+                mask = m if mask is None else mask & m
+            new = np.maximum(codes[mask], level) if raise_ else level
+            before = codes[mask]
+            codes[mask] = new
+            counts.append((int(mask.sum()), int((before != codes[mask]).sum())))
+        return codes, counts
+
+
+# ---------------- ENGINE ----------------
+def load_table(path):
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    if isinstance(doc, dict):
+        if "rules" not in doc:
+            raise ValueError(f"{path}: expected a list of rules or {{\"rules\": [...]}}")
+        return doc["rules"]
+    return doc
+
+
+class RuleEngine:
+    def __init__(self, path=None, check_s=1.0, features=None):
+        self.path = path
+        self.check_s = check_s
+        self.features = features
+        self._lock = threading.Lock()
+        self._counts = {}   # rule name -> [hits, changed], kept across reloads
+        self._mtime = None
+        self._next_check = 0.0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error = None
+        if path:
+            self._mtime = os.stat(path).st_mtime_ns
+            self.ruleset = RuleSet(load_table(path), self.features)
+            self._next_check = time.monotonic() + check_s
+        else:
+            self.ruleset = RuleSet(DEFAULT_RULES, self.features)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if not self.path or now < self._next_check:
+            return
+        self._next_check = now + self.check_s
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            self.ruleset = RuleSet(load_table(self.path), self.features)
+        except Exception as e:
+            # anything wrong with the new file must not reach predict_batch
+            self.reload_errors += 1
+            self.last_error = str(e)
+            print(f"[RULES] {self.path} not reloaded, keeping previous rules:", e)
+            return
+        self.reloads += 1
+        self.last_error = None
+        print(f"[RULES] reloaded {self.path} ({len(self.ruleset.names)} rules)")
+
+    def apply(self, codes, X):
+        self._maybe_reload()
+        ruleset = self.ruleset
+        codes, counts = ruleset.apply(codes, X)
+        with self._lock:
+            for name, (hits, changed) in zip(ruleset.names, counts):
+                c = self._counts.setdefault(name, [0, 0])
+                c[0] += hits
+                c[1] += changed
+        return codes
+
+    def hits(self):
+        with self._lock:
+            return {name: c[0] for name, c in self._counts.items()}
+
+    def stats(self):
+        with self._lock:
+            counts = {name: {"hits": c[0], "changed": c[1]} for name, c in self._counts.items()}
+        return {"source": self.path or "default", "rules": list(self.ruleset.names), "counts": counts,
+                "reloads": self.reloads, "reload_errors": self.reload_errors, "last_error": self.last_error}
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(path=None):
+    """One RuleEngine per rules file (None = DEFAULT_RULES) per process, shared by every ModelService."""
+    key = os.path.abspath(path) if path else None
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = RuleEngine(path)
+        return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SmartHealth safety rule tables")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("dump", help="print the default rule table as JSON")
+    p_check = sub.add_parser("check", help="validate a rule table")
+    p_check.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "dump":
+        json.dump({"rules": DEFAULT_RULES}, sys.stdout, indent=2)
+        print()
+        return
+    try:
+        ruleset = RuleSet(load_table(args.path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[RULES] {args.path}: {e}")
+        sys.exit(1)
+    print(f"[RULES] {args.path}: {len(ruleset.names)} rules OK ({', '.join(ruleset.names)})")
+
+
+if __name__ == "__main__":
+    main()
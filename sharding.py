@@ -0,0 +1,335 @@
+"""
+Sharded inference: feature state + prediction in N worker processes.
+
+Devices are hashed (crc32, same as pipeline.IngestPipeline) onto shards,
+so each device's rolling history lives in exactly one process. Every
+shard runs its own ModelService on the same model file; the forest is
+memory-mapped (compiled .npz, or joblib mmap for sklearn) so the OS
+shares its pages between the processes instead of each holding a copy.
+
+submit(record) stamps the record with a sequence number, keeps it in
+the parent and ships only the numbers the worker needs, batched per
+shard. A collector thread puts replies into a reorder buffer and calls
+on_result(record, label) strictly in submit order, from that one thread,
+so the single storage writer and the status publisher see the same
+stream as in the threaded mode. Packets a shard rejects as old/duplicate
+(accept_ts) are skipped, not reported.
+
+A shard that dies is restarted on a fresh inbox. Batches still waiting
+in its old inbox are moved over in order; only the ones the dead process
+had already taken are counted as lost, and a late reply for those is
+ignored.
+"""
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import zlib
+
+_STOP = None
+# label of a seq that went down with a dead shard (already counted in `lost`)
+_LOST = object()
+
+
+def _shard_stats(svc):
+    stats = svc.state.stats()
+    if svc.cache is not None:
+        stats["prediction_cache"] = svc.cache.stats()
+    stats["rules"] = svc.rules.stats()
+    return stats
+
+
+def _shard_main(index, model_source, options, inbox, outbox):
+    from model import ModelService
+    svc = ModelService(model_source, **options)
+    while True:
+        msg = inbox.get()
+        if msg is _STOP:
+            outbox.put((index, None, None, _shard_stats(svc)))
+            return
+        batch_id, batch = msg
+        seqs, feats, replies = [], [], []
+        for seq, device, ts, temp, hum, gas, heartrate in batch:
+            if not svc.state.accept_ts(device, ts):
+                replies.append((seq, None))   # packet lama / duplicate
+                continue
+            seqs.append(seq)
+            feats.append(svc.compute_features(device, temp, hum, gas, ts, heartrate)[0])
+        if feats:
+            try:
+                labels = svc.predict_batch(feats)
+            except Exception as e:
+                print(f"[SHARD {index}] AI prediction error:", e)
+                labels = ["GOOD"] * len(feats)
+            replies.extend(zip(seqs, labels))
+        outbox.put((index, batch_id, replies, _shard_stats(svc)))
+
+
+def shared_model_path(model_path, engine):
+    """
+    For engine="compiled" make sure the exported .npz next to the .pkl is
+    current, so every shard memory-maps the same file. Returns its path
+    (None for sklearn).
+    """
+    if engine != "compiled":
+        return None
+    from forest_compiler import export_npz
+    npz = os.path.splitext(model_path)[0] + ".npz"
+    if not os.path.exists(npz) or os.stat(npz).st_mtime_ns < os.stat(model_path).st_mtime_ns:
+        export_npz(model_path, npz)
+        print(f"[SHARD] exported {npz}")
+    return npz
+
+
+class ShardedInference:
+    def __init__(self, model_path, on_result, shards=2, engine="compiled", roll_size=3,
+                 max_devices=None, device_ttl=None, batch_rows=256, queue_size=64, cache_options=None,
+                 rules=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at {model_path}")
+        self.model_path = model_path
+        self.on_result = on_result
+        self.n_shards = max(1, int(shards))
+        self.batch_rows = max(1, int(batch_rows))
+        self.options = {"roll_size": roll_size, "engine": engine,
+                        "compiled_path": shared_model_path(model_path, engine),
+                        "max_devices": max_devices, "device_ttl": device_ttl,
+                        "cache_options": cache_options, "rules": rules}
+        self._ctx = mp.get_context("spawn")
+        # worker inboxes are bounded: a slow shard backs up into the dispatcher
+        self.queue_size = queue_size
+        self._inboxes = [self._ctx.Queue(queue_size) for _ in range(self.n_shards)]
+        # held around every put into an inbox, so a restart can swap it
+        self._put_locks = [threading.Lock() for _ in range(self.n_shards)]
+        self._outbox = self._ctx.Queue()
+        self._procs = [None] * self.n_shards
+        self._ingress = queue.Queue()
+        self._threads = []
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending = {}      # seq -> record, until its turn in the reorder buffer
+        self._done = {}         # seq -> label (None = dropped) that arrived out of order
+        self._next = 0
+        self._batch_id = 0
+        self._inflight = [{} for _ in range(self.n_shards)]  # batch id -> seqs, per shard
+        self._device_state = [{} for _ in range(self.n_shards)]
+        self.submitted = 0
+        self.completed = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.restarts = 0
+        self.max_reorder = 0
+
+    def _spawn(self, i):
+        p = self._ctx.Process(target=_shard_main, name=f"inference-shard-{i}",
+                              args=(i, self.model_path, self.options, self._inboxes[i], self._outbox),
+                              daemon=True)
+        p.start()
+        self._procs[i] = p
+
+    def start(self):
+        if self._threads:
+            return self
+        for i in range(self.n_shards):
+            self._spawn(i)
+        self._threads = [threading.Thread(target=self._dispatch, name="shard-dispatch", daemon=True),
+                         threading.Thread(target=self._collect, name="shard-collect", daemon=True)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def shard_for(self, device):
+        return zlib.crc32(str(device).encode("utf-8")) % self.n_shards
+
+    def submit(self, record):
+        """record: decoded dict (device, ts, temp, hum, gas, heartrate)."""
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+            self._pending[seq] = record
+            self.submitted += 1
+        self._ingress.put(seq)
+        return seq
+
+    # ---------------- DISPATCH ----------------
+    def _dispatch(self):
+        while True:
+            seqs = [self._ingress.get()]
+            # take whatever else is waiting: batches grow with load, latency
+            # stays at one hop when idle
+            while len(seqs) < self.batch_rows * self.n_shards:
+                try:
+                    seqs.append(self._ingress.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in seqs
+            batches = [[] for _ in range(self.n_shards)]
+            with self._lock:
+                for seq in seqs:
+                    if seq is _STOP:
+                        continue
+                    r = self._pending[seq]
+                    batches[self.shard_for(r["device"])].append(
+                        (seq, r["device"], r["ts"], r["temp"], r["hum"], r["gas"], r["heartrate"]))
+            for i, batch in enumerate(batches):
+                for start in range(0, len(batch), self.batch_rows):
+                    part = batch[start:start + self.batch_rows]
+                    with self._lock:
+                        self._batch_id += 1
+                        batch_id = self._batch_id
+                        self._inflight[i][batch_id] = [s[0] for s in part]
+                    self._put(i, (batch_id, part))
+            if stop:
+                for i in range(self.n_shards):
+                    self._put(i, _STOP)
+                return
+
+    def _put(self, i, item):
+        # short attempts: a dead shard's full inbox must not hold the lock
+        # the restart in _check_workers needs
+        while True:
+            with self._put_locks[i]:
+                try:
+                    self._inboxes[i].put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
+
+    # ---------------- COLLECT / REORDER ----------------
+    def _collect(self):
+        stopped = set()
+        checked = time.monotonic()
+        while len(stopped) < self.n_shards:
+            if time.monotonic() - checked >= 1.0:
+                self._check_workers(stopped)
+                checked = time.monotonic()
+            try:
+                index, batch_id, replies, state = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self._device_state[index] = state
+            if replies is None:
+                stopped.add(index)
+                continue
+            with self._lock:
+                self._inflight[index].pop(batch_id, None)
+            self._resolve(replies)
+
+    def _check_workers(self, stopped):
+        for i, p in enumerate(self._procs):
+            if i in stopped or p is None or p.is_alive():
+                continue
+            with self._put_locks[i]:
+                old = self._inboxes[i]
+                self._inboxes[i] = self._ctx.Queue(self.queue_size)
+                queued = self._take_queued(old)
+                # still waiting in the inbox: the new process gets them, in order
+                for item in queued:
+                    self._inboxes[i].put(item)
+                kept = {item[0] for item in queued if item is not _STOP}
+                # the rest was taken by the dead process along with its device
+                # history; release those seqs so the reorder buffer does not wait
+                with self._lock:
+                    lost = [seq for batch_id, batch in self._inflight[i].items()
+                            if batch_id not in kept for seq in batch]
+                    self._inflight[i] = {b: s for b, s in self._inflight[i].items() if b in kept}
+                    self.lost += len(lost)
+                    self.restarts += 1
+                print(f"[SHARD] shard {i} exited (code {p.exitcode}), {len(lost)} messages lost, "
+                      f"{len(kept)} batches requeued, restarting")
+                self._spawn(i)
+            self._resolve([(seq, _LOST) for seq in lost])
+
+    @staticmethod
+    def _take_queued(inbox):
+        """Whatever is still readable from a dead shard's inbox; then drop the queue."""
+        items = []
+        while True:
+            try:
+                # times out too if the dead process held the read lock
+                items.append(inbox.get(timeout=0.2))
+            except (queue.Empty, OSError, EOFError, ValueError):
+                break
+        inbox.cancel_join_thread()
+        inbox.close()
+        return items
+
+    def _resolve(self, replies):
+        ready = []
+        with self._lock:
+            for seq, label in replies:
+                # late replies of a batch declared lost are ignored
+                if seq in self._pending and self._done.get(seq) is not _LOST:
+                    self._done[seq] = label
+            if len(self._done) > self.max_reorder:
+                self.max_reorder = len(self._done)
+            while self._next in self._done:
+                label = self._done.pop(self._next)
+                record = self._pending.pop(self._next)
+                self._next += 1
+                if label is None:
+                    self.duplicates += 1   # rejected by the shard as old / repeated
+                elif label is not _LOST:
+                    ready.append((record, label))
+            self.completed += len(ready)
+        for record, label in ready:
+            try:
+                self.on_result(record, label)
+            except Exception as e:
+                print("[SHARD] on_result error:", e)
+
+    # ---------------- LIFECYCLE ----------------
+    def close(self, timeout=10.0):
+        """Finish everything submitted so far, then stop the shards."""
+        if not self._threads:
+            return
+        self._ingress.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        for p in self._procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.terminate()
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return {"shards": self.n_shards, "submitted": self.submitted, "completed": self.completed,
+                    "duplicates": self.duplicates, "lost": self.lost, "restarts": self.restarts,
+                    "in_flight": len(self._pending), "reorder_buffer": len(self._done),
+                    "max_reorder": self.max_reorder,
+                    "shard_batches_in_flight": [len(q) for q in self._inflight]}
+
+    def prediction_cache_stats(self):
+        """PredictionCache stats summed over the shards (None if the cache is off)."""
+        if self.options["cache_options"] is None:
+            return None
+        shards = [s["prediction_cache"] for s in self._device_state if s.get("prediction_cache")]
+        keys = ("size", "capacity", "hits", "misses", "evictions", "expired", "invalidations")
+        out = {k: sum(s[k] for s in shards) for k in keys}
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = out["hits"] / lookups if lookups else 0.0
+        return out
+
+    def rule_stats(self):
+        """Rule hit counters summed over the shards (as of each shard's last reply)."""
+        shards = [s["rules"] for s in self._device_state if s.get("rules")]
+        counts = {}
+        for s in shards:
+            for name, c in s["counts"].items():
+                total = counts.setdefault(name, {"hits": 0, "changed": 0})
+                total["hits"] += c["hits"]
+                total["changed"] += c["changed"]
+        return {"source": self.options["rules"] or "default", "counts": counts,
+                "rules": shards[0]["rules"] if shards else [],
+                "reloads": sum(s["reloads"] for s in shards),
+                "reload_errors": sum(s["reload_errors"] for s in shards),
+                "last_error": next((s["last_error"] for s in shards if s["last_error"]), None)}
+
+    def device_state_stats(self):
+        """DeviceStateStore stats summed over the shards (as of each shard's last reply)."""
+        keys = ("devices", "capacity", "evicted", "memory_bytes")
+        return {k: sum(s.get(k, 0) for s in self._device_state) for k in keys}
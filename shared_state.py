@@ -0,0 +1,255 @@
+"""
+Latest reading per device in shared memory.
+
+A fixed-layout table in multiprocessing.shared_memory: a small header
+followed by `n_slots` slots (device, ts, temp, hum, gas, heartrate,
+label code). The ingest process writes; any number of other processes
+attach and read without locks or syscalls.
+
+Every slot (and the header) is guarded by a seqlock: the writer bumps
+the slot's sequence number to odd, writes the fields, and bumps it back
+to even. A reader copies the slot between two reads of the sequence
+number and retries if it was odd or changed. Readers never block the
+writer; a reader only spins (yielding after a few tries, in case the
+writer was preempted mid-write) while its slot is being rewritten.
+
+Writes are made from Python through numpy, and CPython's GIL plus x86
+store ordering keep them in order. On weakly ordered CPUs the retry loop
+still catches torn copies, as long as the sequence store lands last.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model import LABEL_NAMES
+from stats import _epoch
+
+MAGIC = 0x53484853  # "SHHS"
+# a writer that died mid-update leaves its slot odd forever
+MAX_SPINS = 1_000_000
+# after this many spins give the (possibly preempted) writer the CPU
+SPINS_BEFORE_YIELD = 16
+LAYOUT_VERSION = 1
+DEVICE_BYTES = 48
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"), ("version", "<u4"), ("n_slots", "<u4"), ("used", "<u4"),
+    ("seq", "<u8"), ("generation", "<u8"), ("last_slot", "<i8"), ("_pad", "V24"),
+], align=True)
+SLOT_DTYPE = np.dtype([
+    ("seq", "<u8"), ("device", f"S{DEVICE_BYTES}"), ("ts", "<f8"), ("temp", "<f8"),
+    ("hum", "<f8"), ("gas", "<f8"), ("heartrate", "<f8"), ("updates", "<u8"), ("label", "i1"),
+], align=True)
+FIELDS = ("ts", "temp", "hum", "gas", "heartrate")
+
+_LABEL_CODES = {name: i for i, name in enumerate(LABEL_NAMES)}
+
+
+def label_code(label):
+    return _LABEL_CODES.get(label, -1)
+
+
+def _format_ts(epoch):
+    if not epoch == epoch:  # NaN
+        return ""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def table_size(n_slots):
+    return HEADER_DTYPE.itemsize + n_slots * SLOT_DTYPE.itemsize
+
+
+class SharedStateTable:
+    """Writer side (create) or reader side (attach) of one shared table."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if int(self.header["magic"]) != MAGIC or int(self.header["version"]) != LAYOUT_VERSION:
+            raise ValueError(f"{shm.name} is not a version {LAYOUT_VERSION} latest-state table")
+        self.n_slots = int(self.header["n_slots"])
+        self.slots = np.ndarray((self.n_slots,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+        self._seq = self.slots["seq"]
+        self._lock = threading.Lock()
+        self._index = {}
+        # writer-local: when each slot was last written (device ts may be skewed)
+        self._written = np.zeros(self.n_slots, dtype=np.float64)
+        self.retries = 0
+
+    @classmethod
+    def create(cls, name=None, n_slots=1024):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=table_size(n_slots))
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[...] = np.zeros((), dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = LAYOUT_VERSION
+        header["n_slots"] = n_slots
+        header["last_slot"] = -1
+        del header
+        table = cls(shm, owner=True)
+        table.slots[...] = np.zeros(n_slots, dtype=SLOT_DTYPE)
+        table.slots["label"] = -1
+        return table
+
+    @classmethod
+    def attach(cls, name):
+        # readers must not unlink the segment when they exit
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=False, track=False)
+        except TypeError:  # Python < 3.13: keep the attach out of the resource tracker
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda *a, **k: None
+            try:
+                shm = shared_memory.SharedMemory(name=name, create=False)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.header = self.slots = self._seq = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    # ---------------- WRITER ----------------
+    def _slot_for(self, key):
+        """(slot, taken_over): taken_over is True when the slot held another device."""
+        slot = self._index.get(key)
+        if slot is not None:
+            return slot, False
+        used = int(self.header["used"])
+        if used < self.n_slots:
+            slot = used
+            self.header["used"] = used + 1
+            taken_over = False
+        else:
+            # full: take over the device written the longest ago
+            slot = int(np.argmin(self._written))
+            self._index.pop(bytes(self.slots["device"][slot]), None)
+            taken_over = True
+        self._index[key] = slot
+        return slot, taken_over
+
+    def update(self, device, ts, temp, hum, gas, heartrate, label):
+        key = str(device).encode("utf-8")[:DEVICE_BYTES]
+        epoch = _epoch(ts)
+        with self._lock:
+            slot, taken_over = self._slot_for(key)
+            self._written[slot] = time.monotonic()
+            seq = int(self._seq[slot])
+            updates = 1 if taken_over else int(self.slots["updates"][slot]) + 1
+            rec = (seq + 1, key, time.time() if epoch is None else epoch, temp, hum, gas,
+                   heartrate or 0.0, updates, label_code(label))
+            # odd only for the one record store, so readers rarely spin
+            self._seq[slot] = seq + 1
+            self.slots[slot] = rec
+            self._seq[slot] = seq + 2
+
+            hseq = int(self.header["seq"])
+            self.header["seq"] = hseq + 1
+            self.header["generation"] += 1
+            self.header["last_slot"] = slot
+            self.header["seq"] = hseq + 2
+        return slot
+
+    # ---------------- READERS ----------------
+    def _read_slot(self, slot):
+        seq = self._seq
+        for spin in range(MAX_SPINS):
+            if spin >= SPINS_BEFORE_YIELD:
+                os.sched_yield()
+            s1 = int(seq[slot])
+            if s1 & 1:
+                self.retries += 1
+                continue
+            rec = self.slots[slot].item()
+            if int(seq[slot]) == s1:
+                return rec
+            self.retries += 1
+        raise RuntimeError(f"slot {slot} of {self.name} stuck mid-write")
+
+    @staticmethod
+    def _to_record(rec):
+        _, device, ts, temp, hum, gas, heartrate, _, label = rec
+        return {"ts": _format_ts(ts), "device": device.decode("utf-8", errors="replace"),
+                "temp": temp, "hum": hum, "gas": gas,
+                "ai": LABEL_NAMES[label] if label >= 0 else "UNKNOWN", "heartrate": heartrate}
+
+    def _header(self):
+        h = self.header
+        for spin in range(MAX_SPINS):
+            if spin >= SPINS_BEFORE_YIELD:
+                os.sched_yield()
+            s1 = int(h["seq"])
+            if s1 & 1:
+                self.retries += 1
+                continue
+            generation, last_slot, used = int(h["generation"]), int(h["last_slot"]), int(h["used"])
+            if int(h["seq"]) == s1:
+                return generation, last_slot, used
+            self.retries += 1
+        raise RuntimeError(f"header of {self.name} stuck mid-write")
+
+    def version(self):
+        """Number of updates written so far (same role as MQTTRunner.get_version())."""
+        return self._header()[0]
+
+    def latest(self):
+        """Most recently written record of any device, or None."""
+        _, last_slot, _ = self._header()
+        if last_slot < 0:
+            return None
+        return self._to_record(self._read_slot(last_slot))
+
+    def read(self, device):
+        key = str(device).encode("utf-8")[:DEVICE_BYTES]
+        slot = self._index.get(key)
+        if slot is not None:
+            rec = self._read_slot(slot)
+            if rec[1] == key:
+                return self._to_record(rec)
+        _, _, used = self._header()
+        hits = np.flatnonzero(self.slots["device"][:used] == key)
+        if not len(hits):
+            return None
+        slot = int(hits[0])
+        rec = self._read_slot(slot)
+        if rec[1] != key:
+            return None
+        self._index[key] = slot
+        return self._to_record(rec)
+
+    def snapshot(self):
+        """
+        Consistent copy of every used slot as a structured array. Copies
+        the whole table at once and re-reads only the slots whose sequence
+        moved in between.
+        """
+        _, _, used = self._header()
+        seq = self._seq[:used]
+        before = seq.copy()
+        out = self.slots[:used].copy()
+        for spin in range(MAX_SPINS):
+            if spin >= SPINS_BEFORE_YIELD:
+                os.sched_yield()
+            after = seq.copy()
+            bad = np.flatnonzero((before != after) | (before & 1).astype(bool))
+            if not len(bad):
+                return out
+            self.retries += len(bad)
+            before[bad] = after[bad]
+            out[bad] = self.slots[:used][bad]
+        raise RuntimeError(f"{self.name} kept changing under snapshot()")
+
+    def records(self):
+        return [self._to_record(rec) for rec in self.snapshot().tolist()]
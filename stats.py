@@ -0,0 +1,378 @@
+"""
+Streaming running aggregates for the sensor columns.
+
+StreamingStats is fed one record at a time (MQTTRunner._finish, or
+TailCache while it reads the CSV) and keeps, globally and per device:
+
+  * all-time  : count/sum/min/max/mean/variance (Welford) and a
+                fixed-range histogram for approximate percentiles
+  * last hour : 12 x 5 min buckets
+  * last day  : 24 x 1 h buckets
+    each bucket holds count/sum/sumsq/min/max and a fixed-range
+    histogram per metric, so windows merge in O(buckets) and give
+    approximate percentiles.
+
+snapshot() never looks at raw rows; its cost is independent of how much
+history has been ingested, and results are cached until the next add.
+
+Windows are bucketed on the record's own ts but aged on the local clock,
+so a ts ahead of `now` is clamped to `now` (counted in `future`) instead
+of occupying a bucket that would outlive the window. Per-device scopes
+(~45 KB each) get their slots from device_state.SlotAllocator, with the
+same max_devices / ttl as the runner's DeviceStateStore.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from device_state import SlotAllocator
+
+METRICS = ("temp", "hum", "gas", "heartrate")
+
+WINDOW_ALL = "all"
+WINDOW_HOUR = "1h"
+WINDOW_DAY = "1d"
+WINDOWS = (WINDOW_ALL, WINDOW_HOUR, WINDOW_DAY)
+
+# histogram range per metric for windowed percentiles (values outside are clamped)
+DEFAULT_RANGES = {"temp": (-20.0, 80.0), "hum": (0.0, 100.0), "gas": (0.0, 5000.0), "heartrate": (0.0, 250.0)}
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _epoch(ts):
+    """Record timestamp ('YYYY-MM-DD HH:MM:SS', UTC like MQTTRunner writes it) -> epoch seconds."""
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, datetime):
+        dt = ts
+    else:
+        try:
+            dt = datetime.fromisoformat(str(ts))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _quantiles_from_hist(hist, count, lo, width, mn, mx, quantiles, out):
+    """Interpolated percentiles from a fixed-range histogram, clamped to [min, max]."""
+    cum = np.cumsum(hist)
+    bins = len(hist)
+    for p in quantiles:
+        target = p * count
+        b = min(int(np.searchsorted(cum, target)), bins - 1)
+        before = cum[b - 1] if b > 0 else 0
+        inside = hist[b] or 1
+        v = lo + (b + (target - before) / inside) * width
+        out[_qname(p)] = float(min(max(v, mn), mx))
+    return out
+
+
+class _AllTime:
+    """Welford mean/variance, min/max and a fine histogram for every metric of a scope."""
+
+    def __init__(self, lo, hi, bins):
+        m = len(lo)
+        self.lo = lo
+        self.width = (hi - lo) / bins
+        self.bins = bins
+        self.count = 0
+        self.mean = np.zeros(m)
+        self.m2 = np.zeros(m)
+        self.total = np.zeros(m)
+        self.min = np.full(m, np.inf)
+        self.max = np.full(m, -np.inf)
+        self.hist = np.zeros((m, bins), dtype=np.uint32)
+        self._cols = np.arange(m)
+
+    def add(self, values, idx):
+        self.count += 1
+        self.total += values
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+        np.minimum(self.min, values, out=self.min)
+        np.maximum(self.max, values, out=self.max)
+        self.hist[self._cols, idx] += 1
+
+    def merge(self, values, idx):
+        """Batch version of add(): values/idx are (n, metrics)."""
+        n = len(values)
+        if not n:
+            return
+        bmean = values.mean(axis=0)
+        bm2 = ((values - bmean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = bmean - self.mean
+        self.mean += delta * n / total
+        self.m2 += bm2 + delta * delta * self.count * n / total
+        self.count = total
+        self.total += values.sum(axis=0)
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        np.maximum(self.max, values.max(axis=0), out=self.max)
+        for j in self._cols:
+            self.hist[j] += np.bincount(idx[:, j], minlength=self.bins).astype(np.uint32)
+
+    def snapshot(self, quantiles):
+        out = []
+        for j in range(len(self.lo)):
+            if not self.count:
+                out.append(_empty(quantiles))
+                continue
+            var = float(self.m2[j] / self.count)
+            snap = {"count": self.count, "sum": float(self.total[j]), "min": float(self.min[j]),
+                    "max": float(self.max[j]), "mean": float(self.mean[j]), "var": var, "std": var ** 0.5}
+            out.append(_quantiles_from_hist(self.hist[j], self.count, self.lo[j], self.width[j],
+                                            self.min[j], self.max[j], quantiles, snap))
+        return out
+
+
+def _qname(p):
+    return "p" + f"{p * 100:g}".replace(".", "_")
+
+
+def _empty(quantiles):
+    out = {"count": 0, "sum": 0.0, "min": 0.0, "max": 0.0, "mean": 0.0, "var": 0.0, "std": 0.0}
+    for p in quantiles:
+        out[_qname(p)] = 0.0
+    return out
+
+
+class _Window:
+    """Ring of time buckets; every bucket keeps per-metric moments + histogram."""
+
+    def __init__(self, bucket_s, n_buckets, lo, hi, bins, shift):
+        m = len(lo)
+        # bin index arrives at the all-time resolution; shift coarsens it
+        self.shift = shift
+        self.bucket_s = bucket_s
+        self.n = n_buckets
+        self.lo = lo
+        self.width = (hi - lo) / bins
+        self.bins = bins
+        self.epochs = np.full(n_buckets, -1, dtype=np.int64)
+        self.count = np.zeros((n_buckets, m), dtype=np.int64)
+        self.sum = np.zeros((n_buckets, m))
+        self.sumsq = np.zeros((n_buckets, m))
+        self.min = np.full((n_buckets, m), np.inf)
+        self.max = np.full((n_buckets, m), -np.inf)
+        self.hist = np.zeros((n_buckets, m, bins), dtype=np.uint32)
+        self._cols = np.arange(m)
+
+    def add(self, t, values, idx, now):
+        e = int(t // self.bucket_s)
+        if e <= int(now // self.bucket_s) - self.n:
+            return  # older than the whole window
+        slot = e % self.n
+        if self.epochs[slot] != e:
+            if self.epochs[slot] > e:
+                return
+            self.epochs[slot] = e
+            self.count[slot] = 0
+            self.sum[slot] = 0.0
+            self.sumsq[slot] = 0.0
+            self.min[slot] = np.inf
+            self.max[slot] = -np.inf
+            self.hist[slot] = 0
+        self.count[slot] += 1
+        self.sum[slot] += values
+        self.sumsq[slot] += values * values
+        np.minimum(self.min[slot], values, out=self.min[slot])
+        np.maximum(self.max[slot], values, out=self.max[slot])
+        self.hist[slot, self._cols, idx // self.shift] += 1
+
+    def merge(self, t, values, idx, now):
+        """Batch version of add(): t is (n,), values/idx are (n, metrics)."""
+        e = (t // self.bucket_s).astype(np.int64)
+        keep = e > int(now // self.bucket_s) - self.n
+        if not keep.any():
+            return
+        e, values, idx = e[keep], values[keep], idx[keep] // self.shift
+        for epoch in np.unique(e):
+            epoch = int(epoch)
+            slot = epoch % self.n
+            if self.epochs[slot] != epoch:
+                if self.epochs[slot] > epoch:
+                    continue
+                self.epochs[slot] = epoch
+                self.count[slot] = 0
+                self.sum[slot] = 0.0
+                self.sumsq[slot] = 0.0
+                self.min[slot] = np.inf
+                self.max[slot] = -np.inf
+                self.hist[slot] = 0
+            rows = e == epoch
+            v = values[rows]
+            self.count[slot] += len(v)
+            self.sum[slot] += v.sum(axis=0)
+            self.sumsq[slot] += (v * v).sum(axis=0)
+            np.minimum(self.min[slot], v.min(axis=0), out=self.min[slot])
+            np.maximum(self.max[slot], v.max(axis=0), out=self.max[slot])
+            for j in self._cols:
+                self.hist[slot, j] += np.bincount(idx[rows, j], minlength=self.bins).astype(np.uint32)
+
+    def snapshot(self, now, quantiles):
+        live = self.epochs > int(now // self.bucket_s) - self.n
+        count = self.count[live].sum(axis=0)
+        total = self.sum[live].sum(axis=0)
+        sumsq = self.sumsq[live].sum(axis=0)
+        mn = self.min[live].min(axis=0, initial=np.inf)
+        mx = self.max[live].max(axis=0, initial=-np.inf)
+        hist = self.hist[live].sum(axis=0)
+
+        out = []
+        for j in range(len(self.lo)):
+            c = int(count[j])
+            if not c:
+                out.append(_empty(quantiles))
+                continue
+            mean = total[j] / c
+            var = max(0.0, sumsq[j] / c - mean * mean)
+            snap = {"count": c, "sum": float(total[j]), "min": float(mn[j]), "max": float(mx[j]),
+                    "mean": float(mean), "var": float(var), "std": float(var ** 0.5)}
+            out.append(_quantiles_from_hist(hist[j], c, self.lo[j], self.width[j], mn[j], mx[j], quantiles, snap))
+        return out
+
+
+class _Scope:
+    def __init__(self, owner):
+        self.all = _AllTime(owner.lo, owner.hi, owner.bins * owner.shift)
+        self.windows = {
+            WINDOW_HOUR: _Window(300, 12, owner.lo, owner.hi, owner.bins, owner.shift),
+            WINDOW_DAY: _Window(3600, 24, owner.lo, owner.hi, owner.bins, owner.shift),
+        }
+        self.version = 0
+
+
+class StreamingStats:
+    def __init__(self, metrics=METRICS, quantiles=DEFAULT_QUANTILES, ranges=None, bins=64,
+                 all_time_shift=4, per_device=True, max_devices=None, device_ttl=None, sweep_every=1024):
+        """
+        bins: histogram bins per metric in every window bucket; the all-time
+        histogram is all_time_shift times finer. ranges: {metric: (lo, hi)}.
+        max_devices / device_ttl bound the per-device scopes (None = unbounded).
+        """
+        ranges = dict(DEFAULT_RANGES, **(ranges or {}))
+        self.metrics = tuple(metrics)
+        self.quantiles = tuple(quantiles)
+        self.lo = np.array([ranges[m][0] for m in self.metrics], dtype=float)
+        self.hi = np.array([ranges[m][1] for m in self.metrics], dtype=float)
+        self.bins = bins
+        self.shift = max(1, int(all_time_shift))
+        self._scale = bins * self.shift / (self.hi - self.lo)
+        self.per_device = per_device
+        self.future = 0
+        self._lock = threading.Lock()
+        self._global = _Scope(self)
+        self._scopes = []   # slot -> (device, _Scope) or None
+        self._cache = {}
+        self._slots = SlotAllocator(self._grow, self._clear, 64, max_devices, device_ttl, sweep_every)
+
+    def _grow(self, old, n):
+        self._scopes.extend([None] * (n - old))
+
+    def _clear(self, slot):
+        device, _ = self._scopes[slot]
+        self._scopes[slot] = None
+        for window in WINDOWS:
+            self._cache.pop((device, window), None)
+
+    def _scope(self, device, now):
+        slot = self._slots.slot(device, now)
+        entry = self._scopes[slot]
+        if entry is None:
+            entry = self._scopes[slot] = (device, _Scope(self))
+        return entry[1]
+
+    @property
+    def evicted(self):
+        return self._slots.evicted
+
+    def add(self, device, record, now=None):
+        """record: dict with the metric columns and (optionally) 'ts'."""
+        now = time.time() if now is None else now
+        t = _epoch(record.get("ts")) if record.get("ts") is not None else None
+        if t is None:
+            t = now
+        values = np.array([float(record.get(m) or 0.0) for m in self.metrics])
+        idx = np.clip(((values - self.lo) * self._scale).astype(np.int64), 0, self.bins * self.shift - 1)
+        with self._lock:
+            if t > now:
+                self.future += 1
+                t = now
+            scopes = [self._global]
+            if self.per_device and device is not None:
+                scopes.append(self._scope(device, now))
+            for scope in scopes:
+                scope.all.add(values, idx)
+                for w in scope.windows.values():
+                    w.add(t, values, idx, now)
+                scope.version += 1
+
+    def add_many(self, devices, records, now=None, times=None):
+        """
+        Vectorised add() for a batch (e.g. a chunk of CSV rows): devices is
+        a sequence of device ids, records the matching dicts. `times` may
+        carry already parsed epoch seconds (NaN = unknown).
+        """
+        if not records:
+            return
+        now = time.time() if now is None else now
+        if times is None:
+            times = [_epoch(r.get("ts")) if r.get("ts") is not None else None for r in records]
+        t = np.array(times, dtype=float)
+        t[np.isnan(t)] = now
+        ahead = t > now
+        values = np.array([[float(r.get(m) or 0.0) for m in self.metrics] for r in records])
+        idx = np.clip(((values - self.lo) * self._scale).astype(np.int64), 0, self.bins * self.shift - 1)
+        with self._lock:
+            if ahead.any():
+                self.future += int(ahead.sum())
+                t[ahead] = now
+            groups = [(self._global, slice(None))]
+            if self.per_device:
+                names, inverse = np.unique(np.asarray(devices, dtype=object).astype(str), return_inverse=True)
+                for k, name in enumerate(names):
+                    groups.append((self._scope(name, now), inverse == k))
+            for scope, rows in groups:
+                scope.all.merge(values[rows], idx[rows])
+                for w in scope.windows.values():
+                    w.merge(t[rows], values[rows], idx[rows], now)
+                scope.version += 1
+
+    def evict_expired(self, now=None):
+        """Drop device scopes not updated for device_ttl seconds. Returns how many were dropped."""
+        with self._lock:
+            return self._slots.evict_expired(time.time() if now is None else now)
+
+    def devices(self):
+        with self._lock:
+            return self._slots.devices()
+
+    def snapshot(self, device=None, window=WINDOW_ALL, now=None):
+        """{metric: {count, sum, min, max, mean, var, std, p50, p90, p99}}"""
+        if window not in WINDOWS:
+            raise ValueError(f"window must be one of {WINDOWS}")
+        now = time.time() if now is None else now
+        with self._lock:
+            if device is None:
+                scope = self._global
+            else:
+                slot = self._slots.get(device)
+                scope = None if slot is None else self._scopes[slot][1]
+            if scope is None:
+                return {m: _empty(self.quantiles) for m in self.metrics}
+            tick = None if window == WINDOW_ALL else int(now // scope.windows[window].bucket_s)
+            key = (device, window)
+            cached = self._cache.get(key)
+            if cached is None or cached[0] != (scope.version, tick):
+                if window == WINDOW_ALL:
+                    snaps = scope.all.snapshot(self.quantiles)
+                else:
+                    snaps = scope.windows[window].snapshot(now, self.quantiles)
+                cached = self._cache[key] = ((scope.version, tick), dict(zip(self.metrics, snaps)))
+            # callers may annotate what they get; the cached dicts stay untouched
+            return {m: dict(snap) for m, snap in cached[1].items()}
@@ -0,0 +1,235 @@
+"""
+Per-device SHHE/status publishing.
+
+The runners used to publish {"status": label} whenever a message's label
+differed from the previous message's, whatever device it came from, so
+two devices with different labels flapped the topic on every message.
+StatusPublisher instead:
+
+  - tracks the published status per device, and only moves a device to
+    a new label after `confirm` consecutive samples with it (labels in
+    `immediate`, DANGER by default, and a device's first sample skip
+    the wait)
+  - coalesces transitions for `coalesce_ms` into one payload
+      {"status": <worst status over all devices>, "devices": {device: label, ...}}
+    (a device that flips back before the flush drops out of it)
+  - rate-limits with token buckets: one for the topic, one per device
+
+publish(topic, payload) is called from the publisher's own thread.
+"""
+import json
+import threading
+import time
+
+SEVERITY = {"GOOD": 0, "ALERT": 1, "DANGER": 2}
+
+
+def worst(labels):
+    return max(labels, key=lambda l: SEVERITY.get(l, -1), default="N/A")
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now=0.0):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = now
+
+    def _refill(self, now):
+        if now > self.last:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self, now):
+        """Seconds until one token is available."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class StatusPublisher:
+    def __init__(self, publish, topic="SHHE/status", confirm=3, immediate=("DANGER",),
+                 rate=2.0, burst=5, device_rate=1.0, device_burst=3, coalesce_ms=250,
+                 max_batch=100, clock=time.monotonic):
+        self.publish = publish
+        self.topic = topic
+        self.confirm = max(1, int(confirm))
+        self.immediate = set(immediate or ())
+        self.coalesce = max(0.0, coalesce_ms / 1000.0)
+        self.max_batch = max(1, int(max_batch))
+        self.clock = clock
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.bucket = TokenBucket(rate, burst, clock())
+
+        self._cond = threading.Condition()
+        self._state = {}       # device -> status decided (debounced)
+        self._sent = {}        # device -> status last published
+        self._candidate = {}   # device -> (label, consecutive samples)
+        self._pending = {}     # device -> status waiting for a flush
+        self._first_pending = None
+        self._buckets = {}
+        self._naive_last = None
+        self._stop = False
+        self._thread = None
+
+        self.samples = 0
+        self.naive_publishes = 0   # what "publish when the label changes" would have sent
+        self.transitions = 0
+        self.suppressed = 0        # candidate transitions that did not hold for `confirm` samples
+        self.coalesced = 0         # transitions that never went out on their own
+        self.publishes = 0
+        self.devices_published = 0
+        self.rate_limited = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="status-publisher", daemon=True)
+            self._thread.start()
+        return self
+
+    # ---------------- INPUT ----------------
+    def observe(self, device, label):
+        with self._cond:
+            self.samples += 1
+            if label != self._naive_last:
+                self.naive_publishes += 1
+                self._naive_last = label
+
+            current = self._state.get(device)
+            if label == current:
+                if device in self._candidate:
+                    del self._candidate[device]
+                    self.suppressed += 1
+                return
+            cand, n = self._candidate.get(device, (None, 0))
+            if cand != label:
+                if cand is not None:
+                    self.suppressed += 1
+                n = 0
+            n += 1
+            if n < self.confirm and current is not None and label not in self.immediate:
+                self._candidate[device] = (label, n)
+                return
+
+            self._candidate.pop(device, None)
+            self._state[device] = label
+            self.transitions += 1
+            if self._sent.get(device) == label:
+                # flipped back before its flush: nothing to tell anyone
+                self._pending.pop(device, None)
+                self.coalesced += 2
+                return
+            if device in self._pending:
+                self.coalesced += 1
+            self._pending[device] = label
+            if self._first_pending is None:
+                self._first_pending = self.clock()
+            self._cond.notify()
+
+    # ---------------- FLUSH ----------------
+    def _device_bucket(self, device, now):
+        b = self._buckets.get(device)
+        if b is None:
+            b = self._buckets[device] = TokenBucket(self.device_rate, self.device_burst, now)
+        return b
+
+    def _take_batch(self, now, force=False):
+        """Devices (and labels) allowed out now; None if the topic bucket is empty."""
+        if not force and not self.bucket.take(now):
+            return None
+        batch = {}
+        for device, label in list(self._pending.items()):
+            if len(batch) >= self.max_batch:
+                break
+            if force or self._device_bucket(device, now).take(now):
+                batch[device] = label
+                del self._pending[device]
+        if not batch and not force:
+            self.bucket.tokens += 1.0   # nothing eligible: give the token back
+        self._first_pending = now if self._pending else None
+        return batch
+
+    def _wait_time(self, now):
+        """Seconds until a flush may happen (None = nothing pending)."""
+        if not self._pending:
+            return None
+        if len(self._pending) < self.max_batch:
+            due = self._first_pending + self.coalesce - now
+            if due > 0:
+                return due
+        wait = self.bucket.wait_time(now)
+        if wait > 0:
+            return wait
+        device_wait = min(self._device_bucket(d, now).wait_time(now) for d in self._pending)
+        return device_wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = self.clock()
+                    wait = self._wait_time(now)
+                    if self._stop:
+                        batch = self._take_batch(now, force=True) if self._pending else {}
+                        break
+                    if wait is not None and wait <= 0:
+                        batch = self._take_batch(now)
+                        if batch is None:
+                            self.rate_limited += 1
+                            continue
+                        if batch:
+                            break
+                        continue
+                    self._cond.wait(wait)
+                payload = self._payload(batch) if batch else None
+                stop = self._stop and not self._pending
+            if payload is not None:
+                try:
+                    self.publish(self.topic, payload)
+                except Exception as e:
+                    print("[STATUS] publish error:", e)
+            if stop:
+                return
+
+    def _payload(self, batch):
+        for device, label in batch.items():
+            self._sent[device] = label
+        self.publishes += 1
+        self.devices_published += len(batch)
+        return json.dumps({"status": worst(self._state.values()), "devices": batch})
+
+    def close(self, timeout=5.0):
+        """Publish whatever is pending (ignoring the rate limit) and stop."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ---------------- INTROSPECTION ----------------
+    def status(self, device=None):
+        with self._cond:
+            if device is not None:
+                return self._state.get(device, "N/A")
+            return worst(self._state.values())
+
+    def stats(self):
+        with self._cond:
+            saved = self.naive_publishes - self.publishes
+            return {"samples": self.samples, "devices": len(self._state),
+                    "naive_publishes": self.naive_publishes, "publishes": self.publishes,
+                    "saved": saved, "saved_ratio": saved / self.naive_publishes if self.naive_publishes else 0.0,
+                    "transitions": self.transitions, "suppressed": self.suppressed,
+                    "coalesced": self.coalesced, "devices_published": self.devices_published,
+                    "rate_limited": self.rate_limited, "pending": len(self._pending),
+                    "tokens": self.bucket.tokens}
@@ -0,0 +1,415 @@
+"""
+Telemetry storage backends.
+
+CsvStore keeps the single flat data.csv (append-only via TelemetryWriter).
+ParquetStore keeps a hive-partitioned Parquet dataset:
+
+    <root>/device=<device>/date=YYYY-MM-DD[/hour=HH]/part-*.parquet
+
+with float32 sensor columns and dictionary-encoded `ai`, so readers can
+push device/time predicates and column selection down to the files
+instead of parsing the whole history. ParquetStore needs pyarrow.
+
+Migrate an existing CSV:
+
+    python storage.py migrate data.csv data_store --partition day
+"""
+import argparse
+import os
+import time
+import threading
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from telemetry_writer import TelemetryWriter, CSV_COLUMNS, OPTIONAL_COLUMNS, FSYNC_INTERVAL, FSYNC_BATCH
+
+NUMERIC_COLUMNS = ["temp", "hum", "gas", "heartrate"]
+PARTITION_DAY = "day"
+PARTITION_HOUR = "hour"
+
+
+def _coerce(df, columns=None):
+    """Bring a raw frame to the dashboard's types (same rules app.py used)."""
+    cols = columns or CSV_COLUMNS
+    for col in NUMERIC_COLUMNS:
+        if col in cols:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype("float32")
+            else:
+                df[col] = np.float32(0)
+    for col in OPTIONAL_COLUMNS:
+        # not recorded (legacy file / detector off) stays NaN, not 0
+        if col in cols:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+            else:
+                df[col] = np.float32(np.nan)
+    if "ts" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["ts"]):
+        df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
+    for col in ("device", "ai"):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _filter(df, device=None, since=None, until=None):
+    if device is not None and "device" in df.columns:
+        df = df[df["device"] == device]
+    if since is not None and "ts" in df.columns:
+        df = df[df["ts"] >= pd.Timestamp(since)]
+    if until is not None and "ts" in df.columns:
+        df = df[df["ts"] < pd.Timestamp(until)]
+    return df
+
+
+# ====================== CSV ======================
+class CsvStore:
+    backend = "csv"
+
+    def __init__(self, path="data.csv", batch_size=256, flush_interval=1.0, fsync=FSYNC_INTERVAL,
+                 index=False, index_bucket="hour"):
+        """
+        index: keep the csv_index.CsvIndex sidecar (<path>.idx) up to date
+        while appending, and answer read() with device / time predicates
+        from it instead of parsing the whole file.
+        """
+        self.path = path
+        self._writer_kwargs = {"batch_size": batch_size, "flush_interval": flush_interval, "fsync": fsync}
+        self.writer = None
+        self.indexed = index
+        self.index_bucket = index_bucket
+        self.index = None
+
+    def open_writer(self):
+        if self.writer is None:
+            writer = TelemetryWriter(self.path, **self._writer_kwargs)
+            if self.indexed:
+                # after the writer's crash recovery, so a cut tail is never indexed
+                from csv_index import CsvIndex
+                if self.index is not None:
+                    # a read() before the writer opened built a read-only one;
+                    # reads go through the writer's index from now on
+                    self.index.close()
+                self.index = CsvIndex(self.path, bucket=self.index_bucket, writable=True)
+                writer.on_write = self.index.add_batch
+            self.writer = writer.start()
+        return self.writer
+
+    def append(self, row):
+        return self.open_writer().append(row)
+
+    def flush(self, timeout=None):
+        if self.writer is not None:
+            return self.writer.flush(timeout)
+        return True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.index is not None:
+            self.index.close()
+
+    def read(self, columns=None, device=None, since=None, until=None):
+        """
+        Read the CSV into a typed frame. The CSV format cannot skip rows,
+        so predicates are applied after parsing; only `columns` (plus what
+        the predicates need) are materialised. With index=True a read with
+        a device or time predicate parses only the indexed byte ranges.
+        """
+        if self.indexed and (device is not None or since is not None or until is not None):
+            if self.index is None:
+                from csv_index import CsvIndex
+                self.index = CsvIndex(self.path, bucket=self.index_bucket)
+            return self.index.query(device, since, until, columns)
+        wanted = list(columns or CSV_COLUMNS)
+        need = set(wanted)
+        if device is not None:
+            need.add("device")
+        if since is not None or until is not None:
+            need.add("ts")
+        if need & set(OPTIONAL_COLUMNS):
+            # a legacy file has none of them: ts keeps the row count
+            need.add("ts")
+        try:
+            df = pd.read_csv(self.path, usecols=lambda c: c in need)
+            if not (need - set(OPTIONAL_COLUMNS)).issubset(df.columns):
+                # header-less / foreign file: take the first 7 columns positionally
+                df2 = pd.read_csv(self.path, header=None)
+                if df2.shape[1] < len(CSV_COLUMNS):
+                    return _coerce(pd.DataFrame(columns=wanted), wanted)
+                df2 = df2.iloc[:, :len(CSV_COLUMNS)]
+                df2.columns = CSV_COLUMNS
+                df = df2[[c for c in CSV_COLUMNS if c in need]]
+        except Exception as e:
+            print("[STORE] Warning reading CSV:", e)
+            return _coerce(pd.DataFrame(columns=wanted), wanted)
+        df = _filter(_coerce(df, list(need)), device, since, until)
+        return df[wanted].reset_index(drop=True)
+
+
+# ====================== PARQUET ======================
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.dataset  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError("ParquetStore needs pyarrow (pip install pyarrow)") from e
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("ts", pa.timestamp("ms")),
+        ("temp", pa.float32()),
+        ("hum", pa.float32()),
+        ("gas", pa.float32()),
+        ("ai", pa.dictionary(pa.int8(), pa.string())),
+        ("heartrate", pa.float32()),
+        ("anomaly", pa.float32()),
+    ])
+
+
+class _ParquetWriter(TelemetryWriter):
+    """TelemetryWriter's queue/flusher, writing partition files instead of CSV lines."""
+
+    def __init__(self, store, **kwargs):
+        self.store = store
+        super().__init__(store.root, **kwargs)
+
+    def _recover(self, columns):
+        os.makedirs(self.path, exist_ok=True)
+        # leftovers of an interrupted flush are never visible to readers
+        for dirpath, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(dirpath, name))
+        return columns
+
+    def _write_batch(self, rows):
+        if not rows:
+            return
+        try:
+            self.store._write_frame(pd.DataFrame(rows), fsync=self.fsync == FSYNC_BATCH)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            print("[STORE] Parquet append failed:", e)
+            return
+        with self._stats_lock:
+            self.written += len(rows)
+            self.batches += 1
+
+    def _maybe_fsync(self, fd=None, force=False):
+        # every part file is written to .tmp and renamed; fsync happens per file
+        pass
+
+
+class ParquetStore:
+    backend = "parquet"
+
+    def __init__(self, root="data_store", partition=PARTITION_DAY, batch_size=1024,
+                 flush_interval=5.0, fsync=FSYNC_INTERVAL):
+        _require_pyarrow()
+        if partition not in (PARTITION_DAY, PARTITION_HOUR):
+            raise ValueError("partition must be 'day' or 'hour'")
+        self.root = root
+        self.partition = partition
+        self._writer_kwargs = {"batch_size": batch_size, "flush_interval": flush_interval, "fsync": fsync}
+        self.writer = None
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _partitioning(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        fields = [("device", pa.string()), ("date", pa.string())]
+        if self.partition == PARTITION_HOUR:
+            fields.append(("hour", pa.int8()))
+        return ds.partitioning(pa.schema(fields), flavor="hive")
+
+    def _next_name(self):
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        return f"part-{time.time_ns()}-{os.getpid()}-{seq}.parquet"
+
+    def _write_frame(self, df, fsync=False):
+        """Write a frame of raw rows, one file per (device, partition)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = _coerce(df.copy(), CSV_COLUMNS + OPTIONAL_COLUMNS)
+        df["device"] = df["device"].astype(str)
+        ts = df["ts"]
+        df["_date"] = ts.dt.strftime("%Y-%m-%d").fillna("unknown")
+        keys = ["device", "_date"]
+        if self.partition == PARTITION_HOUR:
+            df["_hour"] = ts.dt.hour.fillna(0).astype(int)
+            keys.append("_hour")
+
+        schema = _arrow_schema()
+        for key, part in df.groupby(keys, sort=False, observed=True):
+            device, date = key[0], key[1]
+            subdir = os.path.join(self.root, f"device={quote(device, safe='')}", f"date={date}")
+            if self.partition == PARTITION_HOUR:
+                subdir = os.path.join(subdir, f"hour={int(key[2]):02d}")
+            os.makedirs(subdir, exist_ok=True)
+
+            part = part.sort_values("ts", kind="stable")
+            table = pa.Table.from_pandas(
+                part[[f.name for f in schema]].assign(ai=part["ai"].astype(str)),
+                schema=schema, preserve_index=False)
+            final = os.path.join(subdir, self._next_name())
+            tmp = final + ".tmp"
+            pq.write_table(table, tmp, compression="zstd")
+            if fsync:
+                with open(tmp, "rb") as f:
+                    os.fsync(f.fileno())
+            os.replace(tmp, final)
+
+    # ---------------- write API ----------------
+    def open_writer(self):
+        if self.writer is None:
+            self.writer = _ParquetWriter(self, **self._writer_kwargs).start()
+        return self.writer
+
+    def append(self, row):
+        return self.open_writer().append(row)
+
+    def flush(self, timeout=None):
+        if self.writer is not None:
+            return self.writer.flush(timeout)
+        return True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    # ---------------- read API ----------------
+    def dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        partitioning = self._partitioning()
+        # explicit schema: files written before a column existed read it as null
+        schema = pa.unify_schemas([_arrow_schema(), partitioning.schema])
+        return ds.dataset(self.root, format="parquet", partitioning=partitioning, schema=schema,
+                          exclude_invalid_files=True, ignore_prefixes=[".", "_"])
+
+    def read(self, columns=None, device=None, since=None, until=None):
+        """
+        Read a typed frame. `device` and the time range prune whole
+        partitions; `ts` additionally uses row-group statistics; only the
+        requested columns are decoded.
+        """
+        import pyarrow.dataset as ds
+
+        wanted = list(columns or CSV_COLUMNS)
+        filt = None
+
+        def _and(a, b):
+            return b if a is None else a & b
+
+        if device is not None:
+            filt = _and(filt, ds.field("device") == str(device))
+        if since is not None:
+            since = pd.Timestamp(since)
+            filt = _and(filt, ds.field("date") >= since.strftime("%Y-%m-%d"))
+            filt = _and(filt, ds.field("ts") >= since.to_pydatetime())
+        if until is not None:
+            until = pd.Timestamp(until)
+            filt = _and(filt, ds.field("date") <= until.strftime("%Y-%m-%d"))
+            filt = _and(filt, ds.field("ts") < until.to_pydatetime())
+
+        try:
+            dset = self.dataset()
+            if not dset.files:
+                return _coerce(pd.DataFrame(columns=wanted), wanted)
+            table = dset.to_table(columns=wanted, filter=filt)
+        except Exception as e:
+            print("[STORE] Warning reading Parquet:", e)
+            return _coerce(pd.DataFrame(columns=wanted), wanted)
+
+        df = table.to_pandas()
+        if "ts" in df.columns:
+            df = df.sort_values("ts", kind="stable")
+        return _coerce(df, wanted)[wanted].reset_index(drop=True)
+
+    def compact(self):
+        """Merge the small per-flush files of every closed partition into one file."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        current = datetime.utcnow().strftime("%Y-%m-%d")
+        merged = 0
+        for dirpath, _, files in os.walk(self.root):
+            parts = sorted(f for f in files if f.endswith(".parquet"))
+            if len(parts) < 2 or f"date={current}" in dirpath:
+                continue
+            paths = [os.path.join(dirpath, f) for f in parts]
+            table = pa.concat_tables([pq.ParquetFile(p).read() for p in paths],
+                                     promote_options="default").sort_by("ts")
+            final = os.path.join(dirpath, self._next_name())
+            pq.write_table(table, final + ".tmp", compression="zstd")
+            os.replace(final + ".tmp", final)
+            for p in paths:
+                os.remove(p)
+            merged += len(paths)
+        return merged
+
+
+def open_store(backend="csv", path=None, **kwargs):
+    if backend == "csv":
+        return CsvStore(path or "data.csv", **kwargs)
+    if backend == "parquet":
+        return ParquetStore(path or "data_store", **kwargs)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+# ====================== MIGRATION ======================
+def migrate_csv(csv_path, root, partition=PARTITION_DAY, chunksize=200_000):
+    """Convert a flat data.csv into a ParquetStore. Returns the number of rows written."""
+    store = ParquetStore(root, partition=partition)
+    total = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        missing = [c for c in CSV_COLUMNS if c not in chunk.columns]
+        for c in missing:
+            chunk[c] = "" if c in ("device", "ai") else 0
+        chunk["device"] = chunk["device"].fillna("").astype(str)
+        chunk["ai"] = chunk["ai"].fillna("N/A").astype(str)
+        # optional columns a legacy file lacks come out as NaN in _write_frame
+        store._write_frame(chunk[CSV_COLUMNS + [c for c in OPTIONAL_COLUMNS if c in chunk.columns]])
+        total += len(chunk)
+        print(f"[STORE] migrated {total} rows")
+    store.compact()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SmartHealth telemetry storage tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="convert data.csv into a partitioned Parquet store")
+    m.add_argument("csv_path")
+    m.add_argument("root")
+    m.add_argument("--partition", choices=[PARTITION_DAY, PARTITION_HOUR], default=PARTITION_DAY)
+    m.add_argument("--chunksize", type=int, default=200_000)
+    c = sub.add_parser("compact", help="merge small part files of closed partitions")
+    c.add_argument("root")
+    c.add_argument("--partition", choices=[PARTITION_DAY, PARTITION_HOUR], default=PARTITION_DAY)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "migrate":
+        t0 = time.perf_counter()
+        n = migrate_csv(args.csv_path, args.root, args.partition, args.chunksize)
+        print(f"[STORE] {n} rows -> {args.root} in {time.perf_counter() - t0:.1f}s")
+    elif args.cmd == "compact":
+        n = ParquetStore(args.root, partition=args.partition).compact()
+        print(f"[STORE] merged {n} files")
+
+
+if __name__ == "__main__":
+    main()
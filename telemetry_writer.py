@@ -0,0 +1,292 @@
+import csv
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+
+CSV_COLUMNS = ["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]
+# written after CSV_COLUMNS; a file with the legacy header gets them added
+# once, when a writer opens it (upgrade_header), older rows left empty
+OPTIONAL_COLUMNS = ["anomaly"]
+
+# fsync policies
+FSYNC_NEVER = "never"        # leave durability to the OS page cache
+FSYNC_BATCH = "batch"        # fsync after every flushed batch
+FSYNC_INTERVAL = "interval"  # fsync at most once every fsync_interval seconds
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL)
+
+_STOP = object()
+
+
+def upgrade_header(path, columns):
+    """
+    Rewrite a CSV so its header has every name in `columns` (missing ones
+    appended at the end, empty in the existing rows). Streams the file
+    through a temporary copy and replaces it. Returns the new header.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as src:
+        line = src.readline()
+        lineterminator = "\r\n" if line.endswith("\r\n") else "\n"
+        header = next(csv.reader([line.rstrip("\r\n")]), [])
+        missing = [c for c in columns if c not in header]
+        if not missing:
+            return header
+        tmp = path + ".upgrade"
+        with open(tmp, "w", encoding="utf-8", newline="") as dst:
+            w = csv.writer(dst, lineterminator=lineterminator)
+            w.writerow(header + missing)
+            pad = [""] * len(missing)
+            n = 0
+            for row in csv.reader(src):
+                w.writerow(row + pad)
+                n += 1
+            dst.flush()
+            os.fsync(dst.fileno())
+    shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+    print(f"[WRITER] Upgraded {path}: added {missing} to the header ({n} rows)")
+    return header + missing
+
+
+class TelemetryWriter:
+    """
+    Append-only CSV writer for telemetry rows.
+
+    append() only puts the row on a bounded queue; a background flusher
+    thread appends whole batches to the end of the file (one write per
+    batch) when batch_size rows are pending or flush_interval seconds
+    have passed since the first pending row. The file is never re-read
+    or rewritten, so the cost of a row does not depend on the file size.
+    """
+
+    def __init__(self, path, columns=None, max_queue=10000, batch_size=256,
+                 flush_interval=1.0, fsync=FSYNC_INTERVAL, fsync_interval=5.0,
+                 put_timeout=0.5, on_write=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.put_timeout = put_timeout
+        # on_write(rows, offset, data): called on the flusher thread after
+        # every batch that reached the file (csv_index.CsvIndex.add_batch)
+        self.on_write = on_write
+
+        self.lineterminator = "\r\n"
+        self.columns = self._recover(list(columns or CSV_COLUMNS + OPTIONAL_COLUMNS))
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._last_fsync = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+
+    # ---------------- RECOVERY ----------------
+    def _recover(self, columns):
+        """
+        Make sure the file exists, has a header and ends on a full line.
+        A row that was only half written when the process died is cut off
+        here, before new rows get appended behind it. Returns the columns
+        of the header that is actually on disk.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            self._write_header(columns)
+            return columns
+
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 1))
+            if f.read(1) != b"\n":
+                # walk back to the last complete line
+                pos = size
+                chunk = 4096
+                cut = -1
+                while pos > 0 and cut < 0:
+                    start = max(0, pos - chunk)
+                    f.seek(start)
+                    data = f.read(pos - start)
+                    idx = data.rfind(b"\n")
+                    if idx >= 0:
+                        cut = start + idx + 1
+                    pos = start
+                if cut <= 0:
+                    # not even the header made it to disk
+                    f.truncate(0)
+                else:
+                    print(f"[WRITER] Recovered {self.path}: dropped {size - cut} bytes of partial tail")
+                    f.truncate(cut)
+                os.fsync(f.fileno())
+
+        if os.path.getsize(self.path) == 0:
+            self._write_header(columns)
+            return columns
+
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            line = f.readline()
+        # keep whatever line ending the file already uses
+        self.lineterminator = "\r\n" if line.endswith("\r\n") else "\n"
+        header = next(csv.reader([line.rstrip("\r\n")]), [])
+        if not set(CSV_COLUMNS).issubset(header):
+            print(f"[WRITER] Warning: unexpected header in {self.path}: {header}")
+            return columns
+        if any(c in OPTIONAL_COLUMNS and c not in header for c in columns):
+            # legacy header: without this the new columns would never be stored
+            return upgrade_header(self.path, [c for c in columns if c in OPTIONAL_COLUMNS])
+        return header
+
+    def _write_header(self, columns):
+        with open(self.path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f, lineterminator=self.lineterminator).writerow(columns)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---------------- PUBLIC API ----------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, row):
+        """Queue one row (dict). Returns False if the queue stayed full and the row was dropped."""
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                print(f"[WRITER] Queue full, dropped {dropped} rows so far")
+            return False
+
+    def flush(self, timeout=None):
+        """Block until every row queued before this call is on disk."""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        else:
+            self._drain()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            return {"written": self.written, "batches": self.batches,
+                    "dropped": self.dropped, "errors": self.errors,
+                    "queue_depth": self._queue.qsize()}
+
+    # ---------------- FLUSHER ----------------
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch(batch)
+                batch = []
+                continue
+
+            if item is _STOP:
+                self._write_batch(batch)
+                self._maybe_fsync(force=self.fsync != FSYNC_NEVER)
+                return
+            if isinstance(item, threading.Event):
+                self._write_batch(batch)
+                batch = []
+                item.set()
+                continue
+
+            batch.append(item)
+            if len(batch) == 1:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+
+    def _drain(self):
+        # used when the flusher thread is not running
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                batch.append(item)
+        self._write_batch(batch)
+
+    def _encode(self, rows):
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator=self.lineterminator)
+        cols = self.columns
+        for row in rows:
+            w.writerow([row.get(c, "") for c in cols])
+        return buf.getvalue().encode("utf-8")
+
+    def _write_batch(self, rows):
+        if not rows:
+            return
+        try:
+            data = self._encode(rows)
+            # O_APPEND + a single write per batch: readers only ever see
+            # whole batches or a truncated last line, never a rewritten file
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    n = os.write(fd, view)
+                    view = view[n:]
+                end = os.lseek(fd, 0, os.SEEK_CUR)
+                self._maybe_fsync(fd=fd, force=self.fsync == FSYNC_BATCH)
+            finally:
+                os.close(fd)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            print("[WRITER] Append failed:", e)
+            return
+        with self._stats_lock:
+            self.written += len(rows)
+            self.batches += 1
+        if self.on_write is not None:
+            try:
+                self.on_write(rows, end - len(data), data)
+            except Exception as e:
+                print("[WRITER] on_write failed:", e)
+
+    def _maybe_fsync(self, fd=None, force=False):
+        now = time.monotonic()
+        due = self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval
+        if not (force or due):
+            return
+        try:
+            if fd is None:
+                with open(self.path, "rb") as f:
+                    os.fsync(f.fileno())
+            else:
+                os.fsync(fd)
+            self._last_fsync = now
+        except OSError as e:
+            print("[WRITER] fsync failed:", e)
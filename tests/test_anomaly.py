@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from anomaly import AnomalyDetector
+from device_state import DeviceStateStore, SlotAllocator
+from feature_backfill import read_history, relabel
+from storage import CsvStore, migrate_csv, open_store
+from telemetry_writer import CSV_COLUMNS
+
+LEGACY_ROWS = [
+    "2025-01-01 00:00:00,dev-1,25.0,50.0,300.0,GOOD,80.0",
+    "2025-01-01 00:00:01,dev-1,25.1,50.0,310.0,GOOD,81.0",
+]
+
+
+def _allocator(**kwargs):
+    cleared = []
+    grown = []
+    alloc = SlotAllocator(lambda old, n: grown.append((old, n)), cleared.append, **kwargs)
+    return alloc, cleared, grown
+
+
+def test_allocator_evicts_least_recently_used():
+    alloc, cleared, _ = _allocator(capacity=2, max_devices=2)
+    a = alloc.slot("a", 1.0)
+    alloc.slot("b", 2.0)
+    alloc.slot("a", 3.0)            # b is now the least recently used
+    c = alloc.slot("c", 4.0)
+    assert "b" not in alloc and "a" in alloc
+    assert cleared == [c] and alloc.get("a") == a
+    assert alloc.evicted == 1
+
+
+def test_allocator_ttl_and_growth():
+    alloc, cleared, grown = _allocator(capacity=1, ttl=10.0, sweep_every=1)
+    alloc.slot("a", 0.0)
+    alloc.slot("b", 5.0)
+    assert grown == [(0, 1), (1, 2)]
+    alloc.slot("b", 20.0)           # sweep: a idle for 20 s
+    assert alloc.devices() == ["b"] and len(cleared) == 1
+
+
+def test_detector_and_feature_state_share_bounds():
+    det = AnomalyDetector(max_devices=3)
+    state = DeviceStateStore(max_devices=3)
+    for i in range(10):
+        det.update(f"d{i}", "2025-01-01 00:00:00", 25.0, 50.0, 300.0, 80)
+        state.update(f"d{i}", 25.0, 50.0, 300.0)
+    assert len(det) == 3 and len(state) == 3
+    assert det.stats()["evicted"] == 7 and state.stats()["evicted"] == 7
+    assert det.baseline("d0") is None and det.baseline("d9")["gas"]["n"] == 1
+
+
+def _legacy_csv(path):
+    path.write_text(",".join(CSV_COLUMNS) + "\r\n" + "\r\n".join(LEGACY_ROWS) + "\r\n", newline="")
+    return str(path)
+
+
+def test_writer_upgrades_legacy_header(tmp_path):
+    path = _legacy_csv(tmp_path / "data.csv")
+    store = CsvStore(path)
+    store.open_writer()
+    store.append({"ts": "2025-01-01 00:00:02", "device": "dev-1", "temp": 25.0, "hum": 50.0,
+                  "gas": 900.0, "ai": "ALERT", "heartrate": 80.0, "anomaly": 2.5})
+    store.close()
+    with open(path, newline="") as f:
+        assert f.readline() == ",".join(CSV_COLUMNS) + ",anomaly\r\n"
+    df = CsvStore(path).read(columns=CSV_COLUMNS + ["anomaly"])
+    assert len(df) == 3
+    assert np.isnan(df["anomaly"][:2]).all() and df["anomaly"][2] == np.float32(2.5)
+
+
+def test_migrate_and_relabel_keep_anomaly(tmp_path):
+    path = _legacy_csv(tmp_path / "data.csv")
+    store = CsvStore(path)
+    store.open_writer()
+    store.append({"ts": "2025-01-01 00:00:02", "device": "dev-1", "temp": 25.0, "hum": 50.0,
+                  "gas": 300.0, "ai": "GOOD", "heartrate": 80.0, "anomaly": 3.0})
+    store.close()
+
+    root = str(tmp_path / "store")
+    assert migrate_csv(path, root) == 3
+    scores = open_store("parquet", root).read(columns=CSV_COLUMNS + ["anomaly"])["anomaly"]
+    assert np.isnan(scores[:2]).all() and scores[2] == np.float32(3.0)
+
+    from model import ModelService
+    df = read_history(path)
+    labels = relabel(df, ModelService("models/smarthealth_retrained.pkl"), anomaly_threshold=1.0)
+    # the stored score raises the last reading like the live runner did
+    assert labels[2] in ("ALERT", "DANGER")
+    assert "anomaly" in df.columns and pd.isna(df["anomaly"][0])
@@ -0,0 +1,69 @@
+import pytest
+
+from assistant_client import (DONE, ERROR, TIMEOUT, AssistantBusy, AssistantClient, FakeBackend)
+
+CONTEXT = {"temp": 27.3, "hum": 61.0, "gas": 420.0, "heartrate": 72.0, "ai": "GOOD"}
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(backend, **kwargs):
+        client = AssistantClient(backend, **kwargs)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_answer_then_cache_hit(make_client):
+    backend = FakeBackend(delay=0, reply="stay hydrated")
+    client = make_client(backend)
+    req = client.submit("s1", "Is the room OK?", sensor_context=CONTEXT)
+    assert req.wait(5)
+    assert (req.status, req.text, req.cached) == (DONE, "stay hydrated", False)
+
+    # same question modulo case/punctuation, context in the same buckets
+    again = client.submit("s2", "  is the room ok ", sensor_context=dict(CONTEXT, temp=27.9))
+    assert again.done and again.cached
+    assert again.text == "stay hydrated"
+    assert backend.calls == 1
+    stats = client.stats()
+    assert (stats["hits"], stats["misses"], stats["completed"]) == (1, 1, 1)
+
+
+def test_slow_backend_times_out(make_client):
+    client = make_client(FakeBackend(delay=0.05, reply="a b c d e f g h i j k l"), timeout=0.15)
+    req = client.submit("s1", "slow?")
+    req.wait(2)
+    assert req.status == TIMEOUT
+    assert len(req.text.split()) < 12
+    assert req.done
+
+
+def test_busy_session_is_rejected(make_client):
+    client = make_client(FakeBackend(delay=0.05, reply="one two three four"), per_session=1)
+    first = client.submit("s1", "first")
+    with pytest.raises(AssistantBusy):
+        client.submit("s1", "second")
+    # other sessions are not affected
+    other = client.submit("s2", "second")
+    assert first.wait(5) and other.wait(5)
+    assert client.stats()["rejected"] == 1
+    # the session is free again once its request finished
+    assert client.submit("s1", "third").wait(5)
+
+
+def test_failures_are_not_cached(make_client):
+    backend = FakeBackend(delay=0, fail=RuntimeError("quota"))
+    client = make_client(backend)
+    req = client.submit("s1", "hello")
+    req.wait(5)
+    assert (req.status, req.error) == (ERROR, "quota")
+    backend.fail = None
+    backend.reply = "hi"
+    retry = client.submit("s1", "hello")
+    assert retry.wait(5) and not retry.cached and retry.text == "hi"
@@ -0,0 +1,57 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from benchmarks.synth import generate, write_history
+from feature_backfill import accepted_mask, compute_features, main, read_history
+from model import ModelService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(ROOT, "models", "smarthealth_retrained.pkl")
+
+
+@pytest.fixture(scope="module")
+def data_csv(tmp_path_factory):
+    """A data.csv as the runner leaves it: duplicates, late packets, rows without a heart rate."""
+    path = str(tmp_path_factory.mktemp("backfill") / "data.csv")
+    rows = generate(4000, n_devices=7, seed=11, gas_spike=0.01)
+    rows += rows[100:140]            # redelivered packets
+    rows += [dict(r, temp=r["temp"] + 1) for r in rows[2000:2010]]   # late ones
+    rows += generate(200, n_devices=7, seed=12)[::3]   # replayed history
+    write_history(path, rows)
+    with open(path, "a", newline="") as f:
+        # older rows written before heart rate existed
+        f.write("2026-01-01 00:00:00,dev-000,25.5,55.0,300,GOOD,,\r\n")
+        f.write("2026-01-01 00:00:01,dev-000,25.7,54.0,310,GOOD,,\r\n")
+    return path
+
+
+def _stream(df, roll_size):
+    """The live path: accept_ts, then ModelService.compute_features row by row."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        svc = ModelService(MODEL, roll_size=roll_size)
+    out = []
+    for device, ts, temp, hum, gas, hr in zip(df["device"], df["ts"], df["temp"].tolist(),
+                                              df["hum"].tolist(), df["gas"].tolist(), df["heartrate"].tolist()):
+        if svc.state.accept_ts(device, ts):
+            out.append(svc.compute_features(device, temp, hum, gas, ts, None if hr != hr else hr)[0])
+    return np.vstack(out)
+
+
+@pytest.mark.parametrize("roll_size", [3, 5])
+def test_batch_features_equal_streaming(data_csv, roll_size):
+    df = read_history(data_csv)
+    accepted = df[accepted_mask(df)].reset_index(drop=True)
+    assert 0 < len(accepted) < len(df)
+    batch = compute_features(accepted, roll_size)
+    stream = _stream(df, roll_size)
+    assert batch.shape == stream.shape
+    assert np.array_equal(batch, stream)
+
+
+def test_parity_cli(data_csv, capsys):
+    main(["parity", data_csv, "--model", MODEL])
+    assert "rows identical" in capsys.readouterr().out
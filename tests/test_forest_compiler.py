@@ -0,0 +1,66 @@
+import glob
+import os
+import warnings
+
+import joblib
+import numpy as np
+import pytest
+
+from benchmarks.synth import generate, write_history
+from feature_backfill import compute_features, read_history
+from forest_compiler import CompiledForest, export_npz
+from model import ModelService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS = sorted(glob.glob(os.path.join(ROOT, "models", "*.pkl")))
+
+
+@pytest.fixture(scope="module")
+def history(tmp_path_factory):
+    """Feature rows from a data.csv written and read back the way the app does."""
+    path = str(tmp_path_factory.mktemp("forest") / "data.csv")
+    rows = generate(3000, n_devices=6, seed=5, hr_dropout=0.05, gas_spike=0.02)
+    # a few readings far outside the training range, to reach the other leaves
+    rows += [{"device": "dev-hot", "ts": f"2025-01-02 00:00:{i:02d}", "temp": 30.0 + 6 * i,
+              "hum": 90.0 - 8 * i, "gas": 400.0 + 900 * i, "heartrate": 60.0 + 15 * i} for i in range(10)]
+    write_history(path, rows)
+    return compute_features(read_history(path))
+
+
+def _load(model_path):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")   # pickles from an older sklearn
+        data = joblib.load(model_path)
+    return data if isinstance(data, dict) else {"model": data}
+
+
+@pytest.mark.skipif(not MODELS, reason="no models/*.pkl")
+@pytest.mark.parametrize("model_path", MODELS, ids=os.path.basename)
+def test_compiled_forest_matches_sklearn(model_path, history, tmp_path):
+    data = _load(model_path)
+    model, scaler = data["model"], data.get("scaler")
+    # older pickles take fewer inputs; feed them the leading columns
+    X = history[:, :model.n_features_in_]
+    forest = CompiledForest.load(export_npz(model_path, str(tmp_path / "forest.npz")))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        X_sk = scaler.transform(X) if scaler is not None else X
+        proba_sk = model.predict_proba(X_sk)
+        labels_sk = model.predict(X_sk)
+    X_c = forest.transform(X)
+    np.testing.assert_allclose(X_c, X_sk, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(forest.predict_proba(X_c), proba_sk, rtol=0, atol=1e-12)
+    assert np.array_equal(forest.predict(X_c), labels_sk)
+
+
+LIVE_MODELS = [p for p in MODELS if _load(p)["model"].n_features_in_ == 12]
+
+
+@pytest.mark.skipif(not LIVE_MODELS, reason="no 12-feature model in models/")
+@pytest.mark.parametrize("model_path", LIVE_MODELS, ids=os.path.basename)
+def test_compiled_engine_labels_match_sklearn(model_path, history):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sk = ModelService(model_path, engine="sklearn")
+        comp = ModelService(model_path, engine="compiled")
+        assert comp.predict_batch(history) == sk.predict_batch(history)
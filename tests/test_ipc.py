@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+
+import pytest
+
+from ipc import IngestClient, IngestServer
+
+
+class _Runner:
+    """Only the MQTTRunner calls these tests make."""
+
+    def __init__(self):
+        self.published = []
+
+    def get_version(self):
+        return 7
+
+    def get_stats(self, device=None, window=None):
+        raise KeyError(device)
+
+    def publish_schedule(self, payload):
+        if payload.get("bad"):
+            raise ValueError("bad schedule")
+        self.published.append(payload)
+
+
+@pytest.fixture
+def client():
+    # AF_UNIX paths are short; pytest's tmp_path can be too long
+    d = tempfile.mkdtemp(prefix="ipc-")
+    runner = _Runner()
+    server = IngestServer(runner, d + "/s.sock").start()
+    c = IngestClient(d + "/s.sock")
+    yield c, runner
+    c.stop()
+    server.close()
+    shutil.rmtree(d, ignore_errors=True)
+
+
+def test_error_reply_falls_back_like_a_dead_daemon(client):
+    c, runner = client
+    assert c.get_version() == 7
+    with pytest.raises(RuntimeError):
+        c.call("stats", device="dev-1")
+    assert c.get_stats(device="dev-1") == {}
+    # the connection survives an error reply
+    assert c.get_version() == 7
+
+
+def test_publish_ops_reach_the_runner(client):
+    c, runner = client
+    c.publish_schedule({"slot": 1})
+    c.publish_schedule({"bad": True})   # logged, not raised
+    assert runner.published == [{"slot": 1}]
+
+
+def test_unreachable_daemon_falls_back():
+    c = IngestClient("/tmp/no-such-ingest.sock", timeout=0.2)
+    assert c.get_version() == 0
+    assert c.get_last_status() == "N/A"
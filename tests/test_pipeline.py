@@ -0,0 +1,47 @@
+import threading
+
+from pipeline import _STOP, BoundedQueue, DROP_OLDEST, IngestPipeline
+
+
+def test_drop_oldest_never_evicts_stop():
+    q = BoundedQueue(2, DROP_OLDEST)
+    q.put("a")
+    q.put(_STOP, force=True)
+    # full, and the sentinel is not at the head yet
+    assert q.put("b") is False
+    assert q.refused == 1
+    assert q.get() == "a"
+    assert q.get() is _STOP
+
+
+def test_stop_at_head_of_full_queue_survives():
+    q = BoundedQueue(1, DROP_OLDEST)
+    q._items.append(_STOP)   # as if the consumer drained everything before it
+    assert q._drop_oldest() is False
+    assert list(q._items) == [_STOP]
+
+
+def test_close_under_load_does_not_hang():
+    done = []
+    pipe = IngestPipeline(lambda raw: {"device": "d", "v": raw}, done.append,
+                          workers=2, max_queue=4, overload=DROP_OLDEST).start()
+    stop = threading.Event()
+
+    def flood():
+        i = 0
+        while not stop.is_set():
+            pipe.submit(i)
+            i += 1
+
+    feeder = threading.Thread(target=flood)
+    feeder.start()
+    threads = list(pipe._threads)
+    try:
+        pipe.close(timeout=10)
+        assert not any(t.is_alive() for t in threads)
+    finally:
+        stop.set()
+        feeder.join()
+    stats = pipe.stats()
+    assert stats["processed"] == len(done)
+    assert stats["refused"] > 0
@@ -0,0 +1,43 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from rules import DEFAULT_RULES, LEVELS, RuleEngine, RuleSet
+
+BAD_TABLES = [
+    ["not a rule"],                                                            # AttributeError before
+    [{"name": "x", "any": [["gas", ">", 1]], "label": ["DANGER"]}],            # unhashable label
+    [{"name": ["x"], "any": [["gas", ">", 1]], "label": "DANGER"}],            # unhashable name
+    [{"name": "x", "any": [[["gas"], ">", 1]], "label": "DANGER"}],            # unhashable feature
+    [{"name": "x", "any": "gas > 1", "label": "DANGER"}],
+    {"not_rules": []},
+    "rules",
+]
+
+
+def _write(path, table, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.mark.parametrize("table", BAD_TABLES)
+def test_bad_table_is_a_value_error(table):
+    with pytest.raises(ValueError):
+        RuleSet(table["rules"] if isinstance(table, dict) and "rules" in table else table)
+
+
+@pytest.mark.parametrize("table", BAD_TABLES)
+def test_bad_reload_keeps_previous_rules(table, tmp_path):
+    path = str(tmp_path / "rules.json")
+    _write(path, DEFAULT_RULES, 1_000_000_000)
+    engine = RuleEngine(path, check_s=0)
+    _write(path, table, 2_000_000_000)
+    # temp, hum, gas, d_*, r_*, heartrate, trend_*: gas over the DANGER line
+    X = np.array([[25.0, 50.0, 1500.0, 0.0, 0.0, 0.0, 25.0, 50.0, 1500.0, 80.0, 0.0, 0.0]])
+    codes = engine.apply(np.array([LEVELS["GOOD"]]), X)
+    assert codes.tolist() == [LEVELS["DANGER"]]
+    assert engine.reload_errors == 1
+    assert engine.ruleset.names == [r["name"] for r in DEFAULT_RULES]
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from sharding import _LOST, ShardedInference
+
+MODEL = "models/smarthealth_retrained.pkl"
+
+
+def _rows(n, devices=8):
+    return [{"device": f"dev-{i % devices}", "ts": f"2025-01-01 {i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+             "temp": 25.0, "hum": 50.0, "gas": 300.0 + i % 50, "heartrate": 80} for i in range(n)]
+
+
+def _wait(cond, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return cond()
+
+
+def test_kill_shard_mid_stream():
+    out = []
+    lock = threading.Lock()
+
+    def on_result(record, label):
+        with lock:
+            out.append((record["device"], record["ts"]))
+
+    eng = ShardedInference(MODEL, on_result, shards=2, engine="sklearn", batch_rows=16, queue_size=8).start()
+    rows = _rows(6000)
+    try:
+        for r in rows[:3000]:
+            eng.submit(r)
+        eng._procs[0].kill()
+        for r in rows[3000:]:
+            eng.submit(r)
+        assert _wait(lambda: eng.stats()["in_flight"] == 0), eng.stats()
+    finally:
+        eng.close(timeout=30)
+    stats = eng.stats()
+    assert stats["restarts"] == 1
+    # every row is either emitted or counted lost, never both, never twice
+    assert stats["duplicates"] == 0
+    assert stats["completed"] == len(out)
+    assert stats["completed"] + stats["lost"] == len(rows)
+    assert len(set(out)) == len(out)
+    # only the batch the dead process had taken is lost, not its queued backlog
+    assert stats["lost"] <= 16
+    # emitted in submit order
+    order = {(r["device"], r["ts"]): i for i, r in enumerate(rows)}
+    idx = [order[k] for k in out]
+    assert idx == sorted(idx)
+
+
+def test_late_reply_for_lost_seq_is_ignored():
+    out = []
+    eng = ShardedInference(MODEL, lambda record, label: out.append((record["n"], label)), engine="sklearn")
+    eng._pending = {0: {"n": 0}, 1: {"n": 1}}
+    eng._resolve([(1, _LOST)])
+    # the restarted shard answers for seq 1 before seq 0 is done
+    eng._resolve([(1, "GOOD")])
+    eng._resolve([(0, "ALERT")])
+    assert out == [(0, "ALERT")]
+    assert eng.duplicates == 0
@@ -0,0 +1,51 @@
+from stats import StreamingStats, WINDOW_ALL, WINDOW_HOUR
+
+NOW = 1_700_000_000.0
+
+
+def _row(ts, temp=25.0):
+    return {"ts": ts, "temp": temp, "hum": 50.0, "gas": 300.0, "heartrate": 70.0}
+
+
+def test_device_scopes_bounded_by_max_devices():
+    stats = StreamingStats(max_devices=4)
+    for i in range(10):
+        stats.add(f"dev-{i}", _row(NOW), now=NOW + i)
+    assert stats.devices() == ["dev-6", "dev-7", "dev-8", "dev-9"]
+    assert stats.evicted == 6
+    assert stats.snapshot("dev-0")["temp"]["count"] == 0
+    assert stats.snapshot()["temp"]["count"] == 10
+
+
+def test_device_scopes_expire_after_ttl():
+    stats = StreamingStats(device_ttl=60)
+    stats.add("old", _row(NOW), now=NOW)
+    stats.add_many(["new"], [_row(NOW + 100)], now=NOW + 100)
+    assert stats.snapshot("old")["temp"]["count"] == 1
+    assert stats.evict_expired(now=NOW + 100) == 1
+    assert stats.devices() == ["new"]
+    # a returning device starts from a fresh scope, not a stale cached snapshot
+    stats.add("old", _row(NOW + 101, temp=30.0), now=NOW + 101)
+    assert stats.snapshot("old")["temp"]["mean"] == 30.0
+
+
+def test_future_ts_is_clamped_to_now():
+    stats = StreamingStats()
+    # device clock a day ahead: the row must count in the current hour and
+    # age out with it, not sit in a bucket the window never reaches
+    stats.add("d", _row(NOW + 86400), now=NOW)
+    stats.add_many(["d"], [_row(NOW + 86400)], now=NOW)
+    assert stats.future == 2
+    assert stats.snapshot("d", WINDOW_HOUR, now=NOW)["temp"]["count"] == 2
+    assert stats.snapshot("d", WINDOW_HOUR, now=NOW + 3600)["temp"]["count"] == 0
+
+
+def test_snapshot_returns_a_copy():
+    stats = StreamingStats()
+    stats.add("d", _row(NOW), now=NOW)
+    snap = stats.snapshot("d", WINDOW_ALL)
+    snap["temp"]["mean"] = -1.0
+    snap.pop("hum")
+    again = stats.snapshot("d", WINDOW_ALL)
+    assert again["temp"]["mean"] == 25.0
+    assert "hum" in again
@@ -0,0 +1,24 @@
+from storage import open_store
+
+
+def _row(i, device="dev-1"):
+    return {"ts": f"2025-01-01 00:{i // 60:02d}:{i % 60:02d}", "device": device, "temp": 25.0 + i,
+            "hum": 50.0, "gas": 300.0, "ai": "GOOD", "heartrate": 70.0}
+
+
+def test_reader_and_writer_share_one_index(tmp_path):
+    store = open_store("csv", str(tmp_path / "data.csv"), index=True, fsync="never")
+    # dashboard reads before the local runner opened the writer
+    assert store.read(device="dev-1").empty
+    reader_index = store.index
+    store.open_writer()
+    assert store.index is not reader_index and store.index.writable
+    for i in range(5):
+        store.append(_row(i))
+    store.append(_row(5, device="dev-2"))
+    store.flush(timeout=5)
+    index = store.index
+    df = store.read(device="dev-1")
+    assert df["temp"].tolist() == [25.0, 26.0, 27.0, 28.0, 29.0]
+    assert store.index is index
+    store.close()